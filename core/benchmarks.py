@@ -0,0 +1,360 @@
+"""
+In-process performance benchmarks.
+
+``seed_catalog`` fills the database with a repeatable synthetic store
+(categories, products, users, reviews, carts and orders) using
+``bulk_create``; the same ``scale`` and ``seed`` always produce the same
+data. Seeded rows are recognisable by their prefixes (``BENCH-`` SKUs,
+``bench-`` usernames, ``[bench]`` categories) so ``flush_benchmark_data``
+can remove them again.
+
+``BenchmarkRunner`` drives the main pages through the Django test client
+and reports latency percentiles, queries per request and the peak Python
+memory of one traced request per scenario, as a JSON-friendly dict. The
+checkout scenario places real orders, so run it against a seeded
+development database, never production.
+"""
+import datetime
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+from core.page_cache import CATEGORIES_TAG, invalidate_page_tags
+from orders.models import Cart, CartItem, Order, OrderItem
+from products.models import Category, Product, Review
+from products.search import index_products
+from products.summary import invalidate_category_summary
+
+SKU_PREFIX = 'BENCH-'
+USERNAME_PREFIX = 'bench-user-'
+ADMIN_USERNAME = 'bench-admin'
+CATEGORY_PREFIX = '[bench] '
+BATCH_SIZE = 1000
+
+SCALES = {
+    'tiny': {'categories': 3, 'products': 20, 'users': 5, 'reviews': 30, 'carts': 2, 'orders': 10},
+    'small': {'categories': 10, 'products': 500, 'users': 100, 'reviews': 2000, 'carts': 50, 'orders': 1000},
+    'medium': {'categories': 30, 'products': 5000, 'users': 1000, 'reviews': 20000, 'carts': 500, 'orders': 10000},
+    'large': {
+        'categories': 100, 'products': 50000, 'users': 10000, 'reviews': 200000, 'carts': 5000, 'orders': 100000,
+    },
+}
+ORDER_HISTORY_DAYS = 365
+ORDER_STATUS_WEIGHTS = {'pending': 10, 'processing': 10, 'shipped': 15, 'delivered': 55, 'cancelled': 10}
+
+PRODUCT_KINDS = ('هاتف', 'حاسوب محمول', 'شاشة', 'سماعة', 'كاميرا', 'طابعة', 'لوحة مفاتيح', 'فأرة', 'شاحن', 'ساعة ذكية')
+BRANDS = ('سامسونج', 'أبل', 'لينوفو', 'ديل', 'سوني', 'شاومي', 'هواوي', 'إتش بي')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in kB, or None without the Unix-only ``resource`` module."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def placed_order(response):
+    """Whether a checkout POST placed an order: failures redirect back to the cart."""
+    if response.status_code != 302:
+        return False
+    try:
+        match = resolve(response.url)
+    except Resolver404:
+        return False
+    return match.view_name == 'orders:order_detail' and Order.objects.filter(pk=match.kwargs['order_id']).exists()
+
+
+def client_host():
+    """A host name the test client may use outside the test runner (which allows 'testserver')."""
+    return next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+
+
+def flush_benchmark_data():
+    """Delete everything ``seed_catalog`` created."""
+    with transaction.atomic():
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        User.objects.filter(username=ADMIN_USERNAME).delete()
+        Product.objects.filter(sku__startswith=SKU_PREFIX).delete()
+        Category.objects.filter(name__startswith=CATEGORY_PREFIX).delete()
+    invalidate_category_summary()
+    invalidate_page_tags(CATEGORIES_TAG)
+
+
+def seed_catalog(scale='small', seed=0, stdout=None):
+    """Create a synthetic store of the given ``scale``; returns the row counts."""
+    sizes = SCALES[scale]
+    rng = random.Random(seed)
+    log = stdout.write if stdout is not None else (lambda message: None)
+
+    with transaction.atomic():
+        categories = Category.objects.bulk_create(
+            [Category(name=f'{CATEGORY_PREFIX}فئة {i + 1}', description='بيانات قياس الأداء')
+             for i in range(sizes['categories'])],
+            batch_size=BATCH_SIZE,
+        )
+        log(f'{len(categories)} categories')
+
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    sku=f'{SKU_PREFIX}{i:07d}',
+                    name=f'{rng.choice(PRODUCT_KINDS)} {rng.choice(BRANDS)} {i + 1}',
+                    description='منتج تجريبي لقياس الأداء.',
+                    price=Decimal(rng.randrange(1000, 500000)) / 100,
+                    stock=0 if rng.random() < 0.1 else rng.randrange(1, 200),
+                    category=rng.choice(categories),
+                )
+                for i in range(sizes['products'])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        log(f'{len(products)} products')
+
+        password = make_password('bench-pass-123')
+        User.objects.create(username=ADMIN_USERNAME, password=password, is_staff=True, is_superuser=True)
+        users = User.objects.bulk_create(
+            [User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password)
+             for i in range(sizes['users'])],
+            batch_size=BATCH_SIZE,
+        )
+        log(f'{len(users)} users')
+
+        Review.objects.bulk_create(
+            [
+                Review(product=rng.choice(products), user=rng.choice(users),
+                       rating=rng.choices(range(1, 6), weights=(5, 5, 15, 35, 40))[0], comment='تقييم تجريبي.')
+                for _ in range(sizes['reviews'])
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        # bulk_create bypasses Review.save(); rebuild the stored aggregates once.
+        Product.objects.filter(sku__startswith=SKU_PREFIX).recalculate_rating_stats()
+        log(f"{sizes['reviews']} reviews")
+
+        in_stock = [product for product in products if product.stock > 0]
+        carts, cart_items = [], []
+        for user in users[:sizes['carts']]:
+            cart = Cart(user=user)
+            for product in rng.sample(in_stock, min(len(in_stock), rng.randint(1, 5))):
+                quantity = rng.randint(1, 3)
+                cart_items.append(CartItem(cart=cart, product=product, quantity=quantity))
+                cart.item_count += quantity
+                cart.subtotal += product.price * quantity
+            carts.append(cart)
+        Cart.objects.bulk_create(carts, batch_size=BATCH_SIZE)
+        CartItem.objects.bulk_create(cart_items, batch_size=BATCH_SIZE)
+        log(f'{len(carts)} carts')
+
+        statuses, weights = zip(*ORDER_STATUS_WEIGHTS.items())
+        orders, order_items, days = [], [], defaultdict(list)
+        for i in range(sizes['orders']):
+            user = rng.choice(users)
+            order = Order(user=user, full_name=user.username, address='عنوان تجريبي', phone='0500000000',
+                          status=rng.choices(statuses, weights)[0], total_price=Decimal('0.00'))
+            for product in rng.sample(products, min(len(products), rng.randint(1, 5))):
+                quantity = rng.randint(1, 3)
+                order_items.append(OrderItem(order=order, product=product, quantity=quantity, price=product.price))
+                order.total_price += product.price * quantity
+            orders.append(order)
+        Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+        OrderItem.objects.bulk_create(order_items, batch_size=BATCH_SIZE)
+        # Spread the history over the past year (auto_now_add stamped "now").
+        for order in orders:
+            days[rng.randrange(ORDER_HISTORY_DAYS)].append(order.pk)
+        now = timezone.now()
+        for offset, order_ids in days.items():
+            for start in range(0, len(order_ids), BATCH_SIZE):
+                Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE]).update(
+                    created_at=now - datetime.timedelta(days=offset, minutes=rng.randrange(24 * 60)),
+                )
+        log(f'{len(orders)} orders')
+
+    seeded = Product.objects.filter(sku__startswith=SKU_PREFIX).select_related('category')
+    for start in range(0, len(products), BATCH_SIZE):
+        index_products(list(seeded.filter(pk__in=[p.pk for p in products[start:start + BATCH_SIZE]])))
+    invalidate_category_summary()
+    invalidate_page_tags(CATEGORIES_TAG)
+    return sizes
+
+
+class BenchmarkRunner:
+    """Time the main pages through the Django test client."""
+
+    def __init__(self, iterations=50, warmup=5, cold_cache=False, seed=0):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.cold_cache = cold_cache
+        self.rng = random.Random(seed)
+        host = client_host()
+        self.anonymous = Client(HTTP_HOST=host, raise_request_exception=False)
+        self.customer_client = Client(HTTP_HOST=host, raise_request_exception=False)
+        self.staff_client = Client(HTTP_HOST=host, raise_request_exception=False)
+
+    def scenarios(self):
+        """
+        ``{name: (request_callable, setup_callable or None, check or None)}``;
+        ``check(response)`` tells whether the request did what it should.
+        """
+        staff = User.objects.filter(username=ADMIN_USERNAME).first()
+        customer = User.objects.filter(username__startswith=USERNAME_PREFIX, orders__isnull=False).first()
+        if staff is None or customer is None:
+            raise LookupError('No benchmark data: run "manage.py seed_benchmark_data" first.')
+        self.customer = customer
+        self.customer_client.force_login(customer)
+        self.staff_client.force_login(staff)
+        product_ids = list(Product.objects.filter(sku__startswith=SKU_PREFIX).values_list('pk', flat=True))
+        self.restock_ids = list(
+            Product.objects.filter(sku__startswith=SKU_PREFIX, stock__gt=50).values_list('pk', flat=True)[:100]
+        )
+        anonymous, customer_client, staff_client = self.anonymous, self.customer_client, self.staff_client
+        checkout = {'full_name': 'عميل تجريبي', 'address': 'عنوان تجريبي', 'phone': '0500000000'}
+        scenarios = {
+            'home': (lambda: anonymous.get(reverse('core:home')), None, None),
+            'product_list': (lambda: anonymous.get(reverse('core:product_list')), None, None),
+            'product_detail': (
+                lambda: anonymous.get(reverse('core:product_detail', args=[self.rng.choice(product_ids)])),
+                None, None,
+            ),
+            'cart': (lambda: customer_client.get(reverse('orders:cart')), self.fill_cart, None),
+            'checkout': (
+                lambda: customer_client.post(reverse('orders:checkout'), checkout), self.fill_cart, placed_order,
+            ),
+            'order_list': (lambda: customer_client.get(reverse('orders:order_list')), None, None),
+        }
+        for model in ('orders_order', 'orders_cart', 'products_product', 'products_category'):
+            url = reverse(f'admin:{model}_changelist')
+            scenarios[f'admin_{model}'] = (lambda url=url: staff_client.get(url), None, None)
+        return scenarios
+
+    def fill_cart(self):
+        """Put a few in-stock products in the customer's cart (not timed)."""
+        cart, _ = Cart.objects.get_or_create(user=self.customer)
+        if cart.item_count:
+            return
+        for product in Product.objects.filter(pk__in=self.rng.sample(self.restock_ids, min(3, len(self.restock_ids)))):
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            cart.adjust_totals(1, product.price)
+
+    def measure(self, request, setup, check=None):
+        if setup is not None:
+            setup()
+        if self.cold_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - started
+        failed = check is not None and not check(response)
+        return elapsed, len(queries), response.status_code, failed
+
+    def run_scenario(self, request, setup, check=None):
+        for _ in range(self.warmup):
+            self.measure(request, setup, check)
+        # Hit/miss counters of the two-tier cache, when it is the default cache.
+        cache_stats = getattr(cache, 'stats', None)
+        if cache_stats is not None:
+            cache.reset_stats()
+        latencies, query_counts, statuses, failures = [], [], defaultdict(int), 0
+        for _ in range(self.iterations):
+            elapsed, queries, status, failed = self.measure(request, setup, check)
+            latencies.append(elapsed)
+            query_counts.append(queries)
+            statuses[status] += 1
+            failures += failed
+        cache_counters = cache_stats() if cache_stats is not None else None
+
+        # Memory is traced on a separate request: tracemalloc slows everything down.
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'queries_median': percentile(query_counts, 0.50),
+            'queries_max': max(query_counts),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+            # Responses that failed the scenario's check (e.g. a checkout sent back to the cart).
+            'failures': failures,
+            'cache': cache_counters,
+        }
+
+    def run(self, only=None):
+        scenarios = self.scenarios()
+        results = {}
+        for name, (request, setup, check) in scenarios.items():
+            if only and name not in only:
+                continue
+            results[name] = self.run_scenario(request, setup, check)
+        return {'meta': self.meta(), 'results': results}
+
+    def meta(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': self.iterations,
+            'warmup': self.warmup,
+            'cold_cache': self.cold_cache,
+            'rows': {
+                'products': Product.objects.count(),
+                'users': User.objects.count(),
+                'orders': Order.objects.count(),
+                'reviews': Review.objects.count(),
+            },
+            # Peak resident size of the whole run.
+            'max_rss_kb': peak_rss_kb(),
+        }
+
+
+def compare(baseline, current):
+    """``{scenario: {metric: (before, after)}}`` for scenarios present in both runs."""
+    metrics = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_median', 'peak_memory_kb')
+    return {
+        name: {metric: (baseline['results'][name].get(metric), result.get(metric)) for metric in metrics}
+        for name, result in current['results'].items()
+        if name in baseline.get('results', {})
+    }
@@ -0,0 +1,124 @@
+"""
+Per-view query and latency budgets.
+
+``BUDGETS`` maps URL names to the most queries a request may issue and a
+time budget. ``check_budgets`` requests every URL against the current
+(seeded) data as the visitor the budget names, with the cache cleared so
+cached pages cannot hide queries, and returns the measurements. The test
+suite runs it at two dataset sizes and fails on a budget overrun or on a
+query count that grows with the data, which is how an N+1 loop shows up.
+
+Time budgets are generous ceilings meant to catch pathological pages, not
+to benchmark; use ``run_benchmarks`` for real numbers.
+"""
+import time
+from dataclasses import dataclass
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from orders.models import Order
+from products.models import Category, Product
+from .benchmarks import ADMIN_USERNAME, SKU_PREFIX, USERNAME_PREFIX, client_host
+
+
+@dataclass(frozen=True)
+class Budget:
+    queries: int
+    ms: float = 500
+    # 'anonymous', 'customer' or 'staff'
+    user: str = 'anonymous'
+    # Names of URL arguments resolved from the data (see ``resolve_args``).
+    args: tuple = ()
+    query_string: str = ''
+
+
+BUDGETS = {
+    'core:home': Budget(queries=2),
+    'core:product_list': Budget(queries=3),
+    'core:product_detail': Budget(queries=6, args=('product',)),
+    'core:product_reviews': Budget(queries=2, args=('product',)),
+    'core:search_suggest': Budget(queries=2, query_string='q=هاتف'),
+    'orders:cart': Budget(queries=6, user='customer'),
+    'orders:cart_summary': Budget(queries=4, user='customer'),
+    'orders:checkout': Budget(queries=6, user='customer'),
+    'orders:order_list': Budget(queries=7, user='customer'),
+    'orders:order_detail': Budget(queries=7, user='customer', args=('order',)),
+    'users:profile': Budget(queries=5, user='customer'),
+    'admin:orders_order_changelist': Budget(queries=5, user='staff'),
+    'admin:orders_cart_changelist': Budget(queries=5, user='staff'),
+    'admin:products_product_changelist': Budget(queries=6, user='staff'),
+    'admin:products_category_changelist': Budget(queries=5, user='staff'),
+    'admin:orders_sales_dashboard': Budget(queries=7, user='staff'),
+}
+
+
+@dataclass
+class Measurement:
+    name: str
+    budget: Budget
+    queries: int
+    ms: float
+    status: int
+
+    @property
+    def over_budget(self):
+        return self.queries > self.budget.queries or self.ms > self.budget.ms
+
+
+def benchmark_users():
+    """``(customer, staff)`` from the seeded data; the customer has a cart and orders."""
+    customer = (
+        User.objects.filter(username__startswith=USERNAME_PREFIX, cart__item_count__gt=0, orders__isnull=False)
+        .order_by('pk').first()
+    )
+    staff = User.objects.filter(username=ADMIN_USERNAME).first()
+    if customer is None or staff is None:
+        raise LookupError('No benchmark data: run seed_catalog() first.')
+    return customer, staff
+
+
+def resolve_args(names, customer):
+    values = {
+        'product': lambda: Product.objects.filter(sku__startswith=SKU_PREFIX).order_by('pk').values_list('pk', flat=True)[0],
+        'category': lambda: Category.objects.order_by('pk').values_list('pk', flat=True)[0],
+        'order': lambda: Order.objects.filter(user=customer).order_by('-pk').values_list('pk', flat=True)[0],
+    }
+    return [values[name]() for name in names]
+
+
+def budget_requests(budgets=None):
+    """``(name, budget, client, url)`` for every budgeted URL, clients logged in as the budget's visitor."""
+    budgets = BUDGETS if budgets is None else budgets
+    customer, staff = benchmark_users()
+    host = client_host()
+    clients = {role: Client(HTTP_HOST=host) for role in ('anonymous', 'customer', 'staff')}
+    clients['customer'].force_login(customer)
+    clients['staff'].force_login(staff)
+    for name, budget in budgets.items():
+        url = reverse(name, args=resolve_args(budget.args, customer))
+        if budget.query_string:
+            url = f'{url}?{budget.query_string}'
+        yield name, budget, clients[budget.user], url
+
+
+def check_budgets(budgets=None, timing_runs=3):
+    """Measure every budgeted URL once (queries) and ``timing_runs`` times (best time)."""
+    measurements = []
+    for name, budget, client, url in budget_requests(budgets):
+        client.get(url)  # Warm per-process caches (content types, templates).
+        best, queries, status = None, None, None
+        for _ in range(timing_runs):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+            queries, status = len(captured), response.status_code
+        measurements.append(Measurement(name, budget, queries, round(best, 1), status))
+    return measurements
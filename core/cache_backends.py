@@ -0,0 +1,216 @@
+"""
+Two-tier cache: a bounded in-process LRU in front of a shared cache.
+
+``TwoTierCache`` keeps up to ``MAX_ENTRIES`` values per process and reads
+through to the cache aliased by ``LOCATION`` (file, database or Redis)
+on a miss. Every value is written to the shared tier with a version stamp,
+stored beside it under ``<key>:stamp``. A local copy is trusted for
+``STAMP_CHECK_INTERVAL`` seconds; after that its stamp is compared with the
+shared one (a small read, not the value) and the copy dropped when they
+differ. A ``set`` or ``delete`` in one worker is therefore seen by the
+others within that interval, and a value expiring in the shared tier takes
+its stamp with it. An interval of 0 checks on every read.
+
+Values are pickled once and kept pickled in both tiers, so callers never
+share mutable objects. ``stats()`` returns this process's counters:
+local hits, shared hits, misses, stamp checks, stale local copies and
+LRU evictions.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TwoTierCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'STAMP_CHECK_INTERVAL': 1},
+        },
+        'shared': {'BACKEND': '...FileBasedCache', 'LOCATION': '/var/tmp/cache'},
+    }
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+STAMP_SUFFIX = ':stamp'
+COUNTERS = ('local_hits', 'shared_hits', 'misses', 'stamp_checks', 'stale', 'evictions')
+
+
+class _Entry:
+    __slots__ = ('pickled', 'stamp', 'expires', 'checked')
+
+    def __init__(self, pickled, stamp, expires, checked):
+        self.pickled = pickled
+        self.stamp = stamp
+        self.expires = expires
+        self.checked = checked
+
+
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = location
+        self.stamp_check_interval = float(options.get('STAMP_CHECK_INTERVAL', 1))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(COUNTERS, 0)
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'local_entries': len(self._local)}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(COUNTERS, 0)
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    # Local tier.
+
+    def _remember(self, key, pickled, stamp, timeout=None):
+        """Store a local copy; ``timeout`` is unknown for values read from the shared tier."""
+        expires = self.get_backend_timeout(timeout) if timeout is not None else None
+        with self._lock:
+            self._local[key] = _Entry(pickled, stamp, expires, time.monotonic())
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_entries:
+                self._local.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _local_entry(self, key):
+        """``(entry, trusted)``: the local copy, if any, and whether it needs no stamp check."""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None, False
+            if entry.expires is not None and entry.expires <= time.time():
+                del self._local[key]
+                return None, False
+            self._local.move_to_end(key)
+        return entry, time.monotonic() - entry.checked < self.stamp_check_interval
+
+    def _validate(self, entries):
+        """Keep the copies in ``{key: entry}`` whose stamp still matches; returns them."""
+        if not entries:
+            return {}
+        self._count('stamp_checks', len(entries))
+        stamps = self.shared.get_many([key + STAMP_SUFFIX for key in entries])
+        valid, now = {}, time.monotonic()
+        for key, entry in entries.items():
+            if stamps.get(key + STAMP_SUFFIX) == entry.stamp:
+                entry.checked = now
+                valid[key] = entry
+        stale = entries.keys() - valid.keys()
+        if stale:
+            self._forget(*stale)
+            self._count('stale', len(stale))
+        return valid
+
+    # Cache API.
+
+    def _pack(self, value):
+        return uuid.uuid4().hex, pickle.dumps(value, self.pickle_protocol)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_and_validate_key(key, version): key for key in keys}
+        found, unchecked = {}, {}
+        for key in made:
+            entry, trusted = self._local_entry(key)
+            if entry is not None:
+                (found if trusted else unchecked)[key] = entry
+        self._count('local_hits', len(found))
+        valid = self._validate(unchecked)
+        self._count('local_hits', len(valid))
+        found.update(valid)
+
+        missing = [key for key in made if key not in found]
+        if missing:
+            shared = self.shared.get_many(missing)
+            for key, (stamp, pickled) in shared.items():
+                self._remember(key, pickled, stamp)
+                found[key] = _Entry(pickled, stamp, None, None)
+            self._count('shared_hits', len(shared))
+            self._count('misses', len(missing) - len(shared))
+        return {made[key]: pickle.loads(entry.pickled) for key, entry in found.items()}
+
+    def get(self, key, default=None, version=None):
+        result = self.get_many([key], version)
+        return result[key] if key in result else default
+
+    def has_key(self, key, version=None):
+        return key in self.get_many([key], version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if timeout == 0:
+            self.delete_many(data, version)
+            return []
+        if timeout is DEFAULT_TIMEOUT:
+            # This cache's TIMEOUT applies to both tiers.
+            timeout = self.default_timeout
+        made = {self.make_and_validate_key(key, version): key for key in data}
+        packed = {key: self._pack(data[original]) for key, original in made.items()}
+        shared = {}
+        for key, (stamp, pickled) in packed.items():
+            shared[key] = (stamp, pickled)
+            shared[key + STAMP_SUFFIX] = stamp
+        failed = self.shared.set_many(shared, timeout)
+        for key, (stamp, pickled) in packed.items():
+            self._remember(key, pickled, stamp, timeout)
+        return list({made[key.removesuffix(STAMP_SUFFIX)]: None for key in failed})
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        stamp, pickled = self._pack(value)
+        if not self.shared.add(key, (stamp, pickled), timeout):
+            return False
+        self.shared.set(key + STAMP_SUFFIX, stamp, timeout)
+        if timeout != 0:
+            self._remember(key, pickled, stamp, timeout)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version)
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        self._forget(key)
+        touched = self.shared.touch(key, timeout)
+        self.shared.touch(key + STAMP_SUFFIX, timeout)
+        return touched
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_and_validate_key(key, version) for key in keys]
+        self._forget(*made)
+        self.shared.delete_many([*made, *(key + STAMP_SUFFIX for key in made)])
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version)
+        self._forget(key)
+        deleted = self.shared.delete(key)
+        self.shared.delete(key + STAMP_SUFFIX)
+        return deleted
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
@@ -0,0 +1,90 @@
+"""
+Conditional GET (``ETag`` / ``Last-Modified``) for the catalog views.
+
+Unlike ``django.views.decorators.http.condition``, the validator of an
+async view is an async function, so it can use the async ORM; sync views
+take a sync validator. It runs before the view; when the client's copy is
+current the view is never called and a 304 is returned without rendering
+anything.
+
+Only requests that could be served from the page cache are handled: the
+navbar of a logged-in user is not covered by the validators. The catalog
+validators include the category summary version, so a change to the
+sidebar category counts changes every page's ``ETag``.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+
+from .page_cache import is_cacheable
+
+
+def make_etag(*parts):
+    """Strong ETag hashed from the string form of ``parts``."""
+    return quote_etag(hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest())
+
+
+def _is_checked(request):
+    return request.method in ('GET', 'HEAD') and is_cacheable(request)
+
+
+def _conditional_response(request, validators):
+    """``(response, etag, timestamp)``: a 304/412 when the client's copy is current, else no response."""
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp), etag, timestamp
+
+
+def _add_validators(response, etag, timestamp):
+    if response.status_code in (200, 304):
+        if etag and not response.has_header('ETag'):
+            response.headers['ETag'] = etag
+        if timestamp and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(timestamp)
+        # Logged-in visitors (with a session cookie) get a different page.
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def conditional_page(validator):
+    """
+    Decorate a view with conditional GET handling.
+
+    ``validator(request, *args, **kwargs)`` returns ``(etag, last_modified)``
+    (``last_modified`` an aware datetime or None), or None to skip. It must
+    be async for async views and sync for sync views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if not _is_checked(request):
+                    return await view(request, *args, **kwargs)
+                validators = await validator(request, *args, **kwargs)
+                if validators is None:
+                    return await view(request, *args, **kwargs)
+                response, etag, timestamp = _conditional_response(request, validators)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _add_validators(response, etag, timestamp)
+
+            markcoroutinefunction(wrapper)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if not _is_checked(request):
+                    return view(request, *args, **kwargs)
+                validators = validator(request, *args, **kwargs)
+                if validators is None:
+                    return view(request, *args, **kwargs)
+                response, etag, timestamp = _conditional_response(request, validators)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _add_validators(response, etag, timestamp)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,326 @@
+"""
+Index recommendations from the query plans of the views' own queries.
+
+``capture_queries`` requests every budgeted URL (see ``core.budgets``) against
+the seeded benchmark data, with caching disabled, and validates a
+registration form, recording each distinct SELECT; everything runs in a
+transaction that is rolled back. ``advise`` runs ``EXPLAIN`` on them
+(``EXPLAIN QUERY PLAN`` on SQLite) and flags full table scans and sorts
+through a temporary structure. For a flagged table it proposes one composite
+index: the columns the query compares with a parameter for equality, then
+its ORDER BY columns on that table (or one range column), unless an index in
+the database already starts with them.
+
+``write_migrations`` turns the proposals into one migration per app:
+``AddIndex`` for the project's own models, whose ``Meta.indexes`` must get
+the same entry, and ``RunSQL`` in ``external_app`` for models of other apps
+such as ``auth.User``.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, migrations, models, transaction
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.test.utils import override_settings
+
+from users.forms import UserRegistrationForm
+from .budgets import budget_requests
+from .middleware import query_shape
+
+FULL_SCAN = 'full scan'
+TEMP_SORT = 'temp sort'
+# Scanning or sorting tables smaller than this is not worth an index.
+MIN_TABLE_ROWS = 100
+MAX_INDEX_NAME_LENGTH = 30
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+_SQLITE_TEMP = re.compile(r'^USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST \w+ TERMS? OF )?(ORDER BY|GROUP BY|DISTINCT)')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)(?: (\w+))?')
+_POSTGRES_SORT_KEY = re.compile(r'Sort Key: (?:\()?(\w+)\.')
+_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?\b')
+
+
+class UnsupportedVendorError(CommandError):
+    """The database's query plans cannot be read by ``parse_plan``."""
+
+
+@dataclass
+class CapturedQuery:
+    sql: str
+    params: tuple
+    sources: set = field(default_factory=set)
+
+
+@dataclass
+class Finding:
+    kind: str
+    table: str
+    detail: str
+
+
+@dataclass
+class Recommendation:
+    model: type
+    fields: list
+    name: str
+    findings: list = field(default_factory=list)
+    sources: set = field(default_factory=set)
+    sql: str = ''
+
+    @property
+    def index(self):
+        return models.Index(fields=self.fields, name=self.name)
+
+    def __str__(self):
+        return f"{self.model.__name__}: models.Index(fields={self.fields!r}, name={self.name!r})"
+
+
+class QueryRecorder:
+    """``execute_wrapper`` keeping the first ``(sql, params)`` of every SELECT shape and who ran it."""
+
+    def __init__(self):
+        self.source = None
+        self.queries = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            shape = query_shape(sql)
+            query = self.queries.get(shape)
+            if query is None:
+                query = self.queries[shape] = CapturedQuery(sql, tuple(params or ()))
+            query.sources.add(self.source)
+        return execute(sql, params, many, context)
+
+
+def capture_queries():
+    """Distinct SELECTs of the budgeted views and of ``UserRegistrationForm``."""
+    recorder = QueryRecorder()
+    dummy_cache = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+    with override_settings(CACHES=dummy_cache), transaction.atomic():
+        requests = list(budget_requests())
+        with connection.execute_wrapper(recorder):
+            for name, budget, client, url in requests:
+                recorder.source = name
+                client.get(url)
+            recorder.source = 'users:register'
+            UserRegistrationForm(data={
+                'username': 'index-advisor', 'email': 'index-advisor@example.com',
+                'password1': 'Advisor-pass-123', 'password2': 'Advisor-pass-123',
+            }).is_valid()
+        transaction.set_rollback(True)
+    return list(recorder.queries.values())
+
+
+def explain(sql, params):
+    """The plan of ``sql`` as text lines."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def _clause(sql, keyword):
+    """The text of the last top-level ``keyword`` clause of ``sql``, or ''."""
+    start = sql.rfind(f' {keyword} ')
+    if start == -1:
+        return ''
+    clause = sql[start + len(keyword) + 2:]
+    return re.split(r' (?:LIMIT|OFFSET|HAVING|ORDER BY)\b|\)', clause)[0]
+
+
+def _first_table(clause, aliases):
+    match = re.search(r'(?:"(\w+)"|\b([A-Z]\d+))\."\w+"', clause)
+    if match is None:
+        return None
+    return match.group(1) or aliases.get(match.group(2))
+
+
+def parse_plan(vendor, lines, sql):
+    """Full scans and temporary sorts in an ``EXPLAIN`` of ``sql``, as ``Finding``s."""
+    if vendor not in ('sqlite', 'postgresql'):
+        raise UnsupportedVendorError(f'Query plans of {vendor} are not supported.')
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql)}
+    findings = []
+    for line in lines:
+        detail = line.strip().lstrip('->').strip()
+        if vendor == 'sqlite':
+            scan, temp = _SQLITE_SCAN.match(detail), _SQLITE_TEMP.match(detail)
+            if scan and 'INDEX' not in scan.group(2):
+                findings.append(Finding(FULL_SCAN, aliases.get(scan.group(1), scan.group(1)), detail))
+            elif temp:
+                keyword = 'ORDER BY' if temp.group(1) == 'ORDER BY' else 'GROUP BY'
+                table = _first_table(_clause(sql, keyword), aliases)
+                if table is not None:
+                    findings.append(Finding(TEMP_SORT, table, detail))
+        else:
+            scan, sort = _POSTGRES_SCAN.search(detail), _POSTGRES_SORT_KEY.search(detail)
+            if scan:
+                findings.append(Finding(FULL_SCAN, scan.group(1), detail))
+            elif sort:
+                findings.append(Finding(TEMP_SORT, aliases.get(sort.group(1), sort.group(1)), detail))
+    return findings
+
+
+def _columns(sql, table, aliases, pattern):
+    names = [re.escape(f'"{table}"')] + [alias for alias, name in aliases.items() if name == table]
+    reference = rf'(?:{"|".join(names)})\."(\w+)"'
+    return re.findall(reference + pattern, sql)
+
+
+def index_columns(sql, table):
+    """Columns of ``table`` for an index serving ``sql``: equality, then ordering or one range."""
+    aliases = {alias: name for name, alias in _ALIAS.findall(sql)}
+    equal = list(dict.fromkeys(_columns(sql, table, aliases, r' (?:= %s|IN \(%s)')))
+    ordering = []
+    for term in _clause(sql, 'ORDER BY').split(', '):
+        match = re.fullmatch(r'(?:"(\w+)"|([A-Z]\d+))\."(\w+)"(?: (ASC|DESC))?', term.strip())
+        if match is None or (match.group(1) or aliases.get(match.group(2))) != table:
+            break
+        if match.group(3) not in equal:
+            ordering.append(('-' if match.group(4) == 'DESC' else '') + match.group(3))
+    if not ordering:
+        ranges = [column for column in _columns(sql, table, aliases, r' [<>]=? %s') if column not in equal]
+        ordering = ranges[:1]
+    return equal + ordering
+
+
+def existing_indexes(table):
+    """Column lists of the indexes (unique constraints and primary key included) on ``table``."""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return [
+        constraint['columns'] for constraint in constraints.values()
+        if constraint['columns'] and (constraint['index'] or constraint['unique'] or constraint['primary_key'])
+    ]
+
+
+def index_name(model, fields):
+    name = '_'.join([model._meta.model_name, *(name.lstrip('-') for name in fields), 'idx'])
+    if len(name) <= MAX_INDEX_NAME_LENGTH:
+        return name
+    index = models.Index(fields=fields)
+    index.set_name_with_model(model)
+    return index.name
+
+
+def recommend(model, columns):
+    """Field names and index name for ``columns`` of ``model``, or ``None`` if one is unknown."""
+    by_column = {f.column: f.name for f in model._meta.concrete_fields}
+    fields = []
+    for column in columns:
+        name = by_column.get(column.lstrip('-'))
+        if name is None:
+            return None
+        fields.append(('-' if column.startswith('-') else '') + name)
+    return fields, index_name(model, fields)
+
+
+def advise(queries=None, min_rows=MIN_TABLE_ROWS):
+    """
+    ``(findings, recommendations)`` for ``queries`` (captured from the views
+    when ``None``). ``findings`` pairs every ``CapturedQuery`` with its
+    ``Finding``s and the note on what was recommended for each.
+    """
+    queries = capture_queries() if queries is None else queries
+    models_by_table = {model._meta.db_table: model for model in apps.get_models()}
+    sizes = {}
+    recommendations = {}
+    report = []
+    for query in queries:
+        findings = parse_plan(connection.vendor, explain(query.sql, query.params), query.sql)
+        notes = []
+        for finding in findings:
+            model = models_by_table.get(finding.table)
+            if model is None:
+                notes.append((finding, 'not a model table'))
+                continue
+            if finding.table not in sizes:
+                sizes[finding.table] = model._base_manager.count()
+            if sizes[finding.table] < min_rows:
+                notes.append((finding, f'{sizes[finding.table]} rows, too small to matter'))
+                continue
+            columns = index_columns(query.sql, finding.table)
+            covering = next(
+                (index for index in existing_indexes(finding.table)
+                 if columns and index[:len(columns)] == [c.lstrip('-') for c in columns]),
+                None,
+            )
+            proposal = recommend(model, columns) if columns and covering is None else None
+            if proposal is None:
+                notes.append((finding, f'covered by ({", ".join(covering)})' if covering else 'no index candidate'))
+                continue
+            fields, name = proposal
+            recommendation = recommendations.setdefault(
+                (model, tuple(fields)), Recommendation(model, fields, name, sql=query.sql),
+            )
+            recommendation.findings.append(finding)
+            recommendation.sources |= query.sources
+            notes.append((finding, str(recommendation)))
+        if notes:
+            report.append((query, notes))
+    return report, list(recommendations.values())
+
+
+def is_project_app(app_label):
+    return Path(apps.get_app_config(app_label).path).is_relative_to(Path(settings.BASE_DIR))
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _run_sql(recommendation):
+    model = recommendation.model
+    columns = ', '.join(
+        _quote(model._meta.get_field(name.lstrip('-')).column) + (' DESC' if name.startswith('-') else '')
+        for name in recommendation.fields
+    )
+    return migrations.RunSQL(
+        sql=f'CREATE INDEX {_quote(recommendation.name)} ON {_quote(model._meta.db_table)} ({columns})',
+        reverse_sql=f'DROP INDEX {_quote(recommendation.name)}',
+    )
+
+
+def build_migrations(recommendations, external_app='users'):
+    """One unsaved ``Migration`` per app holding ``recommendations``."""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    by_app = defaultdict(list)
+    for recommendation in recommendations:
+        app_label = recommendation.model._meta.app_label
+        by_app[app_label if is_project_app(app_label) else external_app].append(recommendation)
+
+    result = []
+    for app_label, app_recommendations in by_app.items():
+        leaves = loader.graph.leaf_nodes(app_label)
+        number = max((MigrationAutodetector.parse_number(name) or 0 for _, name in leaves), default=0) + 1
+        migration = migrations.Migration(f'{number:04d}_index_advisor', app_label)
+        migration.dependencies = list(leaves)
+        for recommendation in app_recommendations:
+            model_app = recommendation.model._meta.app_label
+            if model_app == app_label:
+                migration.operations.append(
+                    migrations.AddIndex(model_name=recommendation.model._meta.model_name, index=recommendation.index)
+                )
+            else:
+                dependency = loader.graph.leaf_nodes(model_app)[0]
+                if dependency not in migration.dependencies:
+                    migration.dependencies.append(dependency)
+                migration.operations.append(_run_sql(recommendation))
+        result.append(migration)
+    return result
+
+
+def write_migrations(recommendations, external_app='users'):
+    """Write ``build_migrations`` to the apps' migration packages; returns the paths."""
+    paths = []
+    for migration in build_migrations(recommendations, external_app):
+        writer = MigrationWriter(migration)
+        Path(writer.path).write_text(writer.as_string(), encoding='utf-8')
+        paths.append(writer.path)
+    return paths
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from core.benchmarks import percentile
+from products.models import Product
+
+WSGI_SERVER = ['electronic_store.wsgi:application']
+ASGI_SERVER = ['electronic_store.asgi:application', '-k', 'uvicorn_worker.UvicornWorker']
+# mode: (gunicorn arguments, environment). "wsgi" is the deployed default and
+# the baseline: sync views on sync workers. "wsgi-async" runs the async views
+# on sync workers (each request goes through async_to_sync), "asgi" runs them
+# on uvicorn workers.
+SERVER_MODES = {
+    'wsgi': (WSGI_SERVER, {'SERVER_MODE': 'wsgi', 'ASYNC_VIEWS': 'False'}),
+    'wsgi-async': (WSGI_SERVER, {'SERVER_MODE': 'wsgi', 'ASYNC_VIEWS': 'True'}),
+    'asgi': (ASGI_SERVER, {'SERVER_MODE': 'asgi', 'ASYNC_VIEWS': 'True'}),
+}
+
+
+# A session cookie makes every request bypass the anonymous page cache
+# (core.page_cache), so the views themselves are measured, not cache hits.
+# The session does not exist: SessionMiddleware looks it up and finds nothing.
+BYPASS_PAGE_CACHE_COOKIE = f'{settings.SESSION_COOKIE_NAME}=benchmark'
+
+
+async def fetch(host, port, path, cookie=None):
+    """Issue one ``GET`` and return the HTTP status code."""
+    reader, writer = await asyncio.open_connection(host, port)
+    headers = f'Host: {host}\r\nConnection: close\r\n'
+    if cookie:
+        headers += f'Cookie: {cookie}\r\n'
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\n{headers}\r\n'.encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, paths, total, concurrency, cookie=None):
+    """Send ``total`` requests over ``paths`` with at most ``concurrency`` in flight."""
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                status = await fetch(host, port, path, cookie)
+            except (OSError, ValueError, IndexError):
+                status = None
+            if status is None or status >= 400:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    """Compare the sync views (WSGI) with the async views under WSGI and ASGI."""
+
+    help = (
+        'Benchmark requests per second of the catalog: sync views on gunicorn sync workers (the baseline), '
+        'and async views on sync and on uvicorn workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', action='append', choices=sorted(SERVER_MODES),
+            help='Server mode to benchmark (repeatable, default: all).',
+        )
+        parser.add_argument(
+            '--path', action='append',
+            help='URL path to request (repeatable, default: product list and a product page).',
+        )
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode.')
+        parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight.')
+        parser.add_argument(
+            '--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 4)),
+            help='Gunicorn worker processes (default: $WEB_CONCURRENCY or 4).',
+        )
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help='Send anonymous requests that the page cache may answer (default: bypass it).',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['path'] or self.default_paths()
+        host, port = '127.0.0.1', options['port']
+        cookie = None if options['page_cache'] else BYPASS_PAGE_CACHE_COOKIE
+        self.stdout.write(
+            f"{options['requests']} requests, concurrency {options['concurrency']}, "
+            f"{options['workers']} worker(s), page cache {'on' if cookie is None else 'bypassed'}: "
+            f"{', '.join(paths)}"
+        )
+        self.stdout.write(f"{'mode':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for mode in options['mode'] or SERVER_MODES:
+            server = self.start_server(mode, host, port, options['workers'])
+            try:
+                # Warm up every worker before measuring.
+                asyncio.run(run_load(host, port, paths, options['workers'] * 10, options['workers'], cookie))
+                latencies, errors, elapsed = asyncio.run(
+                    run_load(host, port, paths, options['requests'], options['concurrency'], cookie)
+                )
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            self.stdout.write(
+                f'{mode:<12}{len(latencies) / elapsed:>10.1f}'
+                f'{percentile(latencies, 0.50) * 1000:>10.1f}'
+                f'{percentile(latencies, 0.95) * 1000:>10.1f}'
+                f'{percentile(latencies, 0.99) * 1000:>10.1f}'
+                f'{errors:>8}'
+            )
+
+    def default_paths(self):
+        paths = [reverse('core:product_list')]
+        product_id = Product.objects.order_by('-created_at').values_list('pk', flat=True).first()
+        if product_id is not None:
+            paths.append(reverse('core:product_detail', args=[product_id]))
+        return paths
+
+    def start_server(self, mode, host, port, workers):
+        arguments, env = SERVER_MODES[mode]
+        command = [
+            sys.executable, '-m', 'gunicorn', *arguments,
+            '--bind', f'{host}:{port}', '--workers', str(workers), '--log-level', 'warning',
+        ]
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, **env})
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{mode} server exited with code {server.returncode}.')
+            try:
+                socket.create_connection((host, port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'{mode} server did not start listening on {host}:{port}.')
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.index_advisor import MIN_TABLE_ROWS, advise, is_project_app, write_migrations
+
+
+class Command(BaseCommand):
+    """EXPLAIN the queries the views run and recommend composite indexes."""
+
+    help = (
+        'Request every budgeted page against the seeded benchmark data, EXPLAIN its queries, '
+        'report full scans and temporary sorts and optionally write migrations adding the indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--write', action='store_true', help='Write migrations for the recommended indexes.')
+        parser.add_argument(
+            '--min-rows', type=int, default=MIN_TABLE_ROWS,
+            help='Ignore scans and sorts of tables with fewer rows (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--external-app', default='users',
+            help='App whose migrations get the indexes on models of other apps (default: %(default)s).',
+        )
+
+    def handle(self, *args, **options):
+        # UnsupportedVendorError (a CommandError) reaches the user as it is.
+        try:
+            report, recommendations = advise(min_rows=options['min_rows'])
+        except LookupError as exc:
+            raise CommandError(f'{exc} Use the seed_benchmark_data command.')
+
+        for query, notes in report:
+            self.stdout.write(self.style.MIGRATE_HEADING(', '.join(sorted(query.sources))))
+            self.stdout.write(f'  {query.sql[:300]}')
+            for finding, note in notes:
+                self.stdout.write(f'  [{finding.kind}] {finding.table}: {finding.detail}')
+                self.stdout.write(f'      -> {note}')
+
+        if not recommendations:
+            self.stdout.write(self.style.SUCCESS('No indexes to recommend.'))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('Recommended indexes:'))
+        for recommendation in recommendations:
+            self.stdout.write(f'  {recommendation}  ({", ".join(sorted(recommendation.sources))})')
+        if not options['write']:
+            self.stdout.write('Run again with --write to create the migrations.')
+            return
+        for path in write_migrations(recommendations, options['external_app']):
+            self.stdout.write(self.style.SUCCESS(f'Wrote {path}'))
+        if any(is_project_app(r.model._meta.app_label) for r in recommendations):
+            self.stdout.write(self.style.WARNING(
+                "Add the project models' indexes to their Meta.indexes so makemigrations stays in sync."
+            ))
@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import BenchmarkRunner, compare
+
+
+class Command(BaseCommand):
+    """Time the main pages in-process and report the results as JSON."""
+
+    help = (
+        'Drive the catalog, cart, checkout, order and admin pages through the test client and report '
+        'p50/p95/p99 latency, queries per request and peak memory. Places orders: use seeded dev data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario.')
+        parser.add_argument('--scenario', action='append', help='Only run this scenario (repeatable).')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file (default: stdout).')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        runner = BenchmarkRunner(
+            iterations=options['iterations'], warmup=options['warmup'],
+            cold_cache=options['cold_cache'], seed=options['seed'],
+        )
+        try:
+            report = runner.run(only=options['scenario'])
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.print_table(report)
+        else:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+            self.print_comparison(compare(baseline, report))
+
+    def print_table(self, report):
+        self.stdout.write(
+            f"{'scenario':<28}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'peak kB':>10}"
+        )
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f"{name:<28}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                f"{result['queries_median']:>9}{result['peak_memory_kb']:>10}"
+            )
+
+    def print_comparison(self, changes):
+        # Diagnostics go to stderr so stdout stays valid JSON.
+        self.stderr.write(f"{'scenario':<28}{'metric':<16}{'before':>10}{'after':>10}{'change':>9}")
+        for name, metrics in changes.items():
+            for metric, (before, after) in metrics.items():
+                change = f'{(after - before) / before * 100:+.0f}%' if before else ''
+                self.stderr.write(f'{name:<28}{metric:<16}{before!s:>10}{after!s:>10}{change:>9}')
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import SCALES, SKU_PREFIX, flush_benchmark_data, seed_catalog
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Generate a repeatable synthetic catalog for benchmarks."""
+
+    help = 'Bulk create categories, products, users, reviews, carts and orders for run_benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed, same data).')
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Delete previously seeded benchmark data first.',
+        )
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            flush_benchmark_data()
+        elif Product.objects.filter(sku__startswith=SKU_PREFIX).exists():
+            raise CommandError('Benchmark data already exists; use --flush to replace it.')
+        started = time.monotonic()
+        sizes = seed_catalog(options['scale'], options['seed'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded the {options['scale']} benchmark catalog in {time.monotonic() - started:.1f}s "
+            f"({sizes['products']} products, {sizes['orders']} orders)."
+        ))
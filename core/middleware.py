@@ -0,0 +1,185 @@
+"""
+Sampled per-request SQL profiling.
+
+``SQLProfilerMiddleware`` profiles a random ``SQL_PROFILER_SAMPLE_RATE``
+fraction of requests (0 disables it; unsampled requests cost one
+``random()`` call). For a sampled request it installs an
+``execute_wrapper`` on every database connection and records the number
+of queries, the time spent in the database and how often each query shape
+(the SQL with ``IN (...)`` lists collapsed) ran. A shape that repeats
+``SQL_PROFILER_REPEAT_THRESHOLD`` times is a likely N+1 loop; the stack
+is inspected once, at that point, for the template line and project frame
+that issued it.
+
+The summary goes to the ``Server-Timing`` header and, as JSON, to the
+``core.sql_profiler`` logger (WARNING when a loop was found). Queries run
+while a streaming response is consumed happen after the middleware
+returns and are not counted.
+"""
+import json
+import logging
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger('core.sql_profiler')
+
+DEFAULT_REPEAT_THRESHOLD = 5
+MAX_REPORTED_SHAPES = 5
+_IN_LIST = re.compile(r'\((?:%s|\?)(?:\s*,\s*(?:%s|\?))+\)')
+_RENDER_ANNOTATED = Node.render_annotated.__code__
+
+
+def query_shape(sql):
+    """``sql`` with parameter lists collapsed, so ``IN`` lookups of any length match."""
+    return _IN_LIST.sub('(...)', sql)
+
+
+def _callsite():
+    """``(template, code)`` locations of the query being executed, either may be None."""
+    project = str(Path(settings.BASE_DIR).resolve())
+    template = code = None
+    frame = sys._getframe(2)
+    while frame is not None and (template is None or code is None):
+        if template is None and frame.f_code is _RENDER_ANNOTATED:
+            node = frame.f_locals.get('self')
+            origin, token = getattr(node, 'origin', None), getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                template = f'{origin.template_name}:{token.lineno}'
+        if code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(project) and filename != __file__ and 'site-packages' not in filename:
+                code = f'{Path(filename).relative_to(project)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return template, code
+
+
+class QueryProfile:
+    """Query statistics of one request."""
+
+    def __init__(self, threshold=DEFAULT_REPEAT_THRESHOLD):
+        self.threshold = threshold
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}
+        self._keys = {}
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            key = self._keys.get(sql)
+            if key is None:
+                # Normalise each distinct statement once.
+                key = self._keys[sql] = query_shape(sql)
+            shape = self.shapes.get(key)
+            if shape is None:
+                shape = self.shapes[key] = {'sql': key, 'count': 0, 'time': 0.0}
+            shape['count'] += 1
+            shape['time'] += elapsed
+            if shape['count'] == self.threshold:
+                shape['template'], shape['code'] = _callsite()
+
+    def start(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+
+    def stop(self):
+        self._stack.close()
+
+    def repeated(self):
+        """Shapes run at least ``threshold`` times, most frequent first."""
+        return sorted(
+            (shape for shape in self.shapes.values() if shape['count'] >= self.threshold),
+            key=lambda shape: shape['count'], reverse=True,
+        )
+
+    def summary(self, request, response):
+        repeated = self.repeated()
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'n_plus_one': [
+                {
+                    'sql': shape['sql'][:300],
+                    'count': shape['count'],
+                    'db_ms': round(shape['time'] * 1000, 2),
+                    'template': shape.get('template'),
+                    'code': shape.get('code'),
+                }
+                for shape in repeated[:MAX_REPORTED_SHAPES]
+            ],
+        }
+
+
+class SQLProfilerMiddleware:
+    """Profile the SQL of a sampled fraction of requests (see module docstring)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SQL_PROFILER_SAMPLE_RATE', 0.0)
+        self.threshold = getattr(settings, 'SQL_PROFILER_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        profile = QueryProfile(self.threshold)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        profile = QueryProfile(self.threshold)
+        # The ORM runs on the request's thread-sensitive executor thread, whose
+        # connections are the ones to wrap.
+        await sync_to_async(profile.start)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(profile.stop)()
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        summary = profile.summary(request, response)
+        timing = f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"'
+        if summary['n_plus_one']:
+            timing += f', nplusone;desc="{len(summary["n_plus_one"])} repeated queries"'
+        response['Server-Timing'] = (
+            f'{response["Server-Timing"]}, {timing}' if response.has_header('Server-Timing') else timing
+        )
+        level = logging.WARNING if summary['n_plus_one'] else logging.INFO
+        logger.log(level, json.dumps(summary, ensure_ascii=False), extra={'sql_profile': summary})
+        return response
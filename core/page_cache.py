@@ -0,0 +1,194 @@
+"""
+Full-page cache for anonymous catalog requests.
+
+Entries are keyed by language, path and query string. While rendering, a
+view tags its page (``add_page_tags``) with the products it shows and with
+``categories`` for the category summary that every page carries in its
+sidebar. Each tag has a version token in the cache; an entry remembers
+the tokens it was stored under and is ignored once any of them changed,
+so invalidating a tag is a single cache delete however many pages carry it.
+An invalidation also replaces a generation token, read before the view
+runs and again with the tag tokens after it rendered: a page rendered
+while a tag was invalidated may show the old data and is not stored.
+Entries keep the page's ``ETag``/``Last-Modified`` headers, so conditional
+requests for a cached page get their 304 from the cache too.
+
+Requests carrying a session cookie (logged-in users, or anyone with
+session state) or pending flash messages always bypass the cache, so
+personalised navbars are never shared. Pages about to be stored are
+rendered from the primary database (``core.routers.reading_from_primary``).
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .routers import reading_from_primary
+
+PAGE_CACHE_KEY = 'core:page:{language}:{digest}'
+PAGE_TAG_KEY = 'core:page-tag:{tag}'
+PAGE_GENERATION_KEY = 'core:page-generation'
+PAGE_CACHE_TIMEOUT = 60 * 10
+CATEGORIES_TAG = 'categories'
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def add_page_tags(request, *tags):
+    """Record cache tags for the page being rendered for ``request``."""
+    request.page_cache_tags = getattr(request, 'page_cache_tags', set()) | set(tags)
+
+
+def invalidate_page_tags(*tags):
+    """Drop every cached page carrying one of ``tags``."""
+    # New generation first, so a page rendering meanwhile is never stored
+    # under a tag token created after this delete.
+    cache.set(PAGE_GENERATION_KEY, uuid.uuid4().hex, None)
+    cache.delete_many([PAGE_TAG_KEY.format(tag=tag) for tag in tags])
+
+
+def invalidate_product_pages(product_ids):
+    invalidate_page_tags(*(product_tag(pk) for pk in product_ids))
+
+
+def is_cacheable(request):
+    return (
+        request.method == 'GET'
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def page_cache_key(request):
+    language = getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE)
+    digest = hashlib.sha256(request.get_full_path().encode()).hexdigest()
+    return PAGE_CACHE_KEY.format(language=language, digest=digest)
+
+
+def _tag_keys(tags):
+    return [PAGE_TAG_KEY.format(tag=tag) for tag in tags]
+
+
+def _is_fresh(entry, current):
+    return all(current.get(key) == token for key, token in entry['tags'].items())
+
+
+def _new_tokens(tag_keys, current):
+    """Tokens for tags that have none yet (never used, or just invalidated)."""
+    return {key: uuid.uuid4().hex for key in tag_keys if key not in current}
+
+
+def get_tag_tokens(tags, generation):
+    """
+    Current version token of each tag (by cache key), creating missing ones,
+    or None when a tag was invalidated since ``generation`` was read.
+    """
+    tag_keys = _tag_keys(tags)
+    current = cache.get_many([*tag_keys, PAGE_GENERATION_KEY])
+    if current.pop(PAGE_GENERATION_KEY, None) != generation:
+        return None
+    new = _new_tokens(tag_keys, current)
+    cache.set_many(new, None)
+    return {**current, **new}
+
+
+async def aget_tag_tokens(tags, generation):
+    """Async ``get_tag_tokens``."""
+    tag_keys = _tag_keys(tags)
+    current = await cache.aget_many([*tag_keys, PAGE_GENERATION_KEY])
+    if current.pop(PAGE_GENERATION_KEY, None) != generation:
+        return None
+    new = _new_tokens(tag_keys, current)
+    await cache.aset_many(new, None)
+    return {**current, **new}
+
+
+def _should_store(request, response):
+    # A page that issued a CSRF token embeds a secret tied to this visitor.
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and getattr(request, 'page_cache_tags', None)
+    )
+
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+
+
+def _entry(response, tokens):
+    return {
+        'tags': tokens,
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'headers': {name: response[name] for name in VALIDATOR_HEADERS if response.has_header(name)},
+    }
+
+
+def _response(request, entry):
+    """Rebuild a cached page, answering conditional requests from its stored validators."""
+    response = HttpResponse(entry['content'], content_type=entry['content_type'], headers=entry['headers'])
+    last_modified = entry['headers'].get('Last-Modified')
+    return get_conditional_response(
+        request,
+        etag=entry['headers'].get('ETag'),
+        last_modified=last_modified and parse_http_date_safe(last_modified),
+        response=response,
+    )
+
+
+def cache_anonymous_page(view):
+    """Serve ``view`` from the page cache for anonymous GET requests (sync or async views)."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return await view(request, *args, **kwargs)
+            key = page_cache_key(request)
+            found = await cache.aget_many([key, PAGE_GENERATION_KEY])
+            entry = found.get(key)
+            if entry is not None and _is_fresh(entry, await cache.aget_many(entry['tags'])):
+                return _response(request, entry)
+
+            with reading_from_primary():
+                response = await view(request, *args, **kwargs)
+                if hasattr(response, 'render') and not response.is_rendered:
+                    await sync_to_async(response.render)()
+            if _should_store(request, response):
+                tokens = await aget_tag_tokens(request.page_cache_tags, found.get(PAGE_GENERATION_KEY))
+                if tokens is not None:
+                    await cache.aset(key, _entry(response, tokens), PAGE_CACHE_TIMEOUT)
+            return response
+
+        markcoroutinefunction(wrapper)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+            key = page_cache_key(request)
+            found = cache.get_many([key, PAGE_GENERATION_KEY])
+            entry = found.get(key)
+            if entry is not None and _is_fresh(entry, cache.get_many(entry['tags'])):
+                return _response(request, entry)
+
+            with reading_from_primary():
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+            if _should_store(request, response):
+                tokens = get_tag_tokens(request.page_cache_tags, found.get(PAGE_GENERATION_KEY))
+                if tokens is not None:
+                    cache.set(key, _entry(response, tokens), PAGE_CACHE_TIMEOUT)
+            return response
+
+    return wrapper
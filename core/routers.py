@@ -0,0 +1,202 @@
+"""
+Read-replica routing.
+
+With ``DATABASE_REPLICAS`` configured, ``ReplicaRouter`` sends reads of the
+catalog (``REPLICA_APPS``) to a replica, and every read of a view wrapped
+in ``replica_reads`` except those of ``PRIMARY_APPS``. Everything else
+reads from ``default``, as do:
+
+* reads outside a request (management commands, on_commit jobs running on
+  background threads), which may follow a write the replica has not seen;
+* writes, and any read in the same request after one (read-your-writes);
+* reads inside a transaction on ``default``;
+* requests with unsafe methods and views wrapped in ``primary_reads``;
+* code inside ``reading_from_primary()``, such as the page cache and the
+  category summary filling the cache after an invalidation: a page built
+  from a lagging replica would stay stale for the whole cache timeout,
+  not just for the replication lag;
+* for ``REPLICA_PIN_SECONDS`` after a write, the same browser's requests
+  (``ReplicaRoutingMiddleware`` sets a short-lived cookie), so the page a
+  form redirects to does not miss the change on a lagging replica. Writes
+  to ``PRIMARY_APPS`` (sessions, users, the database cache), which are
+  always read from ``default``, pin neither the request nor the browser.
+
+The state lives in a context variable set per request by the middleware
+(or by the decorators), so it follows the request into ``sync_to_async``
+threads. Without replicas the router returns ``None`` and Django uses
+``default``.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_APPS = {'products'}
+# Sessions and users are read by the middleware of every request; a lagging
+# replica would log out a visitor who just signed in. The database cache
+# backend ('django_cache') must see its own writes too.
+PRIMARY_APPS = {'sessions', 'auth', 'django_cache'}
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS', 'TRACE'}
+
+
+class RoutingState:
+    """Routing decisions of one request (or of a context outside requests)."""
+
+    __slots__ = ('pinned', 'replica_reads', 'wrote', 'replica')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.replica_reads = False
+        self.wrote = False
+        self.replica = None
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def _view_state():
+    """The request's state, or a state for the duration of the view outside the middleware."""
+    state = _state.get()
+    if state is not None:
+        yield state
+        return
+    token = _state.set(RoutingState())
+    try:
+        yield _state.get()
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def reading_from_primary():
+    """Read from the primary inside the block (sync or async code)."""
+    with _view_state() as state:
+        pinned = state.pinned
+        state.pinned = True
+        try:
+            yield
+        finally:
+            # A write inside the block keeps the rest of the request pinned.
+            state.pinned = pinned or state.wrote
+
+
+class ReplicaRouter:
+    """Route catalog and read-only view reads to replicas (see module docstring)."""
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases:
+            return None
+        state = _state.get()
+        if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Explicit: an instance hint could otherwise point at a replica.
+            return DEFAULT_DB_ALIAS
+        app_label = model._meta.app_label
+        if app_label in REPLICA_APPS or (state.replica_reads and app_label not in PRIMARY_APPS):
+            if state.replica is None:
+                # One replica per request, so its reads see one point in time.
+                state.replica = random.choice(aliases)
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not replicas():
+            return None
+        state = _state.get()
+        if state is not None and model._meta.app_label not in PRIMARY_APPS:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+
+def _routing_decorator(configure):
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                with _view_state() as state:
+                    configure(state)
+                    return await view(request, *args, **kwargs)
+
+            markcoroutinefunction(wrapper)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                with _view_state() as state:
+                    configure(state)
+                    return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _read_from_replicas(state):
+    state.replica_reads = True
+
+
+def _read_from_primary(state):
+    state.pinned = True
+
+
+replica_reads = _routing_decorator(_read_from_replicas)
+replica_reads.__doc__ = 'Send every read of the view (sync or async) to a replica until the request writes.'
+primary_reads = _routing_decorator(_read_from_primary)
+primary_reads.__doc__ = 'Read from the primary for the whole view (sync or async), e.g. before a write.'
+
+
+class ReplicaRoutingMiddleware:
+    """Per-request routing state, pinned for unsafe methods and after a recent write."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(state, response)
+
+    def start(self, request):
+        state = RoutingState(pinned=request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES)
+        return state, _state.set(state)
+
+    def finish(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
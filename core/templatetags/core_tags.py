@@ -1,9 +1,35 @@
 from django import template
-from products.models import Category
+from django.utils.html import format_html
+
+from products.images import variant_srcset, variant_url
+from products.summary import get_category_summary
 
 register = template.Library()
 
 @register.simple_tag
 def get_categories():
-    """Returns all categories for usage in templates."""
-    return Category.objects.all()
+    """Returns all categories, with product counts, for usage in templates."""
+    return get_category_summary()
+
+
+@register.simple_tag
+def product_image(product, sizes='100vw', css_class='', loading='lazy'):
+    """
+    Responsive ``<picture>`` for a product photo: WebP and JPEG ``srcset``
+    from the stored variants, falling back to the original upload.
+    """
+    webp = variant_srcset(product, 'webp')
+    if not webp:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            product.image.url, product.name, css_class, loading,
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        webp, sizes,
+        variant_url(product, 640), variant_srcset(product, 'jpg'), sizes,
+        product.name, css_class, loading,
+    )
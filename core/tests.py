@@ -1,3 +1,777 @@
-from django.test import TestCase
+import json
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connection, router
+from django.http import HttpResponse
+from django.template import Context, Origin, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from products.models import Category, Product, Review
+from orders.models import Order, OrderItem
+from .benchmarks import BenchmarkRunner, flush_benchmark_data, seed_catalog
+from .budgets import check_budgets
+from .conditional import conditional_page
+from .index_advisor import (
+    FULL_SCAN, TEMP_SORT, CapturedQuery, Recommendation, advise, build_migrations, capture_queries,
+    UnsupportedVendorError, index_columns, parse_plan,
+)
+from .middleware import QueryProfile, query_shape
+from .page_cache import (
+    add_page_tags, cache_anonymous_page, invalidate_product_pages, page_cache_key, product_tag,
+)
+from .routers import (
+    PIN_COOKIE, ReplicaRoutingMiddleware, _state, primary_reads, reading_from_primary, replica_reads,
+)
+from .views import (
+    AsyncProductDetailView, AsyncProductListView, ProductDetailView, ProductListView, aproduct_detail_validators,
+    aproduct_list_validators, product_detail_validators,
+)
+
+
+class CatalogQueryTests(TestCase):
+    """The catalog pages must not issue one query per category."""
+
+    def create_categories(self, count):
+        for i in range(count):
+            category = Category.objects.create(name=f'فئة {i}')
+            Product.objects.create(
+                name=f'منتج {i}', description='وصف', price=Decimal('5.00'), stock=1, category=category
+            )
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        return len(ctx.captured_queries)
+
+    def test_home_and_product_list_do_not_scale_with_categories(self):
+        for url in (reverse('core:home'), reverse('core:product_list')):
+            self.create_categories(2)
+            small = self.count_queries(url)
+            self.create_categories(10)
+            self.assertEqual(self.count_queries(url), small, url)
+
+
+class AsyncCatalogViewTests(TestCase):
+    """The catalog views: sync under WSGI (the default), async under ASGI."""
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='ساعات')
+        cls.products = [
+            Product.objects.create(
+                name=f'ساعة {i}', description='وصف', price=Decimal('5.00'), stock=1, category=category
+            )
+            for i in range(12)
+        ]
+
+    def test_wsgi_serves_sync_views(self):
+        self.assertFalse(ProductListView.view_is_async)
+        self.assertFalse(ProductDetailView.view_is_async)
+        self.assertTrue(AsyncProductListView.view_is_async)
+        self.assertTrue(AsyncProductDetailView.view_is_async)
+        for name, args in [('core:product_list', []), ('core:product_detail', [1]), ('orders:add_to_cart', [1])]:
+            with self.subTest(name):
+                self.assertFalse(iscoroutinefunction(resolve(reverse(name, args=args)).func))
+
+    async def test_async_views(self):
+        factory = RequestFactory()
+        product_list = conditional_page(aproduct_list_validators)(AsyncProductListView.as_view())
+        response = await product_list(factory.get('/'))
+        self.assertEqual(len(response.context_data['page_obj']), 9)
+        request = factory.get('/', {'cursor': response.context_data['page_obj'].next_cursor})
+        self.assertEqual(len((await product_list(request)).context_data['products']), 3)
+        request = factory.get('/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((await product_list(request)).status_code, 304)
+
+        product = self.products[0]
+        response = await AsyncProductDetailView.as_view()(factory.get('/'), pk=product.pk)
+        self.assertEqual(response.context_data['product'], product)
+        self.assertEqual(len(response.context_data['related_products']), 4)
+        self.assertEqual(
+            await aproduct_detail_validators(factory.get('/'), product.pk),
+            await sync_to_async(product_detail_validators)(factory.get('/'), product.pk),
+        )
+
+    async def test_product_list_pages(self):
+        response = await self.async_client.get(reverse('core:product_list'))
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 9)
+        response = await self.async_client.get(
+            reverse('core:product_list'), {'cursor': page.next_cursor}
+        )
+        self.assertEqual(len(response.context['products']), 3)
+
+    async def test_product_detail(self):
+        product = self.products[0]
+        response = await self.async_client.get(reverse('core:product_detail', args=[product.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product'], product)
+        self.assertEqual(len(response.context['related_products']), 4)
+        response = await self.async_client.get(reverse('core:product_detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class CursorPaginationTests(TestCase):
+    """Tests for keyset pagination of the product list."""
+
+    def setUp(self):
+        cache.clear()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.phones = Category.objects.create(name='هواتف')
+        cls.laptops = Category.objects.create(name='حواسيب')
+        for i in range(25):
+            Product.objects.create(
+                name=f'منتج {i}', description='وصف', price=Decimal('5.00'), stock=1,
+                category=cls.phones if i % 2 else cls.laptops,
+            )
+        # Identical timestamps must still paginate deterministically by id.
+        Product.objects.filter(pk__lte=Product.objects.order_by('pk')[5].pk).update(
+            created_at=Product.objects.order_by('pk').first().created_at
+        )
+
+    def walk(self, params=None):
+        params = dict(params or {})
+        seen, pages = [], []
+        response = self.client.get(reverse('core:product_list'), params)
+        while True:
+            page = response.context['page_obj']
+            pages.append(page)
+            seen.extend(product.pk for product in page)
+            if not page.has_next():
+                return seen, pages
+            response = self.client.get(
+                reverse('core:product_list'), {**params, 'cursor': page.next_cursor}
+            )
+
+    def test_walks_every_product_once_in_order(self):
+        seen, pages = self.walk()
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+        self.assertEqual([len(page) for page in pages], [9, 9, 7])
+
+    def test_previous_cursor_returns_previous_page(self):
+        _, pages = self.walk()
+        response = self.client.get(reverse('core:product_list'), {'cursor': pages[2].previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), list(pages[1]))
+        self.assertTrue(response.context['page_obj'].has_previous())
+
+    def test_combines_with_category_filter(self):
+        seen, _ = self.walk({'category': self.phones.pk})
+        expected = list(
+            Product.objects.filter(category=self.phones).order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_deep_page_query_count_matches_first_page(self):
+        _, pages = self.walk()
+        first = self.count_queries(reverse('core:product_list'))
+        deep = self.count_queries(f"{reverse('core:product_list')}?cursor={pages[1].next_cursor}")
+        self.assertEqual(first, deep)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('core:product_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_parameter_still_uses_offset_pagination(self):
+        response = self.client.get(reverse('core:product_list'), {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        return len(ctx.captured_queries)
+
+
+class ReviewFeedTests(TestCase):
+    """Tests for the paged review feed on the product page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='ساعات')
+        cls.product = Product.objects.create(
+            name='ساعة', description='وصف', price=Decimal('5.00'), stock=1, category=category
+        )
+        cls.users = [User.objects.create(username=f'reviewer{i}') for i in range(25)]
+
+    def add_reviews(self, count):
+        for user in self.users[:count]:
+            Review.objects.create(product=self.product, user=user, rating=4, comment='جيد')
+
+    def detail_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('core:product_detail', args=[self.product.pk]))
+        return response, len(ctx.captured_queries)
+
+    def test_first_page_is_bounded(self):
+        self.add_reviews(3)
+        _, few = self.detail_queries()
+        Review.objects.all().delete()
+        self.add_reviews(25)
+        response, many = self.detail_queries()
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['reviews_page']), 10)
+
+    def test_load_more_returns_remaining_reviews(self):
+        self.add_reviews(25)
+        response, _ = self.detail_queries()
+        cursor = response.context['reviews_page'].next_cursor
+        seen = 10
+        while cursor:
+            data = self.client.get(
+                reverse('core:product_reviews', args=[self.product.pk]), {'cursor': cursor}
+            ).json()
+            seen += data['html'].count('review-card')
+            cursor = data['next_cursor']
+        self.assertEqual(seen, 25)
+
+
+class PageCacheTests(TestCase):
+    """Tests for the anonymous full-page cache."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Separate categories, so neither shows up as the other's related product.
+        cls.category = Category.objects.create(name='شاشات')
+        cls.first, cls.second = [
+            Product.objects.create(
+                name=f'شاشة {i}', description='وصف', price=Decimal('5.00'), stock=1,
+                category=category,
+            )
+            for i, category in enumerate([cls.category, Category.objects.create(name='طابعات')])
+        ]
+        cls.user = User.objects.create_user('viewer', password='secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def queries(self, product):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('core:product_detail', args=[product.pk]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_repeat_anonymous_hits_skip_the_database(self):
+        for url in (reverse('core:home'), reverse('core:product_list'),
+                    reverse('core:product_detail', args=[self.first.pk])):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_product_edit_only_invalidates_its_pages(self):
+        self.queries(self.first)
+        self.queries(self.second)
+        self.second.price = Decimal('7.00')
+        self.second.save()
+        self.assertEqual(self.queries(self.first), 0)
+        self.assertGreater(self.queries(self.second), 0)
+
+    def test_review_and_new_product_invalidate(self):
+        self.queries(self.first)
+        Review.objects.create(product=self.first, user=self.user, rating=5, comment='ممتاز')
+        self.assertGreater(self.queries(self.first), 0)
+
+        self.queries(self.second)
+        Product.objects.create(name='جديد', description='وصف', price=Decimal('1.00'), category=self.category)
+        self.assertGreater(self.queries(self.second), 0)
+
+    def test_logged_in_users_bypass_the_cache(self):
+        url = reverse('core:product_detail', args=[self.first.pk])
+        self.client.get(url)
+        self.client.force_login(self.user)
+        response = self.client.get(url)
+        self.assertContains(response, 'viewer')
+        self.client.logout()
+        self.assertNotContains(self.client.get(url), 'viewer')
+
+    def test_tag_invalidated_while_rendering_is_not_stored(self):
+        edits = [True]
+
+        def view(request):
+            add_page_tags(request, product_tag(self.first.pk))
+            if edits.pop():
+                # A product edit commits after the view read the product.
+                invalidate_product_pages([self.first.pk])
+            return HttpResponse('صفحة')
+
+        async def async_view(request):
+            return view(request)
+
+        for cached in (cache_anonymous_page(view), cache_anonymous_page(async_view)):
+            with self.subTest(cached=cached):
+                edits[:] = [False, True]
+                request = RequestFactory().get(f'/pages/{id(cached)}/')
+                call = async_to_sync(cached) if iscoroutinefunction(cached) else cached
+                call(request)
+                self.assertIsNone(cache.get(page_cache_key(request)))
+                call(request)
+                self.assertIsNotNone(cache.get(page_cache_key(request)))
+
+    def test_key_covers_query_string_and_language(self):
+        factory = RequestFactory()
+        first, second = factory.get('/products/?category=1'), factory.get('/products/?category=2')
+        english = factory.get('/products/?category=1')
+        first.LANGUAGE_CODE = second.LANGUAGE_CODE = 'ar'
+        english.LANGUAGE_CODE = 'en'
+        self.assertEqual(len({page_cache_key(first), page_cache_key(second), page_cache_key(english)}), 3)
+
+
+class ConditionalGetTests(TestCase):
+    """Tests for ETag / Last-Modified handling on catalog pages."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='طابعات')
+        cls.product = Product.objects.create(
+            name='طابعة', description='وصف', price=Decimal('5.00'), stock=1, category=cls.category
+        )
+        cls.user = User.objects.create_user('printer-fan', password='secret-pass-123')
+
+    def setUp(self):
+        cache.clear()
+
+    def detail_url(self):
+        return reverse('core:product_detail', args=[self.product.pk])
+
+    def test_current_client_gets_304_without_rendering(self):
+        response = self.client.get(self.detail_url())
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        cache.delete(page_cache_key(RequestFactory().get(self.detail_url())))
+        with self.assertTemplateNotUsed('core/product_detail.html'):
+            response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(
+            self.detail_url(), HTTP_IF_MODIFIED_SINCE=self.client.get(self.detail_url())['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_page_answers_conditional_requests(self):
+        etag = self.client.get(self.detail_url())['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_review_changes_validators(self):
+        etag = self.client.get(self.detail_url())['ETag']
+        Review.objects.create(product=self.product, user=self.user, rating=3, comment='مقبول')
+        response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_category_listing(self):
+        url = reverse('core:product_list')
+        params = {'category': self.category.pk}
+        etag = self.client.get(url, params)['ETag']
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Product.objects.create(name='أخرى', description='وصف', price=Decimal('1.00'), category=self.category)
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_related_product_stock_change_revalidates(self):
+        related = Product.objects.create(
+            name='حبر', description='وصف', price=Decimal('2.00'), stock=1, category=self.category
+        )
+        response = self.client.get(self.detail_url())
+        self.assertContains(response, related.name)
+        # What an order for the related product does (services.place_order).
+        Product.objects.filter(pk=related.pk).update(stock=0, updated_at=timezone.now())
+        invalidate_product_pages([related.pk])
+        response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_sidebar_count_change_revalidates(self):
+        urls = [(self.detail_url(), {}), (reverse('core:product_list'), {'category': self.category.pk})]
+        etags = [self.client.get(url, params)['ETag'] for url, params in urls]
+        Product.objects.create(
+            name='ماسح', description='وصف', price=Decimal('5.00'), stock=1,
+            category=Category.objects.create(name='ماسحات'),
+        )
+        for (url, params), etag in zip(urls, etags):
+            with self.subTest(url):
+                self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_pages_have_no_validators(self):
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get(self.detail_url()).has_header('ETag'))
+
+
+class SQLProfilerTests(TestCase):
+    """Tests for the sampled SQL profiler middleware."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('profiled', password='secret-pass-123')
+        self.category = Category.objects.create(name='أجهزة')
+
+    def add_orders(self, count):
+        product = Product.objects.create(
+            name='جهاز', description='وصف', price=Decimal('5.00'), stock=100, category=self.category
+        )
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, full_name='x', address='y', phone='1')
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+    def test_query_shape_collapses_in_lists(self):
+        self.assertEqual(
+            query_shape('SELECT 1 FROM t WHERE id IN (%s, %s, %s) AND x = %s'),
+            query_shape('SELECT 1 FROM t WHERE id IN (%s, %s) AND x = %s'),
+        )
+
+    def test_flags_repeated_queries_with_template_line(self):
+        for i in range(4):
+            Category.objects.create(name=f'فئة {i}')
+        template = Template(
+            '{% for category in categories %}\n{{ category.products.count }}{% endfor %}',
+            origin=Origin('loop.html', template_name='loop.html'),
+        )
+        profile = QueryProfile(threshold=3)
+        profile.start()
+        try:
+            template.render(Context({'categories': list(Category.objects.all())}))
+        finally:
+            profile.stop()
+        repeated, = profile.repeated()
+        self.assertEqual(profile.count, 6)
+        self.assertEqual(repeated['count'], 5)
+        self.assertEqual(repeated['template'], 'loop.html:2')
+        self.assertTrue(repeated['code'].startswith('core/tests.py:'))
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1.0)
+    def test_sampled_request_gets_server_timing_and_log(self):
+        self.add_orders(6)
+        self.client.force_login(self.user)
+        with self.assertLogs('core.sql_profiler', 'INFO') as logs:
+            response = self.client.get(reverse('orders:order_list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries"$')
+        summary = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(summary['view'], 'orders:order_list')
+        self.assertEqual(summary['n_plus_one'], [])
+
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get(reverse('core:home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1.0)
+    async def test_async_views_are_profiled(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs('core.sql_profiler', 'INFO'):
+            response = await self.async_client.get(reverse('orders:cart_summary'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+class BenchmarkTests(TestCase):
+    """Smoke tests for the synthetic catalog and the in-process benchmark runner."""
+
+    def test_seed_is_repeatable_and_flushable(self):
+        seed_catalog('tiny', seed=7)
+        names = list(Product.objects.order_by('sku').values_list('name', 'price', 'category__name'))
+        self.assertEqual(len(names), 20)
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(
+            sum(p.review_count for p in Product.objects.all()), Review.objects.count()
+        )
+
+        flush_benchmark_data()
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(User.objects.exists())
+        seed_catalog('tiny', seed=7)
+        self.assertEqual(list(Product.objects.order_by('sku').values_list('name', 'price', 'category__name')), names)
+
+    def test_runner_reports_latency_queries_and_memory(self):
+        seed_catalog('tiny')
+        report = BenchmarkRunner(iterations=3, warmup=1).run(only=['product_detail', 'checkout', 'admin_orders_order'])
+        self.assertEqual(set(report['results']), {'product_detail', 'checkout', 'admin_orders_order'})
+        checkout = report['results']['checkout']
+        self.assertEqual(checkout['statuses'], {'302': 3})
+        self.assertEqual(checkout['failures'], 0)
+        self.assertGreater(checkout['queries_median'], 0)
+        self.assertGreater(checkout['peak_memory_kb'], 0)
+        self.assertLessEqual(checkout['p50_ms'], checkout['p99_ms'])
+        self.assertEqual(report['results']['admin_orders_order']['statuses'], {'200': 3})
+        self.assertEqual(report['meta']['rows']['products'], 20)
+
+    def test_checkout_sent_back_to_the_cart_is_a_failure(self):
+        seed_catalog('tiny')
+        runner = BenchmarkRunner(iterations=3, warmup=1)
+        request, _, check = runner.scenarios()['checkout']
+        # Without refilling, the cart is empty after the first checkout.
+        result = runner.run_scenario(request, None, check)
+        self.assertEqual(result['statuses'], {'302': 3})
+        self.assertEqual(result['failures'], 3)
+
+
+class QueryBudgetTests(TestCase):
+    """Every budgeted page stays within its query/time budget at two dataset sizes."""
+
+    def measure(self, scale):
+        flush_benchmark_data()
+        seed_catalog(scale)
+        return {m.name: m for m in check_budgets()}
+
+    def test_budgets_hold_and_queries_do_not_grow_with_data(self):
+        small, larger = self.measure('tiny'), self.measure('small')
+        for name, measurement in larger.items():
+            with self.subTest(url=name):
+                before = small[name]
+                self.assertEqual(measurement.status, 200)
+                self.assertFalse(before.over_budget, before)
+                self.assertFalse(measurement.over_budget, measurement)
+                self.assertEqual(
+                    measurement.queries, before.queries,
+                    f'{name}: {before.queries} queries with the small dataset, {measurement.queries} with the larger one',
+                )
+
+
+class IndexAdvisorTests(TestCase):
+    """index_advisor reads the views' query plans and proposes missing indexes."""
+
+    def captured(self, queryset):
+        return CapturedQuery(*queryset.query.sql_with_params())
+
+    def test_parse_plan_flags_scans_and_temp_sorts(self):
+        sql = 'SELECT 1 FROM "orders_order" WHERE "orders_order"."user_id" = %s ORDER BY "orders_order"."total_price" DESC'
+        findings = parse_plan('sqlite', [
+            'SEARCH orders_order USING INDEX orders_order_user_id_idx (user_id=?)',
+            'USE TEMP B-TREE FOR ORDER BY',
+            'SCAN auth_user',
+            'SCAN products_product USING INDEX product_created_id_idx',
+        ], sql)
+        self.assertEqual(
+            [(f.kind, f.table) for f in findings],
+            [(TEMP_SORT, 'orders_order'), (FULL_SCAN, 'auth_user')],
+        )
+        findings = parse_plan('postgresql', [
+            'Sort  (cost=1.1..1.2 rows=1 width=4)',
+            '  Sort Key: orders_order.total_price DESC',
+            '  ->  Seq Scan on orders_order  (cost=0.00..1.01 rows=1 width=4)',
+        ], sql)
+        self.assertEqual(
+            [(f.kind, f.table) for f in findings],
+            [(TEMP_SORT, 'orders_order'), (FULL_SCAN, 'orders_order')],
+        )
+        self.assertEqual(index_columns(sql, 'orders_order'), ['user_id', '-total_price'])
+        with self.assertRaises(UnsupportedVendorError):
+            parse_plan('oracle', ['TABLE ACCESS FULL ORDERS_ORDER'], sql)
+
+    def test_recommends_missing_indexes_only(self):
+        missing = self.captured(Order.objects.filter(user_id=1).order_by('-total_price'))
+        covered = self.captured(Order.objects.filter(user_id=1).order_by('-created_at'))
+        report, recommendations = advise([missing, covered], min_rows=0)
+        self.assertEqual([query for query, notes in report], [missing])
+        self.assertEqual(
+            [(r.model, r.fields) for r in recommendations], [(Order, ['user', '-total_price'])],
+        )
+
+    def test_captures_view_and_form_queries_without_side_effects(self):
+        seed_catalog('tiny')
+        users = User.objects.count()
+        sources = set().union(*(query.sources for query in capture_queries()))
+        self.assertTrue({'orders:order_list', 'admin:orders_order_changelist', 'users:register'} <= sources)
+        self.assertEqual(User.objects.count(), users)
+
+    def test_build_migrations(self):
+        migrations = {
+            migration.app_label: migration for migration in build_migrations([
+                Recommendation(Order, ['user', '-total_price'], 'order_user_total_price_idx'),
+                Recommendation(User, ['last_login'], 'user_last_login_idx'),
+            ])
+        }
+        self.assertEqual(set(migrations), {'orders', 'users'})
+        operation, = migrations['orders'].operations
+        self.assertEqual(operation.index.fields, ['user', '-total_price'])
+        operation, = migrations['users'].operations
+        self.assertEqual(operation.sql, 'CREATE INDEX "user_last_login_idx" ON "auth_user" ("last_login")')
+        self.assertIn('auth', [app for app, _ in migrations['users'].dependencies])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Routing decisions only: no query runs, so the 'replica' alias need not exist."""
+
+    def route(self, method='get', cookies=None, decorator=None, write=None):
+        decisions = {}
+
+        def view(request):
+            decisions['product'] = router.db_for_read(Product)
+            decisions['order'] = router.db_for_read(Order)
+            decisions['user'] = router.db_for_read(User)
+            if write:
+                router.db_for_write(write)
+                decisions['after_write'] = router.db_for_read(Product)
+            return HttpResponse()
+
+        if decorator is not None:
+            view = decorator(view)
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        outer = _state.get()
+        response = ReplicaRoutingMiddleware(view)(request)
+        self.assertIs(_state.get(), outer)
+        return decisions, response
+
+    def test_catalog_reads_go_to_replica(self):
+        decisions, response = self.route()
+        self.assertEqual(decisions, {'product': 'replica', 'order': 'default', 'user': 'default'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_replica_reads_view_reads_everything_but_users_from_replica(self):
+        decisions, _ = self.route(decorator=replica_reads)
+        self.assertEqual(decisions, {'product': 'replica', 'order': 'replica', 'user': 'default'})
+
+    def test_reads_after_a_write_use_primary_and_pin_the_next_requests(self):
+        decisions, response = self.route(write=Order)
+        self.assertEqual(decisions['after_write'], 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+        decisions, _ = self.route(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(decisions['product'], 'default')
+
+    def test_session_and_cache_writes_do_not_pin(self):
+        cache_entry = DatabaseCache('cache_table', {}).cache_model_class
+        for model in (Session, cache_entry, User):
+            with self.subTest(model=model.__name__):
+                decisions, response = self.route(write=model)
+                self.assertEqual(decisions['after_write'], 'replica')
+                self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertIsNone(_state.get())
+        self.assertEqual(router.db_for_read(Product), 'default')
+        # e.g. the image variant jobs that on_commit hands to a worker thread.
+        with ThreadPoolExecutor(1) as executor:
+            self.assertEqual(executor.submit(router.db_for_read, Product).result(), 'default')
+
+    def test_unsafe_methods_and_primary_reads_views_use_primary(self):
+        self.assertEqual(self.route(method='post')[0]['product'], 'default')
+        self.assertEqual(self.route(decorator=primary_reads)[0]['product'], 'default')
+
+    def test_async_views(self):
+        decisions = {}
+
+        @replica_reads
+        async def view(request):
+            decisions['order'] = router.db_for_read(Order)
+            return HttpResponse()
+
+        async_to_sync(ReplicaRoutingMiddleware(view))(RequestFactory().get('/'))
+        self.assertEqual(decisions, {'order': 'replica'})
+
+    def test_page_cache_fills_from_primary(self):
+        self.assertEqual(self.route(decorator=cache_anonymous_page)[0]['product'], 'default')
+        # Requests that bypass the page cache keep reading from the replica.
+        decisions, _ = self.route(cookies={settings.SESSION_COOKIE_NAME: 'x'}, decorator=cache_anonymous_page)
+        self.assertEqual(decisions['product'], 'replica')
+
+    def test_reading_from_primary_block(self):
+        decisions = {}
+
+        def view(request):
+            with reading_from_primary():
+                decisions['inside'] = router.db_for_read(Product)
+            decisions['after'] = router.db_for_read(Product)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(decisions, {'inside': 'default', 'after': 'replica'})
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        decisions, response = self.route(decorator=replica_reads, write=Order)
+        self.assertEqual(set(decisions.values()), {'default'})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+TWO_TIER_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+    # Three workers sharing one tier: one that trusts its copies for an hour,
+    # one that checks on every read and a tiny one.
+    'worker': {
+        'BACKEND': 'core.cache_backends.TwoTierCache', 'LOCATION': 'shared',
+        'OPTIONS': {'STAMP_CHECK_INTERVAL': 3600},
+    },
+    'strict': {
+        'BACKEND': 'core.cache_backends.TwoTierCache', 'LOCATION': 'shared',
+        'OPTIONS': {'STAMP_CHECK_INTERVAL': 0},
+    },
+    'small': {
+        'BACKEND': 'core.cache_backends.TwoTierCache', 'LOCATION': 'shared',
+        'OPTIONS': {'MAX_ENTRIES': 2},
+    },
+}
+
+
+@override_settings(CACHES=TWO_TIER_CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.worker, self.strict, self.small = caches['worker'], caches['strict'], caches['small']
+        for worker in (self.worker, self.strict, self.small):
+            worker.clear()
+            worker.reset_stats()
+
+    def test_reads_are_served_from_process_memory(self):
+        self.worker.set('categories', ['a', 'b'])
+        self.assertEqual(self.strict.get('categories'), ['a', 'b'])
+        self.assertEqual(self.strict.get('categories'), ['a', 'b'])
+        self.assertEqual(self.worker.get('categories'), ['a', 'b'])
+        self.assertEqual(self.worker.stats()['local_hits'], 1)
+        stats = self.strict.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['stamp_checks']), (1, 1, 1))
+        self.assertIsNone(self.worker.get('missing'))
+        self.assertEqual(self.worker.stats()['misses'], 1)
+
+    def test_other_workers_see_invalidation_through_stamps(self):
+        self.worker.set('fragment', 'old')
+        self.assertEqual(self.strict.get('fragment'), 'old')
+        self.worker.set('fragment', 'new')
+        self.assertEqual(self.strict.get('fragment'), 'new')
+        self.strict.delete('fragment')
+        self.assertIsNone(self.strict.get('fragment'))
+        self.assertEqual(self.strict.stats()['stale'], 1)
+        # Until its check interval passes a worker keeps serving its copy.
+        self.assertEqual(self.worker.get('fragment'), 'new')
+
+    def test_lru_eviction_falls_back_to_shared_tier(self):
+        self.small.set_many({'a': 1, 'b': 2})
+        self.small.get('a')
+        self.small.set('c', 3)
+        self.assertEqual(self.small.stats()['evictions'], 1)
+        self.assertEqual(self.small.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(self.small.stats()['shared_hits'], 1)
+
+    def test_values_are_copies(self):
+        self.worker.set('list', [1])
+        self.worker.get('list').append(2)
+        self.assertEqual(self.worker.get('list'), [1])
+
+    def test_add_touch_and_clear(self):
+        self.assertTrue(self.worker.add('key', 1))
+        self.assertFalse(self.strict.add('key', 2))
+        self.assertTrue(self.strict.has_key('key'))
+        self.assertTrue(self.strict.touch('key', 60))
+        self.strict.set('gone', 1, timeout=0)
+        self.assertIsNone(self.strict.get('gone'))
+        self.worker.clear()
+        self.assertIsNone(self.strict.get('key'))
@@ -1,10 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from . import views
+from .conditional import conditional_page
+from .page_cache import cache_anonymous_page
+from .routers import replica_reads
 
 app_name = 'core'
 
+# Async views only under ASGI; under WSGI they would pay a thread hop per request.
+if settings.ASYNC_VIEWS:
+    product_list = conditional_page(views.aproduct_list_validators)(views.AsyncProductListView.as_view())
+    product_detail = conditional_page(views.aproduct_detail_validators)(views.AsyncProductDetailView.as_view())
+else:
+    product_list = conditional_page(views.product_list_validators)(views.ProductListView.as_view())
+    product_detail = conditional_page(views.product_detail_validators)(views.ProductDetailView.as_view())
+
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('products/', views.ProductListView.as_view(), name='product_list'),
-    path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
+    path('', replica_reads(cache_anonymous_page(views.home)), name='home'),
+    path('products/', replica_reads(cache_anonymous_page(product_list)), name='product_list'),
+    path('products/<int:pk>/', replica_reads(cache_anonymous_page(product_detail)), name='product_detail'),
+    path('products/<int:pk>/reviews/', replica_reads(views.product_reviews), name='product_reviews'),
+    path('products/search/suggest/', replica_reads(views.search_suggest), name='search_suggest'),
 ]
@@ -1,12 +1,25 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, render
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.views.generic import ListView, DetailView
-from products.models import Product, Category
+from products.models import Product, RelatedProduct, Review
+from .conditional import make_etag
+from .page_cache import CATEGORIES_TAG, add_page_tags, product_tag
+from .pagination import CursorPaginator
+from products.search import search_products
+from products.summary import (
+    aget_category_summary, aget_category_summary_version, get_category_summary, get_category_summary_version,
+)
 
 
 def home(request):
     """Homepage view with featured products and categories."""
-    featured_products = Product.objects.all()[:6]
-    categories = Category.objects.all()
+    featured_products = list(Product.objects.select_related('category')[:6])
+    categories = get_category_summary()
+    add_page_tags(request, CATEGORIES_TAG, *(product_tag(product.pk) for product in featured_products))
     
     context = {
         'featured_products': featured_products,
@@ -16,36 +29,264 @@ def home(request):
 
 
 class ProductListView(ListView):
-    """List all products with pagination and category filtering."""
+    """
+    List all products with pagination and category filtering.
+
+    Browsing uses keyset (cursor) pagination on ``(created_at, id)``; the
+    numbered ``?page=`` paginator is kept for search results and old links.
+    """
     model = Product
     template_name = 'core/product_list.html'
     context_object_name = 'products'
     paginate_by = 9
+    # Show the exact number of matching products (costs a COUNT per page).
+    exact_count = False
+    cursor_page = None
+    
+    def uses_cursor_pagination(self):
+        return 'page' not in self.request.GET and not self.request.GET.get('search')
+    
+    def paginate_queryset(self, queryset, page_size):
+        if not self.uses_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        if self.cursor_page is None:
+            self.cursor_page = CursorPaginator(queryset, page_size).page(self.request.GET.get('cursor'))
+        page = self.cursor_page
+        return page.paginator, page, page.object_list, page.has_other_pages()
     
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = Product.objects.select_related('category')
         category_id = self.request.GET.get('category')
         if category_id:
             queryset = queryset.filter(category_id=category_id)
+        search = self.request.GET.get('search', '').strip()
+        if search:
+            queryset = search_products(search, queryset)
         return queryset
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        if 'categories' not in context:
+            context['categories'] = get_category_summary()
         context['selected_category'] = self.request.GET.get('category', '')
+        context['search_query'] = self.request.GET.get('search', '').strip()
+        context['cursor_pagination'] = self.uses_cursor_pagination()
+        if self.exact_count and context['paginator'] is not None:
+            context['total_count'] = context['paginator'].count
+        if not context['search_query']:
+            # Search results depend on the index, not only on these products.
+            add_page_tags(
+                self.request, CATEGORIES_TAG, *(product_tag(product.pk) for product in context['object_list'])
+            )
         return context
 
 
+class AsyncProductListView(ProductListView):
+    """
+    ``ProductListView`` for ASGI deployments (``settings.ASYNC_VIEWS``).
+
+    Cursor pages are fetched with the async ORM; search and numbered pages
+    run the regular sync ``ListView`` code in a worker thread.
+    """
+    
+    async def get(self, request, *args, **kwargs):
+        if not self.uses_cursor_pagination():
+            return await sync_to_async(super().get)(request, *args, **kwargs)
+        self.object_list = self.get_queryset()
+        paginator = CursorPaginator(self.object_list, self.paginate_by)
+        self.cursor_page = await paginator.apage(request.GET.get('cursor'))
+        if self.exact_count:
+            await paginator.acount()
+        context = self.get_context_data(categories=await aget_category_summary())
+        return self.render_to_response(context)
+
+
 class ProductDetailView(DetailView):
     """Display detailed information about a product."""
     model = Product
     template_name = 'core/product_detail.html'
     context_object_name = 'product'
+    queryset = Product.objects.select_related('category')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get related products from the same category
-        context['related_products'] = Product.objects.filter(
-            category=self.object.category
-        ).exclude(pk=self.object.pk)[:4]
+        if 'related_products' not in context:
+            # Already fetched by product_detail_validators on a conditional GET.
+            context['related_products'] = getattr(self.request, 'related_products', None)
+            if context['related_products'] is None:
+                context['related_products'] = get_related_products(self.object)
+        if 'reviews_page' not in context:
+            context['reviews_page'] = review_paginator(self.object).page()
+        add_page_tags(
+            self.request, CATEGORIES_TAG,
+            *(product_tag(product.pk) for product in [self.object, *context['related_products']]),
+        )
         return context
+
+
+class AsyncProductDetailView(ProductDetailView):
+    """``ProductDetailView`` on the async ORM, for ASGI deployments (``settings.ASYNC_VIEWS``)."""
+    
+    async def get(self, request, *args, **kwargs):
+        self.object = await aget_object_or_404(self.get_queryset(), pk=self.kwargs['pk'])
+        related_products = getattr(request, 'related_products', None)
+        if related_products is None:
+            related_products = await aget_related_products(self.object)
+        context = self.get_context_data(
+            object=self.object,
+            related_products=related_products,
+            reviews_page=await review_paginator(self.object).apage(),
+        )
+        return self.render_to_response(context)
+
+
+RELATED_PRODUCTS = 4
+
+
+def _related_products_queries(product_id, category_id):
+    """Precomputed co-purchase neighbours, and the same-category fallback used before there are any."""
+    recommended = RelatedProduct.objects.filter(product_id=product_id)
+    same_category = Product.objects.filter(category_id=category_id).exclude(pk=product_id)
+    return recommended, same_category
+
+
+def get_related_products(product, limit=RELATED_PRODUCTS):
+    """Precomputed co-purchase neighbours, or products from the same category."""
+    recommended, same_category = _related_products_queries(product.pk, product.category_id)
+    return (
+        [related.recommended for related in recommended.select_related('recommended')[:limit]]
+        or list(same_category[:limit])
+    )
+
+
+async def aget_related_products(product, limit=RELATED_PRODUCTS):
+    """Async ``get_related_products``."""
+    recommended, same_category = _related_products_queries(product.pk, product.category_id)
+    return (
+        [related.recommended async for related in recommended.select_related('recommended')[:limit]]
+        or [item async for item in same_category[:limit]]
+    )
+
+
+def _product_list_stats(request):
+    """
+    ``(category_id, products, aggregates)`` behind the validators of a
+    browsing page of the product list, or None for search results, which
+    are not covered.
+    """
+    if request.GET.get('search', '').strip():
+        return None
+    products = Product.objects.all()
+    category_id = request.GET.get('category')
+    if category_id:
+        if not category_id.isdigit():
+            return None
+        products = products.filter(category_id=category_id)
+    aggregates = {
+        'last_modified': Max('updated_at'),
+        'count': Count('id'),
+        'reviews': Sum('review_count'),
+        'ratings': Sum('rating_sum'),
+    }
+    return category_id, products, aggregates
+
+
+def _list_validators(category_id, stats, summary_version):
+    return make_etag('list', category_id, *stats.values(), summary_version), stats['last_modified']
+
+
+def product_list_validators(request):
+    """
+    ``(etag, last_modified)`` of a product list page, from one aggregate
+    over the listed products and the sidebar's category summary version.
+    """
+    query = _product_list_stats(request)
+    if query is None:
+        return None
+    category_id, products, aggregates = query
+    return _list_validators(category_id, products.aggregate(**aggregates), get_category_summary_version())
+
+
+async def aproduct_list_validators(request):
+    """Async ``product_list_validators``."""
+    query = _product_list_stats(request)
+    if query is None:
+        return None
+    category_id, products, aggregates = query
+    return _list_validators(
+        category_id, await products.aaggregate(**aggregates), await aget_category_summary_version()
+    )
+
+
+def _product_detail_stats(pk):
+    return (
+        Product.objects.filter(pk=pk)
+        .annotate(last_review_at=Max('reviews__created_at'))
+        .values('updated_at', 'category_id', 'review_count', 'rating_sum', 'last_review_at')
+    )
+
+
+def _detail_validators(pk, product, related_products, summary_version):
+    related_stamps = [related.updated_at for related in related_products]
+    etag = make_etag('product', pk, *product.values(), *related_stamps, summary_version)
+    return etag, max(filter(None, (product['updated_at'], product['last_review_at'], *related_stamps)))
+
+
+def product_detail_validators(request, pk):
+    """
+    ``(etag, last_modified)`` of a product page: its ``updated_at``, latest
+    review, the related products' ``updated_at`` and the category summary
+    version. The related products are kept on the request for the view.
+    """
+    product = _product_detail_stats(pk).first()
+    if product is None:
+        return None
+    request.related_products = get_related_products(Product(pk=pk, category_id=product['category_id']))
+    return _detail_validators(pk, product, request.related_products, get_category_summary_version())
+
+
+async def aproduct_detail_validators(request, pk):
+    """Async ``product_detail_validators``."""
+    product = await _product_detail_stats(pk).afirst()
+    if product is None:
+        return None
+    request.related_products = await aget_related_products(Product(pk=pk, category_id=product['category_id']))
+    return _detail_validators(pk, product, request.related_products, await aget_category_summary_version())
+
+
+REVIEWS_PER_PAGE = 10
+
+
+def review_paginator(product):
+    """Cursor paginator over a product's reviews, newest first."""
+    reviews = Review.objects.filter(product=product).select_related('user')
+    return CursorPaginator(reviews, REVIEWS_PER_PAGE)
+
+
+def product_reviews(request, pk):
+    """Return the next page of a product's reviews as a rendered fragment (AJAX "load more")."""
+    product = get_object_or_404(Product, pk=pk)
+    page = review_paginator(product).page(request.GET.get('cursor'))
+    html = render_to_string('core/includes/review_items.html', {'reviews': page}, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': page.next_cursor,
+    })
+
+
+def search_suggest(request):
+    """Return the best matching products as JSON for the navbar live search."""
+    query = request.GET.get('q', '').strip()
+    products = search_products(query, Product.objects.select_related('category'), limit=8) if query else []
+    return JsonResponse({
+        'results': [
+            {
+                'id': product.pk,
+                'name': product.name,
+                'category': product.category.name,
+                'price': str(product.price),
+                'url': reverse('core:product_detail', args=[product.pk]),
+            }
+            for product in products
+        ]
+    })
@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  #
+    'core.middleware.SQLProfilerMiddleware',
+    'core.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  #
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'django.template.context_processors.i18n',  # Added for i18n
+                'orders.context_processors.cart',
             ],
         },
     },
@@ -85,6 +88,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'electronic_store.wsgi.application'
 
+# start.sh serves the app with sync gunicorn workers (wsgi) or uvicorn workers
+# (asgi). The catalog and cart views have sync and async implementations;
+# the async ones are only used under ASGI unless ASYNC_VIEWS says otherwise,
+# since under WSGI every async view pays a thread hop through async_to_sync.
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=SERVER_MODE == 'asgi', cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -98,6 +108,35 @@ DATABASES = {
     # Note: Render provides a DATABASE_URL environment variable which will override the default SQLite configuration.
 }
 
+# SQLite has no row-level locks: open write transactions immediately so that
+# concurrent checkouts wait for the database lock instead of failing with
+# "database is locked" halfway through. The trade-off: every atomic() block
+# takes the single write lock when it starts, including read-only ones (e.g.
+# a report read inside a transaction), so those queue behind writers and block
+# them until they finish; reads in autocommit are unaffected. Keep read-only
+# work out of atomic() on SQLite. The test database is a file (not the shared
+# in-memory default, git-ignored) so threaded tests get the same locking.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    })
+    DATABASES['default'].setdefault('TEST', {}).setdefault('NAME', str(BASE_DIR / 'test_db.sqlite3'))
+
+# Optional read replicas, as comma-separated database URLs (core.routers):
+# catalog reads and views wrapped in replica_reads use a replica; writes,
+# transactions, the rest of a request after a write and, through a cookie,
+# the same browser's next REPLICA_PIN_SECONDS use `default`. Tests read the
+# replicas' data from the test database. To try it with two SQLite files:
+#   cp db.sqlite3 replica.sqlite3
+#   DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py runserver
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, map(str.strip, config('DATABASE_REPLICA_URLS', default='').split(','))), 1):
+    DATABASES[f'replica_{number}'] = {**dj_database_url.parse(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -158,6 +197,62 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resize product photos (products.images) on a background thread after the
+# save commits. Set to False to build them inline, e.g. in tests.
+PRODUCT_IMAGE_VARIANTS_ASYNC = True
+
+# Shared secret for the product feed (/feed/products.csv?token=...) used by
+# comparison-shopping sites. When empty, the feed is open to staff only.
+PRODUCT_FEED_TOKEN = config('PRODUCT_FEED_TOKEN', default='')
+
+# Base URL for absolute links in feeds exported by `manage.py export_feed`.
+SITE_URL = config('SITE_URL', default='http://localhost:8000')
+
+# Saved co-purchase counts used by `manage.py build_recommendations` to
+# update recommendations incrementally. Safe to delete: the next run rebuilds.
+RECOMMENDATIONS_STATE_FILE = BASE_DIR / 'var' / 'copurchase.npz'
+
+# Per-request SQL profiling (core.middleware): fraction of requests sampled,
+# 0 to disable. Summaries go to the Server-Timing header and the
+# core.sql_profiler logger; a query shape repeated this many times in one
+# request is reported as a likely N+1 loop.
+SQL_PROFILER_SAMPLE_RATE = config('SQL_PROFILER_SAMPLE_RATE', default=0.0, cast=float)
+SQL_PROFILER_REPEAT_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.sql_profiler': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Two-tier cache (core.cache_backends): a per-process LRU of CACHE_LOCAL_ENTRIES
+# values in front of the shared cache, which is a file cache unless
+# SHARED_CACHE_BACKEND/SHARED_CACHE_LOCATION name another (e.g. Redis). Another
+# worker's set or delete is seen within CACHE_STAMP_CHECK_INTERVAL seconds.
+CACHES = {
+    'default': {
+        'BACKEND': 'core.cache_backends.TwoTierCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_LOCAL_ENTRIES', default=1000, cast=int),
+            'STAMP_CHECK_INTERVAL': config('CACHE_STAMP_CHECK_INTERVAL', default=1.0, cast=float),
+        },
+    },
+    'shared': {
+        'BACKEND': config('SHARED_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('SHARED_CACHE_LOCATION', default=str(BASE_DIR / 'var' / 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Tests swap the shared tier for local memory (core.test_runner).
+TEST_RUNNER = 'core.test_runner.TestRunner'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,6 +1,23 @@
-from django.contrib import admin
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Count
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Cart, CartItem, Order, OrderItem
+from .exports import astream_orders_csv, stream_orders_csv
+from .lifecycle import InvalidTransitionError, transition_order, transition_orders
+from .models import Cart, CartItem, Order, OrderItem, OrderStatusHistory
+from .rollups import dashboard_data
+
+DASHBOARD_RANGES = (7, 30, 90, 365)
+DASHBOARD_DEFAULT_DAYS = 30
 
 
 class CartItemInline(admin.TabularInline):
@@ -9,6 +26,9 @@ class CartItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ('product', 'quantity', 'total_price_display')
     can_delete = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
     
     def total_price_display(self, obj):
         return format_html(
@@ -25,23 +45,29 @@ class CartAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at', 'total_price_display')
+    list_select_related = ('user',)
     inlines = [CartItemInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(line_count=Count('items'))
     
     def items_count(self, obj):
-        count = obj.items.count()
         return format_html(
             '<span style="background: #007bff; color: white; padding: 3px 10px; '
             'border-radius: 12px;">{}</span>',
-            count
+            obj.line_count
         )
     items_count.short_description = 'عدد العناصر'
+    items_count.admin_order_field = 'line_count'
     
     def total_price_display(self, obj):
+        # Stored counter, no per-row scan of the cart's items.
         return format_html(
             '<span style="font-weight: bold; color: #28a745;">{} ر.س</span>',
             obj.total_price
         )
     total_price_display.short_description = 'المجموع الكلي'
+    total_price_display.admin_order_field = 'subtotal'
 
 
 @admin.register(CartItem)
@@ -50,6 +76,7 @@ class CartItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'cart', 'product', 'quantity', 'total_price_display')
     list_filter = ('cart__user',)
     search_fields = ('product__name', 'cart__user__username')
+    list_select_related = ('cart__user', 'product')
     
     def total_price_display(self, obj):
         return format_html(
@@ -65,6 +92,9 @@ class OrderItemInline(admin.TabularInline):
     extra = 0
     readonly_fields = ('product', 'quantity', 'price', 'total_price_display')
     can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
     
     def total_price_display(self, obj):
         return format_html(
@@ -74,17 +104,49 @@ class OrderItemInline(admin.TabularInline):
     total_price_display.short_description = 'المجموع'
 
 
+class OrderStatusHistoryInline(admin.TabularInline):
+    """Read-only status trail in Order view."""
+    model = OrderStatusHistory
+    extra = 0
+    fields = ('from_status', 'to_status', 'changed_by', 'created_at')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('changed_by')
+
+
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        order = self.instance
+        if order.pk and status != order.status and not order.can_transition_to(status):
+            raise forms.ValidationError(
+                f'لا يمكن نقل الطلب من "{order.get_status_display()}" إلى "{dict(Order.STATUS_CHOICES)[status]}".'
+            )
+        return status
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     """Admin configuration for Order model."""
+    form = OrderAdminForm
     list_display = ('order_id', 'user_info', 'full_name', 'phone', 'status_badge', 'total_price_display', 'created_at')
     list_display_links = ('order_id', 'user_info')
     list_filter = ('status', 'created_at')
     search_fields = ('id', 'user__username', 'full_name', 'phone', 'address')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('user',)
     list_per_page = 20
     ordering = ('-created_at',)
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, OrderStatusHistoryInline]
     
     fieldsets = (
         ('معلومات الطلب', {
@@ -99,7 +161,7 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
     
-    actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled']
+    actions = ['mark_as_processing', 'mark_as_shipped', 'mark_as_delivered', 'mark_as_cancelled', 'export_as_csv']
     
     def order_id(self, obj):
         return format_html(
@@ -142,27 +204,93 @@ class OrderAdmin(admin.ModelAdmin):
     status_badge.short_description = 'الحالة'
     status_badge.admin_order_field = 'status'
     
+    def save_model(self, request, obj, form, change):
+        if change and 'status' in form.changed_data:
+            status, obj.status = obj.status, form.initial['status']
+            try:
+                # Locks the row, records the history and restocks a cancelled order.
+                transition_order(obj, status, user=request.user)
+            except InvalidTransitionError as exc:
+                self.message_user(request, str(exc), messages.ERROR)
+        super().save_model(request, obj, form, change)
+
     # Admin actions
+    def transition(self, request, queryset, status):
+        result = transition_orders(queryset, status, user=request.user)
+        label = dict(Order.STATUS_CHOICES)[status]
+        self.message_user(request, f'تم تحديث {result.changed} طلب إلى "{label}"')
+        if result.skipped:
+            self.message_user(
+                request, f'تم تجاهل {result.skipped} طلب لا يمكن نقله إلى "{label}"', messages.WARNING
+            )
+
     def mark_as_processing(self, request, queryset):
-        queryset.update(status='processing')
-        self.message_user(request, f'تم تحديث {queryset.count()} طلب إلى "قيد المعالجة"')
+        self.transition(request, queryset, 'processing')
     mark_as_processing.short_description = 'تعيين كـ "قيد المعالجة"'
     
     def mark_as_shipped(self, request, queryset):
-        queryset.update(status='shipped')
-        self.message_user(request, f'تم تحديث {queryset.count()} طلب إلى "تم الشحن"')
+        self.transition(request, queryset, 'shipped')
     mark_as_shipped.short_description = 'تعيين كـ "تم الشحن"'
     
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
-        self.message_user(request, f'تم تحديث {queryset.count()} طلب إلى "تم التوصيل"')
+        self.transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = 'تعيين كـ "تم التوصيل"'
     
     def mark_as_cancelled(self, request, queryset):
-        queryset.update(status='cancelled')
-        self.message_user(request, f'تم تحديث {queryset.count()} طلب إلى "ملغي"')
+        self.transition(request, queryset, 'cancelled')
     mark_as_cancelled.short_description = 'تعيين كـ "ملغي"'
 
+    def export_as_csv(self, request, queryset):
+        return self.export_response(request, queryset)
+    export_as_csv.short_description = 'تصدير الطلبات المحددة (CSV)'
+
+    # CSV export
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='orders_order_export'),
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='orders_sales_dashboard'),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """Stream every order matching the changelist's current filters and search."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            changelist = self.get_changelist_instance(request)
+        except IncorrectLookupParameters:
+            return HttpResponseRedirect(reverse('admin:orders_order_changelist') + '?e=1')
+        return self.export_response(request, changelist.get_queryset(request))
+
+    def dashboard_view(self, request):
+        """Sales dashboard, read from the daily rollups only."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', DASHBOARD_DEFAULT_DAYS))
+        except ValueError:
+            days = DASHBOARD_DEFAULT_DAYS
+        if days not in DASHBOARD_RANGES:
+            days = DASHBOARD_DEFAULT_DAYS
+        end = timezone.localdate()
+        context = {
+            **self.admin_site.each_context(request),
+            **dashboard_data(end - timedelta(days=days - 1), end),
+            'title': 'لوحة المبيعات',
+            'opts': self.model._meta,
+            'days': days,
+            'ranges': DASHBOARD_RANGES,
+        }
+        return TemplateResponse(request, 'admin/orders/sales_dashboard.html', context)
+
+    def export_response(self, request, queryset):
+        # Under ASGI a sync iterator would be read into memory in one go.
+        stream = astream_orders_csv if isinstance(request, ASGIRequest) else stream_orders_csv
+        response = StreamingHttpResponse(stream(queryset), content_type='text/csv; charset=utf-8')
+        filename = f'orders-{timezone.localdate():%Y%m%d}.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -170,13 +298,15 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ('id', 'order_link', 'product', 'quantity', 'price', 'total_price_display')
     list_filter = ('order__status',)
     search_fields = ('product__name', 'order__id')
+    list_select_related = ('product',)
     
     def order_link(self, obj):
         return format_html(
-            '<a href="/admin/orders/order/{}/change/" style="color: #e94560; font-weight: bold;">طلب #{}</a>',
-            obj.order.pk, obj.order.pk
+            '<a href="{}" style="color: #e94560; font-weight: bold;">طلب #{}</a>',
+            reverse('admin:orders_order_change', args=[obj.order_id]), obj.order_id
         )
     order_link.short_description = 'الطلب'
+    order_link.admin_order_field = 'order'
     
     def total_price_display(self, obj):
         return format_html(
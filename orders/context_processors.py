@@ -0,0 +1,12 @@
+from django.utils.functional import SimpleLazyObject
+
+from .services import get_cart_badge_count
+
+
+def cart(request):
+    """Expose the navbar cart badge count without touching the database."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'cart_badge_count': 0}
+    # Lazy so pages that never render the badge never look it up.
+    return {'cart_badge_count': SimpleLazyObject(lambda: get_cart_badge_count(user))}
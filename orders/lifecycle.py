@@ -0,0 +1,110 @@
+"""
+Order status lifecycle.
+
+``Order.TRANSITIONS`` lists the statuses each status may move to.
+``transition_orders`` moves a whole queryset at once: inside one
+transaction it locks and reads the ``(id, status)`` pairs, then runs one
+conditional UPDATE per source status that may reach the target and
+records an ``OrderStatusHistory`` row for every changed order with
+``bulk_create``. Orders whose status cannot reach the target are left
+alone and reported as skipped, so bulk-shipping thousands of orders costs
+a few statements rather than a few per order. Cancelling puts the
+cancelled orders' quantities back in stock with one more SELECT and one
+conditional UPDATE, in the same transaction.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+
+from core.page_cache import invalidate_product_pages
+from products.models import Product
+from products.summary import invalidate_category_summary
+from .models import Order, OrderItem, OrderStatusHistory
+
+HISTORY_BATCH_SIZE = 1000
+
+
+class InvalidTransitionError(Exception):
+    """Raised when an order cannot move to the requested status."""
+
+
+@dataclass
+class TransitionResult:
+    changed: int = 0
+    skipped: int = 0
+
+
+def allowed_sources(status):
+    """Statuses from which an order may move to ``status``."""
+    return [source for source, targets in Order.TRANSITIONS.items() if status in targets]
+
+
+def transition_orders(queryset, status, user=None):
+    """Move every order of ``queryset`` that may reach ``status`` to it."""
+    if status not in Order.TRANSITIONS:
+        raise InvalidTransitionError(f'حالة طلب غير معروفة: {status}')
+    sources = allowed_sources(status)
+    result = TransitionResult()
+    now = timezone.now()
+    with transaction.atomic():
+        by_status = defaultdict(list)
+        # Locking the rows keeps each UPDATE below to exactly the ids read here.
+        for pk, current in queryset.select_for_update().order_by().values_list('pk', 'status'):
+            by_status[current].append(pk)
+
+        history = []
+        for source in sources:
+            ids = by_status.pop(source, None)
+            if not ids:
+                continue
+            updated = queryset.filter(status=source).update(status=status, updated_at=now)
+            if updated != len(ids):
+                raise InvalidTransitionError('تغيرت حالة بعض الطلبات أثناء التحديث، يرجى المحاولة مرة أخرى.')
+            result.changed += updated
+            history.extend(
+                OrderStatusHistory(
+                    order_id=pk, from_status=source, to_status=status, changed_by=user, created_at=now,
+                )
+                for pk in ids
+            )
+        OrderStatusHistory.objects.bulk_create(history, batch_size=HISTORY_BATCH_SIZE)
+        if status == 'cancelled' and history:
+            restock([entry.order_id for entry in history], now)
+        result.skipped = sum(len(ids) for ids in by_status.values())
+    return result
+
+
+def restock(order_ids, now=None):
+    """Return the items of ``order_ids`` to stock with one UPDATE (call inside a transaction)."""
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids).order_by()
+        .values('product_id').annotate(quantity=Sum('quantity')).values_list('product_id', 'quantity')
+    )
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        stock=Case(
+            *[When(pk=product_id, then=F('stock') + quantity) for product_id, quantity in quantities.items()],
+            default=F('stock'),
+            output_field=IntegerField(),
+        ),
+        updated_at=now or timezone.now(),
+    )
+    # The UPDATE bypasses model signals, as in place_order().
+    transaction.on_commit(lambda: invalidate_product_pages(quantities))
+    transaction.on_commit(invalidate_category_summary)
+
+
+def transition_order(order, status, user=None):
+    """Move one order to ``status``, raising ``InvalidTransitionError`` if not allowed."""
+    if not order.can_transition_to(status):
+        raise InvalidTransitionError(
+            f'لا يمكن نقل الطلب من "{order.get_status_display()}" إلى "{dict(Order.STATUS_CHOICES).get(status, status)}".'
+        )
+    if not transition_orders(Order.objects.filter(pk=order.pk), status, user=user).changed:
+        raise InvalidTransitionError('تغيرت حالة الطلب، يرجى المحاولة مرة أخرى.')
+    order.status = status
+    return order
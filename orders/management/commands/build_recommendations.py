@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from orders.recommendations import DEFAULT_TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    """Compute "customers also bought" neighbours from past orders."""
+
+    help = 'Build the co-purchase recommendations shown on product pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Ignore the saved counts and rebuild from every order.',
+        )
+        parser.add_argument(
+            '--top-k', type=int, default=DEFAULT_TOP_K,
+            help='Number of neighbours stored per product.',
+        )
+
+    def handle(self, *args, **options):
+        products, rows = build_recommendations(full=options['full'], k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated recommendations for {products} product(s) ({rows} row(s)).'
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from orders.models import Cart
+
+
+class Command(BaseCommand):
+    """Rebuild the stored cart counters from the ``CartItem`` rows."""
+
+    help = 'Recompute Cart.item_count and Cart.subtotal from the cart items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of carts written per UPDATE batch.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the carts that are out of sync.',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f'{self.stale_carts().count()} cart(s) out of sync.')
+            return
+
+        with transaction.atomic():
+            stale_ids = list(self.stale_carts().values_list('pk', flat=True))
+            # Lock before recomputing: a cart write in flight either committed
+            # already or waits for us and then adjusts the corrected counters.
+            list(Cart.objects.select_for_update().filter(pk__in=stale_ids).values_list('pk'))
+            stale = list(self.stale_carts(stale_ids).only('pk', 'item_count', 'subtotal'))
+            for cart in stale:
+                cart.item_count = cart.actual_item_count
+                cart.subtotal = cart.actual_subtotal
+            Cart.objects.bulk_update(
+                stale, ['item_count', 'subtotal'], batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {len(stale)} cart(s).'))
+
+    def stale_carts(self, ids=None):
+        carts = Cart.with_actual_totals()
+        if ids is not None:
+            carts = carts.filter(pk__in=ids)
+        return carts.filter(~Q(item_count=F('actual_item_count')) | ~Q(subtotal=F('actual_subtotal')))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from orders.rollups import rollup_sales
+
+
+class Command(BaseCommand):
+    """Refresh the daily sales rollups read by the admin dashboard."""
+
+    help = 'Recompute the daily sales rollups for orders changed since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Rebuild every day (e.g. after orders were deleted).',
+        )
+
+    def handle(self, *args, **options):
+        days, orders = rollup_sales(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed {days} day(s) of sales rollups ({orders} changed order(s)).'
+        ))
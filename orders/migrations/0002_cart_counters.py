@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def backfill_cart_counters(apps, schema_editor):
+    Cart = apps.get_model('orders', 'Cart')
+    carts = list(Cart.objects.annotate(
+        actual_item_count=Sum('items__quantity'),
+        actual_subtotal=Sum(F('items__quantity') * F('items__product__price')),
+    ))
+    for cart in carts:
+        cart.item_count = cart.actual_item_count or 0
+        cart.subtotal = cart.actual_subtotal or Decimal('0.00')
+    Cart.objects.bulk_update(carts, ['item_count', 'subtotal'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='عدد القطع'),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='المجموع'),
+        ),
+        migrations.RunPython(backfill_cart_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:32
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_status_history'),
+        ('products', '0011_product_sku'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='القطع')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='الإيرادات')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='الطلبات')),
+            ],
+            options={
+                'verbose_name': 'مبيعات فئة يومية',
+                'verbose_name_plural': 'مبيعات الفئات اليومية',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='القطع')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='الإيرادات')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='الطلبات')),
+            ],
+            options={
+                'verbose_name': 'مبيعات منتج يومية',
+                'verbose_name_plural': 'مبيعات المنتجات اليومية',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatusSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='اليوم')),
+                ('status', models.CharField(choices=[('pending', 'قيد الانتظار'), ('processing', 'قيد المعالجة'), ('shipped', 'تم الشحن'), ('delivered', 'تم التوصيل'), ('cancelled', 'ملغي')], max_length=20, verbose_name='الحالة')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='القطع')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='الإيرادات')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='الطلبات')),
+            ],
+            options={
+                'verbose_name': 'مبيعات يومية حسب الحالة',
+                'verbose_name_plural': 'المبيعات اليومية حسب الحالة',
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders_updated_until', models.DateTimeField(blank=True, null=True, verbose_name='آخر تحديث طلب محسوب')),
+                ('ran_at', models.DateTimeField(blank=True, null=True, verbose_name='آخر تشغيل')),
+            ],
+            options={
+                'verbose_name': 'حالة تجميع المبيعات',
+                'verbose_name_plural': 'حالة تجميع المبيعات',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='dailycategorysales',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.category', verbose_name='الفئة'),
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product', verbose_name='المنتج'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystatussales',
+            constraint=models.UniqueConstraint(fields=('day', 'status'), name='daily_status_sales_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('day', 'category'), name='daily_category_sales_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('day', 'product'), name='daily_product_sales_unique'),
+        ),
+    ]
@@ -1,6 +1,11 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
-from products.models import Product
+from django.utils import timezone
+from products.models import Category, Product
 
 
 class Cart(models.Model):
@@ -11,6 +16,8 @@ class Cart(models.Model):
         related_name='cart',
         verbose_name='المستخدم'
     )
+    item_count = models.PositiveIntegerField(default=0, verbose_name='عدد القطع')
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'), verbose_name='المجموع')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')
 
@@ -23,13 +30,54 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
-        """Calculate total price of all items in cart."""
-        return sum(item.total_price for item in self.items.all())
+        """Total price of all items in cart (stored counter)."""
+        return self.subtotal
 
     @property
     def total_items(self):
-        """Count total number of items in cart."""
-        return sum(item.quantity for item in self.items.all())
+        """Total number of units in cart (stored counter)."""
+        return self.item_count
+
+    def adjust_totals(self, quantity, unit_price):
+        """Add ``quantity`` units at ``unit_price`` (negative to remove) to the counters."""
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F('item_count') + quantity,
+            subtotal=F('subtotal') + unit_price * quantity,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+
+    def reset_totals(self):
+        """Zero the counters after the cart has been emptied."""
+        Cart.objects.filter(pk=self.pk).update(item_count=0, subtotal=Decimal('0.00'))
+        self.item_count = 0
+        self.subtotal = Decimal('0.00')
+
+    @classmethod
+    def reprice(cls, product_ids, using='default'):
+        """Recompute the stored subtotal of every cart holding one of ``product_ids`` (one UPDATE)."""
+        subtotals = (
+            CartItem.objects.filter(cart=models.OuterRef('pk'))
+            .values('cart')
+            .annotate(total=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+            .values('total')
+        )
+        return cls.objects.using(using).filter(items__product__in=product_ids).update(
+            subtotal=Coalesce(models.Subquery(subtotals), Decimal('0.00'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            updated_at=timezone.now(),
+        )
+
+    @classmethod
+    def with_actual_totals(cls):
+        """Annotate carts with counters computed from their ``CartItem`` rows."""
+        return cls.objects.annotate(
+            actual_item_count=Coalesce(Sum('items__quantity'), 0),
+            actual_subtotal=Coalesce(
+                Sum(F('items__quantity') * F('items__product__price'), output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+                Decimal('0.00'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
 
 
 class CartItem(models.Model):
@@ -75,6 +123,14 @@ class Order(models.Model):
         ('delivered', 'تم التوصيل'),
         ('cancelled', 'ملغي'),
     ]
+    # Allowed lifecycle moves, applied by ``orders.lifecycle``.
+    TRANSITIONS = {
+        'pending': ('processing', 'cancelled'),
+        'processing': ('shipped', 'cancelled'),
+        'shipped': ('delivered',),
+        'delivered': (),
+        'cancelled': (),
+    }
 
     user = models.ForeignKey(
         User,
@@ -99,10 +155,52 @@ class Order(models.Model):
         verbose_name = 'طلب'
         verbose_name_plural = 'الطلبات'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # Incremental sales rollups (orders changed since the last run).
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+            # A customer's order history, newest first (recommended by index_advisor).
+            models.Index(fields=['user', '-created_at'], name='order_user_created_at_idx'),
+        ]
 
     def __str__(self):
         return f'طلب #{self.pk} - {self.user.username}'
 
+    def can_transition_to(self, status):
+        return status in self.TRANSITIONS.get(self.status, ())
+
+
+class OrderStatusHistory(models.Model):
+    """One status change of an order."""
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='status_history',
+        verbose_name='الطلب'
+    )
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='من حالة')
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='إلى حالة')
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='بواسطة'
+    )
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='التاريخ')
+
+    class Meta:
+        verbose_name = 'تغيير حالة الطلب'
+        verbose_name_plural = 'سجل حالات الطلبات'
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='order_status_history_idx'),
+        ]
+
+    def __str__(self):
+        return f'طلب #{self.order_id}: {self.get_from_status_display()} ← {self.get_to_status_display()}'
+
 
 class OrderItem(models.Model):
     """Individual item in an order."""
@@ -133,3 +231,61 @@ class OrderItem(models.Model):
         if self.price is None or self.quantity is None:
             return 0
         return self.price * self.quantity
+
+
+class DailyProductSales(models.Model):
+    """Units, revenue and orders of one product on one day (cancelled orders excluded)."""
+    day = models.DateField(verbose_name='اليوم')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name='المنتج')
+    units = models.PositiveIntegerField(default=0, verbose_name='القطع')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='الإيرادات')
+    orders = models.PositiveIntegerField(default=0, verbose_name='الطلبات')
+
+    class Meta:
+        verbose_name = 'مبيعات منتج يومية'
+        verbose_name_plural = 'مبيعات المنتجات اليومية'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='daily_product_sales_unique'),
+        ]
+
+
+class DailyCategorySales(models.Model):
+    """Units, revenue and orders of one category on one day (cancelled orders excluded)."""
+    day = models.DateField(verbose_name='اليوم')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+', verbose_name='الفئة')
+    units = models.PositiveIntegerField(default=0, verbose_name='القطع')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='الإيرادات')
+    orders = models.PositiveIntegerField(default=0, verbose_name='الطلبات')
+
+    class Meta:
+        verbose_name = 'مبيعات فئة يومية'
+        verbose_name_plural = 'مبيعات الفئات اليومية'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='daily_category_sales_unique'),
+        ]
+
+
+class DailyStatusSales(models.Model):
+    """Orders placed on one day, by their current status."""
+    day = models.DateField(verbose_name='اليوم')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name='الحالة')
+    units = models.PositiveIntegerField(default=0, verbose_name='القطع')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name='الإيرادات')
+    orders = models.PositiveIntegerField(default=0, verbose_name='الطلبات')
+
+    class Meta:
+        verbose_name = 'مبيعات يومية حسب الحالة'
+        verbose_name_plural = 'المبيعات اليومية حسب الحالة'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='daily_status_sales_unique'),
+        ]
+
+
+class SalesRollupState(models.Model):
+    """High-water mark of the sales rollups (a single row)."""
+    orders_updated_until = models.DateTimeField(null=True, blank=True, verbose_name='آخر تحديث طلب محسوب')
+    ran_at = models.DateTimeField(null=True, blank=True, verbose_name='آخر تشغيل')
+
+    class Meta:
+        verbose_name = 'حالة تجميع المبيعات'
+        verbose_name_plural = 'حالة تجميع المبيعات'
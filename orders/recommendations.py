@@ -0,0 +1,304 @@
+"""
+Item-to-item co-purchase recommendations.
+
+Orders are turned into a sparse order x product incidence matrix ``X``;
+``X.T @ X`` is the product co-occurrence matrix whose diagonal holds how
+many orders contained each product. Neighbours are ranked by cosine
+similarity ``C[i, j] / sqrt(n[i] * n[j])`` and the top K per product are
+stored in ``products.RelatedProduct`` for the product page to read.
+Cancelled orders are not co-purchases.
+
+The co-occurrence matrix is saved between runs together with the ids of
+the orders it counts and a high-water mark on ``Order.updated_at``. A
+later run reads the orders changed since the mark, less a short overlap
+for orders committed late with an older ``updated_at``, adds those newly
+counted and subtracts those cancelled since. A change to product ``i``
+moves ``n[i]`` and so the score of every product bought with it: the
+run rewrites the lists of the touched products and of every product
+that shares an order with one of them, before or after the change, which
+gives the same lists as a full rebuild. Deleted orders leave no trace to
+follow; ``full=True`` rebuilds everything.
+
+NumPy and SciPy are only needed by the offline build, not by the web
+process.
+"""
+import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from core.page_cache import CATEGORIES_TAG, invalidate_page_tags, invalidate_product_pages
+from products.models import Product, RelatedProduct
+from .models import Order, OrderItem
+
+DEFAULT_TOP_K = 8
+ORDERS_OVERLAP = datetime.timedelta(minutes=5)
+# Bumped when the saved state changes shape; older files trigger a rebuild.
+STATE_VERSION = 2
+
+
+def get_state_path():
+    return Path(getattr(
+        settings, 'RECOMMENDATIONS_STATE_FILE', Path(settings.BASE_DIR) / 'var' / 'copurchase.npz'
+    ))
+
+
+class CoPurchaseModel:
+    """Sparse co-occurrence counts keyed by product id, and the orders they count."""
+
+    def __init__(self, product_ids, matrix, order_ids, updated_until=None):
+        self.product_ids = product_ids
+        self.matrix = matrix.tocsr()
+        self.order_ids = order_ids
+        self.updated_until = updated_until
+
+    @classmethod
+    def empty(cls):
+        import numpy as np
+        from scipy import sparse
+
+        return cls(
+            np.empty(0, dtype=np.int64), sparse.csr_matrix((0, 0), dtype=np.int64), np.empty(0, dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """The saved model, or None when the file predates ``STATE_VERSION``."""
+        import numpy as np
+        from scipy import sparse
+
+        with np.load(path) as data:
+            if 'version' not in data or int(data['version']) != STATE_VERSION:
+                return None
+            matrix = sparse.csr_matrix(
+                (data['data'], data['indices'], data['indptr']), shape=tuple(data['shape'])
+            )
+            updated_until = str(data['updated_until'])
+            return cls(
+                data['product_ids'], matrix, data['order_ids'],
+                datetime.datetime.fromisoformat(updated_until) if updated_until else None,
+            )
+
+    def save(self, path):
+        import numpy as np
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'wb') as handle:
+            np.savez_compressed(
+                handle,
+                version=np.array(STATE_VERSION),
+                product_ids=self.product_ids,
+                data=self.matrix.data,
+                indices=self.matrix.indices,
+                indptr=self.matrix.indptr,
+                shape=np.array(self.matrix.shape),
+                order_ids=self.order_ids,
+                updated_until=np.array(self.updated_until.isoformat() if self.updated_until else ''),
+            )
+
+    def add_orders(self, order_ids, product_ids, sign=1):
+        """
+        Add (``sign=-1``: subtract) the (order, product) pairs of whole
+        orders to the counts and return the ids of the products involved.
+        """
+        import numpy as np
+        from scipy import sparse
+
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if not len(order_ids):
+            return np.empty(0, dtype=np.int64)
+
+        # Grow the product axis for products we have not seen before.
+        all_ids = np.union1d(self.product_ids, product_ids)
+        if len(all_ids) != len(self.product_ids):
+            remap = np.searchsorted(all_ids, self.product_ids)
+            old = self.matrix.tocoo()
+            self.matrix = sparse.csr_matrix(
+                (old.data, (remap[old.row], remap[old.col])), shape=(len(all_ids), len(all_ids))
+            )
+            self.product_ids = all_ids
+
+        rows, order_index = np.unique(order_ids, return_inverse=True)
+        columns = np.searchsorted(self.product_ids, product_ids)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.int64), (order_index, columns)),
+            shape=(len(rows), len(self.product_ids)),
+        )
+        # The same product twice in one order still counts once.
+        incidence.data[:] = 1
+        self.matrix = (self.matrix + sign * (incidence.T @ incidence)).tocsr()
+        # Pairs no longer bought together must not linger with a zero score.
+        self.matrix.eliminate_zeros()
+        if sign > 0:
+            self.order_ids = np.union1d(self.order_ids, rows)
+        else:
+            self.order_ids = np.setdiff1d(self.order_ids, rows)
+        return self.product_ids[np.unique(columns)]
+
+    def remove_orders(self, order_ids, product_ids):
+        return self.add_orders(order_ids, product_ids, sign=-1)
+
+    def bought_with(self, product_ids):
+        """``product_ids`` (those known) and every product sharing an order with one of them."""
+        import numpy as np
+
+        product_ids = np.intersect1d(product_ids, self.product_ids)
+        if not len(product_ids):
+            return product_ids
+        rows = self.matrix[np.searchsorted(self.product_ids, product_ids)]
+        return np.union1d(product_ids, self.product_ids[rows.indices])
+
+    def apply_changes(self, orders):
+        """
+        Count the orders of ``orders`` not counted yet and uncount those
+        cancelled since; return the ids of the products whose lists change.
+        """
+        import numpy as np
+
+        statuses = dict(orders.order_by().values_list('pk', 'status'))
+        order_ids = np.fromiter(statuses, dtype=np.int64, count=len(statuses))
+        wanted = np.fromiter((status != 'cancelled' for status in statuses.values()), dtype=bool, count=len(statuses))
+        counted = np.isin(order_ids, self.order_ids)
+        added = fetch_order_lines(order_ids[wanted & ~counted])
+        removed = fetch_order_lines(order_ids[~wanted & counted])
+
+        touched = np.union1d(added[1], removed[1])
+        before = self.bought_with(touched)
+        self.add_orders(*added)
+        self.remove_orders(*removed)
+        return np.union1d(before, self.bought_with(touched))
+
+    def top_neighbours(self, product_ids, k=DEFAULT_TOP_K):
+        """Yield ``(product_id, [(neighbour_id, score), ...])`` for the given products."""
+        import numpy as np
+
+        counts = self.matrix.diagonal().astype(np.float64)
+        positions = np.searchsorted(self.product_ids, product_ids)
+        for product_id, row in zip(product_ids, positions):
+            start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            columns = self.matrix.indices[start:end]
+            together = self.matrix.data[start:end].astype(np.float64)
+            keep = columns != row
+            columns, together = columns[keep], together[keep]
+            if not len(columns):
+                yield int(product_id), []
+                continue
+            scores = together / np.sqrt(counts[row] * counts[columns])
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+            else:
+                best = np.arange(len(scores))
+            # Highest score first; ties broken by the more frequent co-purchase.
+            best = best[np.lexsort((-together[best], -scores[best]))]
+            yield int(product_id), [
+                (int(self.product_ids[columns[i]]), float(scores[i])) for i in best
+            ]
+
+
+def fetch_order_lines(order_ids=None, chunk_size=10000):
+    """
+    Return ``(order_ids, product_ids)`` arrays for the lines of ``order_ids``
+    (of every order not cancelled when ``None``).
+    """
+    import numpy as np
+
+    if order_ids is None:
+        batches = [OrderItem.objects.exclude(order__status='cancelled')]
+    else:
+        order_ids = [int(pk) for pk in order_ids]
+        batches = [
+            OrderItem.objects.filter(order_id__in=order_ids[start:start + chunk_size])
+            for start in range(0, len(order_ids), chunk_size)
+        ]
+    pairs = np.fromiter(
+        (
+            value
+            for lines in batches
+            for pair in lines.order_by().values_list('order_id', 'product_id').iterator(chunk_size=chunk_size)
+            for value in pair
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def store_neighbours(neighbours, replace_all=False, batch_size=1000):
+    """
+    Replace the stored recommendations of every product in ``neighbours``
+    (of every product when ``replace_all`` is set).
+    """
+    neighbours = list(neighbours)
+    product_ids = [product_id for product_id, _ in neighbours]
+    rows = [
+        RelatedProduct(product_id=product_id, recommended_id=recommended_id, rank=rank, score=score)
+        for product_id, items in neighbours
+        for rank, (recommended_id, score) in enumerate(items, start=1)
+    ]
+    with transaction.atomic():
+        if replace_all:
+            RelatedProduct.objects.all().delete()
+        else:
+            for start in range(0, len(product_ids), batch_size):
+                RelatedProduct.objects.filter(product_id__in=product_ids[start:start + batch_size]).delete()
+        RelatedProduct.objects.bulk_create(rows, batch_size=batch_size)
+    # The related products block is part of the cached product pages.
+    if replace_all:
+        invalidate_page_tags(CATEGORIES_TAG)
+    else:
+        invalidate_product_pages(product_ids)
+    return len(rows)
+
+
+def build_recommendations(full=False, k=DEFAULT_TOP_K, state_path=None):
+    """
+    Update the stored recommendations from the orders changed since the
+    last run (from every order when ``full`` is set or no usable saved
+    state exists). Returns ``(products_updated, rows_written)``.
+    """
+    state_path = state_path or get_state_path()
+    model = None if full or not state_path.exists() else CoPurchaseModel.load(state_path)
+    full = model is None
+
+    changed = Order.objects.all()
+    if not full and model.updated_until is not None:
+        changed = changed.filter(updated_at__gt=model.updated_until - ORDERS_OVERLAP)
+    # Read before the lines: an order changing meanwhile is read again next run.
+    until = changed.aggregate(until=Max('updated_at'))['until']
+
+    if full:
+        model = CoPurchaseModel.empty()
+        rewrite = model.add_orders(*fetch_order_lines())
+    else:
+        rewrite = model.apply_changes(changed)
+    if until is not None:
+        model.updated_until = max(until, model.updated_until or until)
+    neighbours = list(model.top_neighbours(rewrite, k=k))
+
+    # The saved counts may still mention products deleted since they were sold.
+    existing = existing_product_ids(
+        {product_id for product_id, _ in neighbours}
+        | {other for _, items in neighbours for other, _ in items}
+    )
+    neighbours = [
+        (product_id, [(other, score) for other, score in items if other in existing])
+        for product_id, items in neighbours
+        if product_id in existing
+    ]
+
+    written = store_neighbours(neighbours, replace_all=full)
+    model.save(state_path)
+    return len(neighbours), written
+
+
+def existing_product_ids(product_ids, chunk_size=10000):
+    """Subset of ``product_ids`` that still exist."""
+    product_ids = list(product_ids)
+    existing = set()
+    for start in range(0, len(product_ids), chunk_size):
+        existing.update(
+            Product.objects.filter(pk__in=product_ids[start:start + chunk_size]).values_list('pk', flat=True)
+        )
+    return existing
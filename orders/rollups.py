@@ -0,0 +1,175 @@
+"""
+Daily sales rollups for the admin dashboard.
+
+Three tables hold per-day totals: by product and by category (units,
+revenue and distinct orders, cancelled orders excluded) and by current
+order status. ``rollup_sales`` keeps them current from a high-water mark
+on ``Order.updated_at``: every day on which a changed order was placed is
+recomputed from scratch (delete + insert), so a run is idempotent and
+picks up status changes of old orders as well as new ones. The scan
+re-reads a short overlap before the mark to catch orders committed late
+with an older ``updated_at``.
+
+Deleted orders leave no trace to follow; ``full=True`` rebuilds everything.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyCategorySales, DailyProductSales, DailyStatusSales, Order, OrderItem, SalesRollupState,
+)
+
+ROLLUP_OVERLAP = datetime.timedelta(minutes=5)
+ROLLUP_DAYS_PER_BATCH = 31
+REVENUE = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+def day_range(day):
+    """Aware ``[start, end)`` datetimes of a local calendar day."""
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+
+
+def placed_on(days, field='created_at'):
+    """``Q`` matching rows whose ``field`` falls on one of ``days`` (index-friendly ranges)."""
+    condition = Q()
+    for day in days:
+        start, end = day_range(day)
+        condition |= Q(**{f'{field}__gte': start, f'{field}__lt': end})
+    return condition
+
+
+def _item_totals(items, group_field):
+    return (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', group_field)
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('price'), output_field=REVENUE),
+            orders=Count('order', distinct=True),
+        )
+        .order_by()
+    )
+
+
+def compute_rollups(days=None):
+    """Rollup rows for ``days`` (every day when ``None``), as unsaved model instances."""
+    orders = Order.objects.all()
+    items = OrderItem.objects.all()
+    if days is not None:
+        orders = orders.filter(placed_on(days))
+        items = items.filter(placed_on(days, 'order__created_at'))
+    sold = items.exclude(order__status='cancelled')
+
+    products = [
+        DailyProductSales(day=row['day'], product_id=row['product_id'], units=row['units'],
+                          revenue=row['revenue'], orders=row['orders'])
+        for row in _item_totals(sold, 'product_id')
+    ]
+    categories = [
+        DailyCategorySales(day=row['day'], category_id=row['product__category_id'], units=row['units'],
+                           revenue=row['revenue'], orders=row['orders'])
+        for row in _item_totals(sold, 'product__category_id')
+    ]
+
+    # Units come from a separate query: joining items would repeat total_price.
+    units = defaultdict(int)
+    for row in (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'order__status').annotate(units=Sum('quantity')).order_by()
+    ):
+        units[row['day'], row['order__status']] = row['units']
+    statuses = [
+        DailyStatusSales(day=row['day'], status=row['status'], units=units[row['day'], row['status']],
+                         revenue=row['revenue'] or Decimal('0.00'), orders=row['orders'])
+        for row in (
+            orders.annotate(day=TruncDate('created_at'))
+            .values('day', 'status').annotate(orders=Count('id'), revenue=Sum('total_price')).order_by()
+        )
+    ]
+    return products, categories, statuses
+
+
+ROLLUP_MODELS = (DailyProductSales, DailyCategorySales, DailyStatusSales)
+
+
+def store_rollups(days, rows):
+    """Replace the rollups of ``days`` (of every day when ``None``) with ``rows``."""
+    for model, model_rows in zip(ROLLUP_MODELS, rows):
+        stale = model.objects.all() if days is None else model.objects.filter(day__in=days)
+        stale.delete()
+        model.objects.bulk_create(model_rows, batch_size=1000)
+
+
+def rollup_sales(full=False):
+    """
+    Bring the rollups up to date. Returns ``(days_recomputed, orders_seen)``;
+    ``full`` rebuilds every day.
+    """
+    with transaction.atomic():
+        state, _ = SalesRollupState.objects.select_for_update().get_or_create(pk=1)
+        changed = Order.objects.all()
+        if not full and state.orders_updated_until is not None:
+            changed = changed.filter(updated_at__gt=state.orders_updated_until - ROLLUP_OVERLAP)
+        seen = changed.aggregate(count=Count('id'), until=Max('updated_at'))
+
+        if full:
+            store_rollups(None, compute_rollups())
+            days = Order.objects.dates('created_at', 'day')
+        else:
+            days = sorted(
+                changed.order_by().annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct()
+            )
+            for start in range(0, len(days), ROLLUP_DAYS_PER_BATCH):
+                batch = days[start:start + ROLLUP_DAYS_PER_BATCH]
+                store_rollups(batch, compute_rollups(batch))
+
+        if seen['until'] is not None:
+            state.orders_updated_until = max(seen['until'], state.orders_updated_until or seen['until'])
+        state.ran_at = timezone.now()
+        state.save()
+    return len(days), seen['count']
+
+
+def _sums():
+    return {'units': Sum('units'), 'revenue': Sum('revenue'), 'orders': Sum('orders')}
+
+
+def dashboard_data(start, end, top=10):
+    """Sales figures for ``start``..``end`` (inclusive), read from the rollups only."""
+    in_range = Q(day__gte=start, day__lte=end)
+    by_status = list(
+        DailyStatusSales.objects.filter(in_range).values('status')
+        .annotate(**_sums()).order_by('-orders')
+    )
+    labels = dict(Order.STATUS_CHOICES)
+    for row in by_status:
+        row['label'] = labels.get(row['status'], row['status'])
+    sold = [row for row in by_status if row['status'] != 'cancelled']
+    return {
+        'start': start,
+        'end': end,
+        'revenue': sum((row['revenue'] for row in sold), Decimal('0.00')),
+        'orders': sum(row['orders'] for row in sold),
+        'units': sum(row['units'] for row in sold),
+        'by_status': by_status,
+        'by_day': list(
+            DailyStatusSales.objects.filter(in_range).exclude(status='cancelled').values('day')
+            .annotate(**_sums()).order_by('-day')
+        ),
+        'top_products': list(
+            DailyProductSales.objects.filter(in_range).values('product_id', 'product__name')
+            .annotate(**_sums()).order_by('-revenue')[:top]
+        ),
+        'top_categories': list(
+            DailyCategorySales.objects.filter(in_range).values('category_id', 'category__name')
+            .annotate(**_sums()).order_by('-revenue')[:top]
+        ),
+        'state': SalesRollupState.objects.filter(pk=1).first(),
+    }
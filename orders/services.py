@@ -0,0 +1,138 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+
+from core.page_cache import invalidate_product_pages
+from products.models import Product
+from products.summary import invalidate_category_summary
+from .models import CartItem, OrderItem
+
+
+CART_BADGE_CACHE_KEY = 'orders:cart-badge:{user_id}'
+CART_BADGE_CACHE_TIMEOUT = 60 * 5
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order."""
+
+
+class EmptyCartError(CheckoutError):
+    """Raised when checking out a cart with no items."""
+
+
+class InsufficientStockError(CheckoutError):
+    """Raised when one or more products do not have enough stock."""
+
+    def __init__(self, products):
+        self.products = products
+        names = '، '.join(product.name for product in products)
+        super().__init__(f'الكمية المطلوبة غير متوفرة في المخزون: {names}')
+
+
+def place_order(cart, user, order):
+    """
+    Turn the cart into an order inside a single transaction.
+
+    ``order`` is an unsaved ``Order`` (usually from ``CheckoutForm``). The
+    affected products are locked in one query, stock is decremented with a
+    single conditional UPDATE, order lines are bulk inserted and the cart is
+    cleared, so the number of queries does not depend on the cart size.
+    """
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')
+        )
+        if not lines:
+            raise EmptyCartError('السلة فارغة.')
+
+        products = Product.objects.select_for_update().in_bulk(
+            [product_id for product_id, _ in lines]
+        )
+
+        short = [
+            products[product_id]
+            for product_id, quantity in lines
+            if products[product_id].stock < quantity
+        ]
+        if short:
+            raise InsufficientStockError(short)
+
+        # One UPDATE for every line; the stock condition guards against
+        # concurrent buyers on backends without row locks.
+        condition = Q()
+        for product_id, quantity in lines:
+            condition |= Q(pk=product_id, stock__gte=quantity)
+        quantities = dict(lines)
+        updated = Product.objects.filter(condition).update(
+            stock=_decrement_expression(quantities),
+            updated_at=timezone.now(),
+        )
+        if updated != len(lines):
+            raise InsufficientStockError([products[product_id] for product_id in quantities])
+
+        order.user = user
+        order.total_price = sum(
+            products[product_id].price * quantity for product_id, quantity in lines
+        )
+        order.save()
+
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=product_id,
+                quantity=quantity,
+                price=products[product_id].price,
+            )
+            for product_id, quantity in lines
+        ])
+
+        CartItem.objects.filter(cart=cart).delete()
+        cart.reset_totals()
+        transaction.on_commit(lambda: invalidate_cart_badge(user))
+        # The stock UPDATE bypasses model signals; refresh the cached product
+        # pages, and the in-stock counts when a product has just sold out.
+        transaction.on_commit(lambda: invalidate_product_pages(quantities))
+        if any(products[product_id].stock == quantity for product_id, quantity in lines):
+            transaction.on_commit(invalidate_category_summary)
+
+    return order
+
+
+def _decrement_expression(quantities):
+    """Build a ``stock - quantity`` expression keyed on the product id."""
+    return Case(
+        *[When(pk=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+        default=F('stock'),
+        output_field=IntegerField(),
+    )
+
+
+def get_cart_badge_count(user):
+    """Number of lines in the user's cart, served from the cache when possible."""
+    key = CART_BADGE_CACHE_KEY.format(user_id=user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = CartItem.objects.filter(cart__user=user).count()
+        cache.set(key, count, CART_BADGE_CACHE_TIMEOUT)
+    return count
+
+
+async def aget_cart_badge_count(user):
+    """Async ``get_cart_badge_count``."""
+    key = CART_BADGE_CACHE_KEY.format(user_id=user.pk)
+    count = await cache.aget(key)
+    if count is None:
+        count = await CartItem.objects.filter(cart__user=user).acount()
+        await cache.aset(key, count, CART_BADGE_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_cart_badge(user):
+    """Drop the cached badge count after the user's cart has changed."""
+    cache.delete(CART_BADGE_CACHE_KEY.format(user_id=user.pk))
+
+
+async def ainvalidate_cart_badge(user):
+    """Async ``invalidate_cart_badge``."""
+    await cache.adelete(CART_BADGE_CACHE_KEY.format(user_id=user.pk))
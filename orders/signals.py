@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from products.models import Product
+from products.signals import prices_changed
+from .models import Cart
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts_on_save(sender, instance, created, using, **kwargs):
+    """Carts store their subtotal; a price edit must reach the carts holding the product."""
+    if not created and getattr(instance, '_stored_price', instance.price) != instance.price:
+        Cart.reprice([instance.pk], using=using)
+    instance._stored_price = instance.price
+
+
+@receiver(prices_changed, sender=Product)
+def reprice_carts_on_import(sender, product_ids, using, **kwargs):
+    Cart.reprice(product_ids, using=using)
@@ -1,3 +1,699 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from products.importer import ProductImporter
+from products.models import Category, Product, RelatedProduct
+from .lifecycle import InvalidTransitionError, transition_order, transition_orders
+from .models import (
+    Cart, CartItem, DailyCategorySales, DailyProductSales, DailyStatusSales, Order, OrderItem, OrderStatusHistory,
+)
+from .recommendations import build_recommendations
+from .rollups import rollup_sales
+from .services import InsufficientStockError, place_order
+from .views import aadd_to_cart, acart_summary
+
+
+def make_product(category, name='منتج', price='10.00', stock=10):
+    return Product.objects.create(
+        name=name, description='وصف', price=Decimal(price), stock=stock, category=category
+    )
+
+
+class PlaceOrderTests(TestCase):
+    """Tests for the transactional checkout service."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret-pass-123')
+        self.category = Category.objects.create(name='هواتف')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def fill_cart(self, count, stock=10, quantity=2):
+        for i in range(count):
+            product = make_product(self.category, name=f'منتج {i}', stock=stock)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_creates_order_and_decrements_stock(self):
+        self.fill_cart(3, stock=5, quantity=2)
+        order = place_order(self.cart, self.user, Order(full_name='x', address='y', phone='1'))
+
+        self.assertEqual(order.total_price, Decimal('60.00'))
+        self.assertEqual(OrderItem.objects.filter(order=order).count(), 3)
+        self.assertFalse(CartItem.objects.filter(cart=self.cart).exists())
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_insufficient_stock_rolls_back(self):
+        self.fill_cart(2, stock=1, quantity=2)
+        with self.assertRaises(InsufficientStockError):
+            place_order(self.cart, self.user, Order(full_name='x', address='y', phone='1'))
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {1})
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        counts = []
+        for size in (1, 10):
+            CartItem.objects.filter(cart=self.cart).delete()
+            self.fill_cart(size)
+            with CaptureQueriesContext(connection) as ctx:
+                place_order(self.cart, self.user, Order(full_name='x', address='y', phone='1'))
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_checkout_view_redirects_to_cart_when_out_of_stock(self):
+        self.fill_cart(1, stock=0, quantity=1)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('orders:checkout'), {
+            'full_name': 'x', 'address': 'y', 'phone': '1',
+        })
+        self.assertRedirects(response, reverse('orders:cart'))
+        self.assertFalse(Order.objects.exists())
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many buyers competing for the same product must never oversell it."""
+
+    workers = 8
+    stock = 3
+
+    def test_no_overselling(self):
+        category = Category.objects.create(name='حواسيب')
+        product = make_product(category, stock=self.stock)
+        carts = []
+        for i in range(self.workers):
+            user = User.objects.create(username=f'buyer{i}')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            carts.append(cart)
+
+        barrier = threading.Barrier(self.workers)
+        results = []
+
+        def buy(cart):
+            try:
+                barrier.wait()
+                place_order(cart, cart.user, Order(full_name='x', address='y', phone='1'))
+                results.append(True)
+            except (InsufficientStockError, OperationalError):
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sold = results.count(True)
+        product.refresh_from_db()
+        self.assertEqual(sold, self.stock)
+        self.assertGreaterEqual(product.stock, 0)
+        self.assertEqual(product.stock, self.stock - sold)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), sold)
+
+
+class CartCounterTests(TestCase):
+    """Tests for the stored cart summary counters."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='secret-pass-123')
+        self.category = Category.objects.create(name='سماعات')
+        self.product = make_product(self.category, price='25.00')
+        self.client.force_login(self.user)
+
+    def test_views_keep_counters_in_sync(self):
+        url = reverse('orders:add_to_cart', args=[self.product.pk])
+        self.client.post(url)
+        response = self.client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['cart_total'], 2)
+
+        item = CartItem.objects.get(cart__user=self.user)
+        self.client.post(reverse('orders:update_cart_item', args=[item.pk]), {'quantity': 5})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual((cart.item_count, cart.subtotal), (5, Decimal('125.00')))
+
+        self.client.post(reverse('orders:remove_from_cart', args=[item.pk]))
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (0, Decimal('0.00')))
+
+    def test_price_changes_reprice_carts(self):
+        self.client.post(reverse('orders:add_to_cart', args=[self.product.pk]))
+        self.client.post(reverse('orders:add_to_cart', args=[self.product.pk]))
+        cart = Cart.objects.get(user=self.user)
+
+        self.product.price = Decimal('30.00')
+        self.product.save()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('60.00')))
+
+        Product.objects.filter(pk=self.product.pk).update(sku='SKU-1')
+        ProductImporter().run([(2, {
+            'sku': 'SKU-1', 'name': 'سماعة', 'description': 'وصف', 'price': '12.50', 'stock': '5',
+            'category': self.category.name,
+        })])
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal('25.00'))
+
+    def test_failed_counter_update_rolls_back_the_item(self):
+        self.client.post(reverse('orders:add_to_cart', args=[self.product.pk]))
+        item = CartItem.objects.get(cart__user=self.user)
+        with mock.patch.object(Cart, 'adjust_totals', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.client.post(reverse('orders:update_cart_item', args=[item.pk]), {'quantity': 4})
+            with self.assertRaises(OperationalError):
+                self.client.post(reverse('orders:remove_from_cart', args=[item.pk]))
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+    def test_summary_reads_need_no_queries(self):
+        cart = Cart.objects.create(user=self.user)
+        cart.adjust_totals(3, self.product.price)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart.total_items, 3)
+            self.assertEqual(cart.total_price, Decimal('75.00'))
+
+    def test_reconcile_command_rebuilds_counters(self):
+        cart = Cart.objects.create(user=self.user, item_count=99, subtotal=Decimal('1.00'))
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        call_command('reconcile_cart_totals', stdout=StringIO())
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (2, Decimal('50.00')))
+
+
+class AsyncCartViewTests(TestCase):
+    """Tests for the cart JSON endpoints (sync under WSGI, async under ASGI)."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async-buyer', password='secret-pass-123')
+        self.product = make_product(Category.objects.create(name='كابلات'), price='15.00')
+
+    async def test_ajax_add_and_summary(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('orders:add_to_cart', args=[self.product.pk])
+        for expected in (1, 2):
+            response = await self.async_client.post(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+            self.assertEqual(response.json()['cart_total'], expected)
+
+        response = await self.async_client.get(reverse('orders:cart_summary'))
+        self.assertEqual(response.json(), {'item_count': 2, 'subtotal': '30.00', 'line_count': 1})
+
+    async def test_requires_login(self):
+        response = await self.async_client.get(reverse('orders:cart_summary'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_views(self):
+        async def auser():
+            return self.user
+
+        factory = RequestFactory()
+        for expected in (1, 2):
+            request = factory.post('/', headers={'X-Requested-With': 'XMLHttpRequest'})
+            request.user, request.auser, request._messages = self.user, auser, CookieStorage(request)
+            response = await aadd_to_cart(request, self.product.pk)
+            self.assertEqual(json.loads(response.content)['cart_total'], expected)
+
+        request = factory.get('/')
+        request.user, request.auser = self.user, auser
+        response = await acart_summary(request)
+        self.assertEqual(json.loads(response.content), {'item_count': 2, 'subtotal': '30.00', 'line_count': 1})
+
+    async def test_async_add_is_atomic(self):
+        async def auser():
+            return self.user
+
+        request = RequestFactory().post('/')
+        request.user, request.auser, request._messages = self.user, auser, CookieStorage(request)
+        with mock.patch.object(Cart, 'adjust_totals', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                await aadd_to_cart(request, self.product.pk)
+        self.assertFalse(await CartItem.objects.filter(cart__user=self.user).aexists())
+
+
+class CartBadgeTests(TestCase):
+    """Tests for the cached navbar cart badge."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('badge', password='secret-pass-123')
+        self.product = make_product(Category.objects.create(name='شاشات'))
+        self.client.force_login(self.user)
+
+    def cart_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in ctx.captured_queries if 'orders_cart' in q['sql']]
+
+    def test_repeat_page_views_skip_cart_queries(self):
+        self.client.get(reverse('core:home'))
+        response, queries = self.cart_queries(reverse('core:home'))
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['cart_badge_count'], 0)
+
+    def test_cart_changes_invalidate_badge(self):
+        self.client.get(reverse('core:home'))
+        self.client.post(reverse('orders:add_to_cart', args=[self.product.pk]))
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(response.context['cart_badge_count'], 1)
+
+
+class RecommendationTests(TestCase):
+    """Tests for the offline co-purchase recommendation build."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reco', password='secret-pass-123')
+        category = Category.objects.create(name='ملحقات')
+        self.products = [make_product(category, name=f'منتج {i}') for i in range(4)]
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_path = Path(state_dir.name) / 'copurchase.npz'
+
+    def order(self, *products):
+        order = Order.objects.create(
+            user=self.user, full_name='x', address='y', phone='1', total_price=Decimal('0')
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for product in products
+        )
+
+    def neighbours(self, product):
+        return list(product.recommendations.values_list('recommended_id', flat=True))
+
+    def test_ranks_products_bought_together(self):
+        a, b, c, d = self.products
+        self.order(a, b)
+        self.order(a, b)
+        self.order(a, c)
+        self.order(d)
+        build_recommendations(state_path=self.state_path)
+
+        self.assertEqual(self.neighbours(a), [b.pk, c.pk])
+        self.assertEqual(self.neighbours(c), [a.pk])
+        self.assertEqual(self.neighbours(d), [])
+
+    def test_incremental_run_only_rewrites_changed_products(self):
+        a, b, c, d = self.products
+        self.order(a, b)
+        build_recommendations(state_path=self.state_path)
+
+        self.order(c, d)
+        updated, _ = build_recommendations(state_path=self.state_path)
+        self.assertEqual(updated, 2)
+        self.assertEqual(self.neighbours(a), [b.pk])
+        self.assertEqual(self.neighbours(c), [d.pk])
+
+        full_updated, _ = build_recommendations(full=True, state_path=self.state_path)
+        self.assertEqual(full_updated, 4)
+        self.assertEqual(RelatedProduct.objects.count(), 4)
+
+    def stored(self):
+        return sorted(RelatedProduct.objects.values_list('product_id', 'recommended_id', 'rank', 'score'))
+
+    def test_incremental_run_matches_full_rebuild(self):
+        a, b, c, d = self.products
+        self.order(a, b)
+        self.order(a, c)
+        self.order(b, c)
+        cancelled = Order.objects.latest('pk')
+        build_recommendations(state_path=self.state_path)
+
+        # a is bought more often: b's score for a drops though b is in no new order.
+        self.order(a, d)
+        self.order(a, d)
+        transition_orders(Order.objects.filter(pk=cancelled.pk), 'cancelled')
+        build_recommendations(state_path=self.state_path)
+        incremental = self.stored()
+        # The overlap re-reads the same orders without counting them twice.
+        build_recommendations(state_path=self.state_path)
+        self.assertEqual(self.stored(), incremental)
+
+        build_recommendations(full=True, state_path=self.state_path)
+        self.assertEqual(incremental, self.stored())
+        self.assertEqual(self.neighbours(c), [a.pk])
+
+    def test_product_page_prefers_recommendations(self):
+        a, b, c, d = self.products
+        self.order(a, c)
+        build_recommendations(state_path=self.state_path)
+
+        response = self.client.get(reverse('core:product_detail', args=[a.pk]))
+        self.assertEqual([p.pk for p in response.context['related_products']], [c.pk])
+        response = self.client.get(reverse('core:product_detail', args=[b.pk]))
+        self.assertEqual(len(response.context['related_products']), 3)
+
+
+class OrderExportTests(TestCase):
+    """Tests for the streaming CSV order export in the admin."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('finance', 'f@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+        category = Category.objects.create(name='حواسيب')
+        self.laptop = make_product(category, name='حاسوب', price='1500.00')
+        self.mouse = make_product(category, name='فأرة', price='25.00')
+        self.shipped = self.order('shipped', (self.laptop, 1), (self.mouse, 2))
+        self.pending = self.order('pending', (self.mouse, 1))
+        self.empty = self.order('cancelled')
+
+    def order(self, status, *lines):
+        order = Order.objects.create(
+            user=self.admin, full_name='عميل', address='الرياض', phone='050', status=status,
+            total_price=sum((product.price * quantity for product, quantity in lines), Decimal('0')),
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for product, quantity in lines
+        )
+        return order
+
+    def rows(self, response):
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(content.splitlines()))
+
+    def test_export_url_follows_changelist_filters(self):
+        url = reverse('admin:orders_order_export')
+        rows = self.rows(self.client.get(url))
+        self.assertEqual([int(row['order_id']) for row in rows], [
+            self.shipped.pk, self.shipped.pk, self.pending.pk, self.empty.pk,
+        ])
+        self.assertEqual(rows[1]['product'], 'فأرة')
+        self.assertEqual(rows[1]['line_total'], '50.00')
+        self.assertEqual(rows[3]['product'], '')
+
+        rows = self.rows(self.client.get(url, {'status__exact': 'shipped'}))
+        self.assertEqual({int(row['order_id']) for row in rows}, {self.shipped.pk})
+        self.assertEqual(rows[0]['status'], 'تم الشحن')
+
+    def test_query_count_does_not_grow_with_orders(self):
+        url = reverse('admin:orders_order_export')
+        with CaptureQueriesContext(connection) as few:
+            self.rows(self.client.get(url))
+        for _ in range(5):
+            self.order('delivered', (self.laptop, 1), (self.mouse, 1))
+        with CaptureQueriesContext(connection) as many:
+            self.rows(self.client.get(url))
+        self.assertEqual(len(few), len(many))
+
+    def test_admin_action_exports_selected_orders(self):
+        response = self.client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'export_as_csv',
+            '_selected_action': [self.pending.pk],
+        })
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = self.rows(response)
+        self.assertEqual([(int(row['order_id']), row['quantity']) for row in rows], [(self.pending.pk, '1')])
+
+    def test_changelist_links_to_export(self):
+        response = self.client.get(reverse('admin:orders_order_changelist'), {'status__exact': 'pending'})
+        self.assertContains(response, reverse('admin:orders_order_export') + '?status__exact=pending')
+
+    async def test_asgi_streams_asynchronously(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('admin:orders_order_export'))
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 4)  # header + one chunk per order
+
+    def test_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(reverse('admin:orders_order_export'))
+        self.assertEqual(response.status_code, 302)
+
+
+class AdminQueryCountTests(TestCase):
+    """Changelists and inlines run a fixed number of queries whatever the row count."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'b@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+        self.category = Category.objects.create(name='طابعات')
+        self.add_rows()
+
+    def add_rows(self):
+        for _ in range(3):
+            user = User.objects.create_user(f'buyer{User.objects.count()}')
+            product = make_product(self.category)
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+            order = Order.objects.create(user=user, full_name='x', address='y', phone='1', total_price=product.price)
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+    def count_queries(self, url):
+        self.client.get(url)  # Warm per-process caches such as content types.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url_for):
+        before = self.count_queries(url_for())
+        self.add_rows()
+        self.assertEqual(self.count_queries(url_for()), before)
+
+    def test_changelists(self):
+        for model in ('order', 'orderitem', 'cart', 'cartitem'):
+            with self.subTest(model=model):
+                self.assertConstantQueries(lambda: reverse(f'admin:orders_{model}_changelist'))
+
+    def test_change_form_inlines(self):
+        order = Order.objects.first()
+        cart = Cart.objects.first()
+        for model, obj, related in (('order', order, OrderItem), ('cart', cart, CartItem)):
+            with self.subTest(model=model):
+                url = reverse(f'admin:orders_{model}_change', args=[obj.pk])
+                before = self.count_queries(url)
+                for product in [make_product(self.category) for _ in range(3)]:
+                    if related is OrderItem:
+                        OrderItem.objects.create(order=obj, product=product, quantity=1, price=product.price)
+                    else:
+                        CartItem.objects.create(cart=obj, product=product, quantity=1)
+                self.assertEqual(self.count_queries(url), before)
+
+    def test_cart_changelist_shows_line_count(self):
+        response = self.client.get(reverse('admin:orders_cart_changelist'))
+        self.assertEqual([cart.line_count for cart in response.context['cl'].result_list], [1, 1, 1])
+
+
+class OrderLifecycleTests(TestCase):
+    """Tests for order status transitions and their history."""
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('ops', 'o@example.com', 'secret-pass-123')
+        self.customer = User.objects.create_user('buyer', password='secret-pass-123')
+
+    def orders(self, status, count=1):
+        Order.objects.bulk_create(
+            Order(user=self.customer, full_name='x', address='y', phone='1', status=status)
+            for _ in range(count)
+        )
+        return list(Order.objects.filter(status=status).order_by('pk'))
+
+    def test_bulk_transition_skips_illegal_moves_and_logs_history(self):
+        pending = self.orders('pending', 3)
+        processing = self.orders('processing', 2)
+        delivered = self.orders('delivered')
+
+        with CaptureQueriesContext(connection) as queries:
+            result = transition_orders(Order.objects.all(), 'cancelled', user=self.staff)
+
+        self.assertEqual((result.changed, result.skipped), (5, 1))
+        # SELECT, one UPDATE per source status, one INSERT and the restock
+        # SELECT (no items, so no UPDATE), plus savepoint bookkeeping.
+        self.assertLessEqual(len([q for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]), 5)
+        self.assertEqual(Order.objects.get(pk=delivered[0].pk).status, 'delivered')
+        self.assertEqual(
+            sorted(OrderStatusHistory.objects.values_list('order_id', 'from_status', 'changed_by')),
+            sorted([(o.pk, 'pending', self.staff.pk) for o in pending]
+                   + [(o.pk, 'processing', self.staff.pk) for o in processing]),
+        )
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.orders('processing', 5)
+        with CaptureQueriesContext(connection) as few:
+            transition_orders(Order.objects.all(), 'shipped')
+        self.orders('processing', 50)
+        with CaptureQueriesContext(connection) as many:
+            transition_orders(Order.objects.all(), 'delivered')
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Order.objects.filter(status='delivered').count(), 5)
+
+    def test_single_transition_rejects_illegal_jump(self):
+        order = self.orders('delivered')[0]
+        with self.assertRaises(InvalidTransitionError):
+            transition_order(order, 'pending')
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+    def test_admin_action_reports_changed_and_skipped(self):
+        self.client.force_login(self.staff)
+        orders = self.orders('pending', 2) + self.orders('cancelled')
+        response = self.client.post(reverse('admin:orders_order_changelist'), {
+            'action': 'mark_as_processing',
+            '_selected_action': [order.pk for order in orders],
+        }, follow=True)
+        messages = [str(m) for m in response.context['messages']]
+        self.assertIn('تم تحديث 2 طلب إلى "قيد المعالجة"', messages)
+        self.assertIn('تم تجاهل 1 طلب لا يمكن نقله إلى "قيد المعالجة"', messages)
+
+    def test_admin_form_validates_status_and_records_change(self):
+        self.client.force_login(self.staff)
+        order = self.orders('shipped')[0]
+        url = reverse('admin:orders_order_change', args=[order.pk])
+        data = {
+            'user': self.customer.pk, 'status': 'pending', 'total_price': '0', 'full_name': 'x',
+            'address': 'y', 'phone': '1',
+            'items-TOTAL_FORMS': 0, 'items-INITIAL_FORMS': 0,
+            'status_history-TOTAL_FORMS': 0, 'status_history-INITIAL_FORMS': 0,
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['adminform'].form.errors['status'])
+
+        self.client.post(url, {**data, 'status': 'delivered'})
+        history = OrderStatusHistory.objects.get(order=order)
+        self.assertEqual((history.from_status, history.to_status), ('shipped', 'delivered'))
+
+    def test_customer_cancel_keeps_order(self):
+        self.client.force_login(self.customer)
+        pending, = self.orders('pending')
+        shipped, = self.orders('shipped')
+        self.client.post(reverse('orders:cancel_order', args=[shipped.pk]))
+        self.client.post(reverse('orders:cancel_order', args=[pending.pk]))
+        self.assertEqual(Order.objects.get(pk=shipped.pk).status, 'shipped')
+        self.assertEqual(Order.objects.get(pk=pending.pk).status, 'cancelled')
+        self.assertEqual(OrderStatusHistory.objects.get().changed_by, self.customer)
+
+    def test_cancelling_returns_stock(self):
+        category = Category.objects.create(name='هواتف')
+        products = [make_product(category, name=f'منتج {i}', stock=5) for i in range(2)]
+        cart = Cart.objects.create(user=self.customer)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        order = place_order(cart, self.customer, Order(full_name='x', address='y', phone='1'))
+        self.assertEqual([p.stock for p in Product.objects.filter(pk__in=[p.pk for p in products])], [3, 3])
+
+        self.client.force_login(self.customer)
+        cache.set('products:category-summary', ['stale'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('orders:cancel_order', args=[order.pk]))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertEqual([p.stock for p in Product.objects.filter(pk__in=[p.pk for p in products])], [5, 5])
+        self.assertIsNone(cache.get('products:category-summary'))
+
+        # Already cancelled: nothing more goes back.
+        transition_orders(Order.objects.filter(pk=order.pk), 'cancelled')
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock, 5)
+
+    def test_admin_change_form_cancel_returns_stock(self):
+        product = make_product(Category.objects.create(name='هواتف'), stock=5)
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=product, quantity=2)
+        order = place_order(cart, self.customer, Order(full_name='x', address='y', phone='1'))
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 3)
+
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin:orders_order_change', args=[order.pk]), {
+            'user': self.customer.pk, 'status': 'cancelled', 'total_price': order.total_price,
+            'full_name': 'x', 'address': 'y', 'phone': '1',
+            'items-TOTAL_FORMS': 0, 'items-INITIAL_FORMS': 0,
+            'status_history-TOTAL_FORMS': 0, 'status_history-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 5)
+        history = OrderStatusHistory.objects.get(order=order)
+        self.assertEqual((history.from_status, history.to_status, history.changed_by), ('pending', 'cancelled', self.staff))
+
+
+class SalesRollupTests(TestCase):
+    """Tests for the daily sales rollups and the admin dashboard."""
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser('sales', 's@example.com', 'secret-pass-123')
+        self.phones = Category.objects.create(name='هواتف')
+        self.cables = Category.objects.create(name='كابلات')
+        self.phone = make_product(self.phones, name='هاتف', price='1000.00')
+        self.cable = make_product(self.cables, name='كابل', price='20.00')
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.first = self.order(self.yesterday, (self.phone, 1), (self.cable, 2))
+        self.second = self.order(self.today, (self.cable, 3))
+
+    def order(self, day, *lines, status='pending'):
+        order = Order.objects.create(
+            user=self.staff, full_name='x', address='y', phone='1', status=status,
+            total_price=sum((product.price * quantity for product, quantity in lines), Decimal('0')),
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for product, quantity in lines
+        )
+        moment = timezone.make_aware(datetime.combine(day, time(12)))
+        Order.objects.filter(pk=order.pk).update(created_at=moment)
+        return order
+
+    def product_rows(self):
+        return sorted(DailyProductSales.objects.values_list('day', 'product__name', 'units', 'revenue', 'orders'))
+
+    def test_rollup_totals_per_product_category_and_status(self):
+        self.assertEqual(rollup_sales(), (2, 2))
+        self.assertEqual(self.product_rows(), sorted([
+            (self.yesterday, 'هاتف', 1, Decimal('1000.00'), 1),
+            (self.yesterday, 'كابل', 2, Decimal('40.00'), 1),
+            (self.today, 'كابل', 3, Decimal('60.00'), 1),
+        ]))
+        self.assertEqual(
+            DailyCategorySales.objects.get(day=self.yesterday, category=self.cables).revenue, Decimal('40.00')
+        )
+        status = DailyStatusSales.objects.get(day=self.yesterday, status='pending')
+        self.assertEqual((status.orders, status.units, status.revenue), (1, 3, Decimal('1040.00')))
+
+    def test_incremental_runs_are_idempotent_and_follow_status_changes(self):
+        rollup_sales()
+        before = self.product_rows()
+        rollup_sales()
+        self.assertEqual(self.product_rows(), before)
+
+        transition_orders(Order.objects.filter(pk=self.first.pk), 'cancelled')
+        self.order(self.today, (self.phone, 2))
+        rollup_sales()
+        self.assertEqual(self.product_rows(), sorted([
+            (self.today, 'كابل', 3, Decimal('60.00'), 1),
+            (self.today, 'هاتف', 2, Decimal('2000.00'), 1),
+        ]))
+        self.assertEqual(DailyStatusSales.objects.get(day=self.yesterday).status, 'cancelled')
+
+    def test_dashboard_reads_rollups_only(self):
+        call_command('rollup_sales', stdout=StringIO())
+        self.client.force_login(self.staff)
+        url = reverse('admin:orders_sales_dashboard')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['revenue'], Decimal('1100.00'))
+        self.assertEqual(response.context['top_products'][0]['product__name'], 'هاتف')
+        self.assertFalse([q for q in queries if '"orders_order"' in q['sql'] or '"orders_orderitem"' in q['sql']])
+
+        self.order(self.today, (self.phone, 5))
+        with CaptureQueriesContext(connection) as more:
+            self.client.get(url, {'days': 7})
+        self.assertEqual(len(more), len(queries))
@@ -1,11 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'orders'
 
+# Async views only under ASGI; under WSGI they would pay a thread hop per request.
+if settings.ASYNC_VIEWS:
+    add_to_cart, cart_summary = views.aadd_to_cart, views.acart_summary
+else:
+    add_to_cart, cart_summary = views.add_to_cart, views.cart_summary
+
 urlpatterns = [
     path('cart/', views.cart_view, name='cart'),
-    path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
+    path('cart/summary/', cart_summary, name='cart_summary'),
+    path('cart/add/<int:product_id>/', add_to_cart, name='add_to_cart'),
     path('cart/update/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
     path('cart/remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('checkout/', views.checkout_view, name='checkout'),
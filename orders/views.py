@@ -1,11 +1,20 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order
 from .forms import CheckoutForm
+from .lifecycle import InvalidTransitionError, transition_order
+from .services import (
+    CheckoutError, aget_cart_badge_count, ainvalidate_cart_badge, get_cart_badge_count, invalidate_cart_badge,
+    place_order,
+)
 from products.models import Product
+from core.routers import primary_reads
 
 
 def get_or_create_cart(user):
@@ -14,11 +23,25 @@ def get_or_create_cart(user):
     return cart
 
 
+def add_cart_item(user, product):
+    """Add one ``product`` to the user's cart; the item and the cart counters change together."""
+    with transaction.atomic():
+        cart = get_or_create_cart(user)
+        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': 1})
+        if not created:
+            # Incremented in the database, so concurrent adds each count once.
+            CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + 1)
+        cart.adjust_totals(1, product.price)
+    return cart
+
+
 @login_required
+@primary_reads
 def cart_view(request):
     """Display the shopping cart."""
     cart = get_or_create_cart(request.user)
-    return render(request, 'orders/cart.html', {'cart': cart})
+    items = cart.items.select_related('product__category')
+    return render(request, 'orders/cart.html', {'cart': cart, 'items': items})
 
 
 @login_required
@@ -26,18 +49,24 @@ def cart_view(request):
 def add_to_cart(request, product_id):
     """Add a product to the cart."""
     product = get_object_or_404(Product, pk=product_id)
-    cart = get_or_create_cart(request.user)
-    
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': 1}
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
-    
+    cart = add_cart_item(request.user, product)
+    invalidate_cart_badge(request.user)
+    return added_to_cart_response(request, product, cart)
+
+
+@login_required
+@require_POST
+async def aadd_to_cart(request, product_id):
+    """Async ``add_to_cart``, for ASGI deployments (``settings.ASYNC_VIEWS``)."""
+    product = await aget_object_or_404(Product, pk=product_id)
+    user = await request.auser()
+    # The async ORM has no transactions: write in one atomic block on a thread.
+    cart = await sync_to_async(add_cart_item)(user, product)
+    await ainvalidate_cart_badge(user)
+    return added_to_cart_response(request, product, cart)
+
+
+def added_to_cart_response(request, product, cart):
     messages.success(request, f'تم إضافة "{product.name}" إلى السلة')
     
     # Return JSON for AJAX requests
@@ -51,25 +80,56 @@ def add_to_cart(request, product_id):
     return redirect('orders:cart')
 
 
+def cart_summary_response(cart, line_count):
+    return JsonResponse({
+        'item_count': cart.item_count if cart else 0,
+        'subtotal': str(cart.subtotal if cart else '0.00'),
+        'line_count': line_count,
+    })
+
+
+@login_required
+def cart_summary(request):
+    """Return the cart counters as JSON (navbar badge and mini cart)."""
+    cart = Cart.objects.filter(user=request.user).only('item_count', 'subtotal').first()
+    return cart_summary_response(cart, get_cart_badge_count(request.user))
+
+
+@login_required
+async def acart_summary(request):
+    """Async ``cart_summary``, for ASGI deployments (``settings.ASYNC_VIEWS``)."""
+    user = await request.auser()
+    cart = await Cart.objects.filter(user=user).only('item_count', 'subtotal').afirst()
+    return cart_summary_response(cart, await aget_cart_badge_count(user))
+
+
 @login_required
 @require_POST
 def update_cart_item(request, item_id):
     """Update quantity of a cart item."""
-    cart_item = get_object_or_404(CartItem, pk=item_id, cart__user=request.user)
-    
-    quantity = request.POST.get('quantity', 1)
     try:
-        quantity = int(quantity)
+        quantity = int(request.POST.get('quantity', 1))
+    except ValueError:
+        messages.error(request, 'كمية غير صالحة')
+        return redirect('orders:cart')
+    
+    # The item row and the cart counters change together or not at all.
+    with transaction.atomic():
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('cart', 'product').select_for_update(of=('self',)),
+            pk=item_id, cart__user=request.user,
+        )
+        previous_quantity = cart_item.quantity
         if quantity > 0:
             cart_item.quantity = quantity
             cart_item.save()
+            cart_item.cart.adjust_totals(quantity - previous_quantity, cart_item.product.price)
             messages.success(request, 'تم تحديث الكمية')
         else:
             cart_item.delete()
+            cart_item.cart.adjust_totals(-previous_quantity, cart_item.product.price)
             messages.success(request, 'تم حذف المنتج من السلة')
-    except ValueError:
-        messages.error(request, 'كمية غير صالحة')
-    
+    invalidate_cart_badge(request.user)
     return redirect('orders:cart')
 
 
@@ -77,43 +137,37 @@ def update_cart_item(request, item_id):
 @require_POST
 def remove_from_cart(request, item_id):
     """Remove an item from the cart."""
-    cart_item = get_object_or_404(CartItem, pk=item_id, cart__user=request.user)
-    product_name = cart_item.product.name
-    cart_item.delete()
-    messages.success(request, f'تم حذف "{product_name}" من السلة')
+    with transaction.atomic():
+        cart_item = get_object_or_404(
+            CartItem.objects.select_related('cart', 'product').select_for_update(of=('self',)),
+            pk=item_id, cart__user=request.user,
+        )
+        cart_item.delete()
+        cart_item.cart.adjust_totals(-cart_item.quantity, cart_item.product.price)
+    invalidate_cart_badge(request.user)
+    messages.success(request, f'تم حذف "{cart_item.product.name}" من السلة')
     return redirect('orders:cart')
 
 
 @login_required
+@primary_reads
 def checkout_view(request):
     """Handle checkout process."""
     cart = get_or_create_cart(request.user)
     
-    if not cart.items.exists():
+    if not cart.item_count:
         messages.warning(request, 'السلة فارغة. أضف منتجات قبل إتمام الشراء.')
         return redirect('orders:cart')
     
     if request.method == 'POST':
         form = CheckoutForm(request.POST)
         if form.is_valid():
-            # Create the order
-            order = form.save(commit=False)
-            order.user = request.user
-            order.total_price = cart.total_price
-            order.save()
-            
-            # Create order items from cart items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-            
-            # Clear the cart
-            cart.items.all().delete()
-            
+            try:
+                order = place_order(cart, request.user, form.save(commit=False))
+            except CheckoutError as exc:
+                messages.error(request, str(exc))
+                return redirect('orders:cart')
+
             messages.success(request, 'تم إنشاء طلبك بنجاح!')
             return redirect('orders:order_detail', order_id=order.pk)
     else:
@@ -126,20 +180,21 @@ def checkout_view(request):
     return render(request, 'orders/checkout.html', {
         'form': form,
         'cart': cart,
+        'items': cart.items.select_related('product'),
     })
 
 
 @login_required
 def order_detail_view(request, order_id):
     """Display order confirmation/details."""
-    order = get_object_or_404(Order, pk=order_id, user=request.user)
+    order = get_object_or_404(Order.objects.prefetch_related('items__product'), pk=order_id, user=request.user)
     return render(request, 'orders/order_detail.html', {'order': order})
 
 
 @login_required
 def order_list_view(request):
     """Display user's order history."""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    orders = Order.objects.filter(user=request.user).prefetch_related('items__product').order_by('-created_at')
     return render(request, 'orders/order_list.html', {'orders': orders})
 
 
@@ -147,15 +202,17 @@ def order_list_view(request):
 def cancel_order(request, order_id):
     """Cancel a pending order."""
     order = get_object_or_404(Order, pk=order_id, user=request.user)
-    
-    # Only allow cancelling pending orders
-    # assuming 'pending' is the status for new orders, check model first?
-    # For now, we'll assume a purely status-based check or just allow if recent?
-    # Let's check if the status field exists or if we should just allow deleting.
-    # The requirement says 'CRUD', so deleting the order is acceptable.
-    
+    # Customers may only cancel before the store starts processing the order.
+    if order.status != 'pending':
+        messages.error(request, 'لا يمكن إلغاء هذا الطلب بعد بدء معالجته.')
+        return redirect('orders:order_detail', order_id=order.pk)
+
     if request.method == 'POST':
-        order.delete()
+        try:
+            transition_order(order, 'cancelled', user=request.user)
+        except InvalidTransitionError as exc:
+            messages.error(request, str(exc))
+            return redirect('orders:order_detail', order_id=order.pk)
         messages.success(request, 'تم إلغاء الطلب بنجاح.')
         return redirect('orders:order_list')
     
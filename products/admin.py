@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
+from .images import variant_url
 from .models import Category, Product, Review
 
 
@@ -10,6 +11,7 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'rating_stars', 'created_at')
     list_filter = ('rating', 'created_at')
     search_fields = ('product__name', 'user__username', 'comment')
+    list_select_related = ('product', 'user')
     ordering = ('-created_at',)
     
     def rating_stars(self, obj):
@@ -29,16 +31,19 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description', 'product_count')
     search_fields = ('name', 'description')
     ordering = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_product_counts()
     
     def product_count(self, obj):
         """Display the number of products in this category."""
-        count = obj.products.count()
         return format_html(
             '<span style="color: {};">{}</span>',
-            '#28a745' if count > 0 else '#dc3545',
-            count
+            '#28a745' if obj.product_count > 0 else '#dc3545',
+            obj.product_count
         )
     product_count.short_description = 'عدد المنتجات'
+    product_count.admin_order_field = 'product_count'
 
 
 @admin.register(Product)
@@ -47,14 +52,15 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('image_thumbnail', 'name', 'category', 'price_display', 'stock_status', 'created_at')
     list_display_links = ('image_thumbnail', 'name')
     list_filter = ('category', 'created_at', 'stock')
-    search_fields = ('name', 'description', 'category__name')
+    search_fields = ('name', 'sku', 'description', 'category__name')
+    list_select_related = ('category',)
     list_per_page = 20
     ordering = ('-created_at',)
     readonly_fields = ('image_preview', 'created_at', 'updated_at')
     
     fieldsets = (
         ('معلومات المنتج', {
-            'fields': ('name', 'description', 'category')
+            'fields': ('name', 'sku', 'description', 'category')
         }),
         ('السعر والمخزون', {
             'fields': ('price', 'stock')
@@ -72,8 +78,8 @@ class ProductAdmin(admin.ModelAdmin):
         """Display product image as thumbnail in list view."""
         if obj.image:
             return format_html(
-                '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 8px;" />',
-                obj.image.url
+                '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 8px;" loading="lazy" />',
+                variant_url(obj, 100)
             )
         return mark_safe(
             '<span style="display: inline-block; width: 50px; height: 50px; background: #f0f0f0; '
@@ -86,7 +92,7 @@ class ProductAdmin(admin.ModelAdmin):
         if obj.image:
             return format_html(
                 '<img src="{}" style="max-width: 300px; max-height: 300px; border-radius: 12px;" />',
-                obj.image.url
+                variant_url(obj, 300)
             )
         return 'لا توجد صورة'
     image_preview.short_description = 'معاينة الصورة'
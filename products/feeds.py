@@ -0,0 +1,150 @@
+"""
+Catalog feed export for comparison-shopping sites.
+
+Products are read with ``values()`` and ``.iterator(chunk_size=...)`` (or
+``aiterator`` under ASGI) and written one row at a time as CSV, JSON Lines
+or XML, so memory stays flat whatever the catalog size. ``since`` limits
+the export to products updated at or after that moment, so rows sharing
+the timestamp of a previous run's last row are sent again rather than
+missed; consumers de-duplicate them by ``id``. Passing that last row's
+``id`` as ``after_id`` too resumes exactly after it, on the
+``(updated_at, id)`` order. Deleted products are not reported.
+"""
+import csv
+import datetime
+import json
+from xml.sax.saxutils import escape
+
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Product
+
+FEED_CHUNK_SIZE = 2000
+FEED_FIELDS = (
+    'id', 'sku', 'name', 'category', 'price', 'currency', 'stock', 'availability',
+    'url', 'image_url', 'updated_at',
+)
+FEED_CURRENCY = 'SAR'
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+
+def parse_since(value):
+    """Parse an ISO date or datetime (naive values use the current time zone)."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value!r}')
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def feed_queryset(since=None, after_id=None):
+    """
+    Products to export, oldest change first so incremental runs can resume
+    from ``since`` (inclusive) or from the ``(since, after_id)`` cursor.
+    """
+    products = Product.objects.order_by('updated_at', 'id').values(
+        'id', 'sku', 'name', 'category__name', 'price', 'stock', 'image', 'updated_at',
+    )
+    if since is not None and after_id is not None:
+        products = products.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=after_id))
+    elif since is not None:
+        products = products.filter(updated_at__gte=since)
+    return products
+
+
+def feed_item(row, base_url):
+    """Turn a ``values()`` row into a feed record with absolute URLs."""
+    storage = Product._meta.get_field('image').storage
+    return {
+        'id': row['id'],
+        'sku': row['sku'] or '',
+        'name': row['name'],
+        'category': row['category__name'],
+        'price': str(row['price']),
+        'currency': FEED_CURRENCY,
+        'stock': row['stock'],
+        'availability': 'in stock' if row['stock'] > 0 else 'out of stock',
+        'url': base_url + reverse('core:product_detail', args=[row['id']]),
+        'image_url': base_url + storage.url(row['image']) if row['image'] else '',
+        'updated_at': row['updated_at'].isoformat(),
+    }
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+class CSVFeed:
+    def __init__(self):
+        self.writer = csv.writer(_Echo())
+
+    def header(self):
+        return self.writer.writerow(FEED_FIELDS)
+
+    def item(self, item):
+        return self.writer.writerow([item[field] for field in FEED_FIELDS])
+
+    def footer(self):
+        return ''
+
+
+class JSONLinesFeed:
+    def header(self):
+        return ''
+
+    def item(self, item):
+        return json.dumps(item, ensure_ascii=False) + '\n'
+
+    def footer(self):
+        return ''
+
+
+class XMLFeed:
+    def header(self):
+        return '<?xml version="1.0" encoding="UTF-8"?>\n<products>\n'
+
+    def item(self, item):
+        fields = ''.join(f'<{field}>{escape(str(item[field]))}</{field}>' for field in FEED_FIELDS)
+        return f'  <product>{fields}</product>\n'
+
+    def footer(self):
+        return '</products>\n'
+
+
+FEED_WRITERS = {
+    'csv': CSVFeed,
+    'jsonl': JSONLinesFeed,
+    'xml': XMLFeed,
+}
+
+
+def stream_feed(feed_format, base_url, since=None, after_id=None, chunk_size=FEED_CHUNK_SIZE):
+    """Yield the feed as text chunks."""
+    writer = FEED_WRITERS[feed_format]()
+    yield writer.header()
+    for row in feed_queryset(since, after_id).iterator(chunk_size=chunk_size):
+        yield writer.item(feed_item(row, base_url))
+    yield writer.footer()
+
+
+async def astream_feed(feed_format, base_url, since=None, after_id=None, chunk_size=FEED_CHUNK_SIZE):
+    """Async ``stream_feed``, for ``StreamingHttpResponse`` under ASGI."""
+    writer = FEED_WRITERS[feed_format]()
+    yield writer.header()
+    async for row in feed_queryset(since, after_id).aiterator(chunk_size=chunk_size):
+        yield writer.item(feed_item(row, base_url))
+    yield writer.footer()
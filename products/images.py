@@ -0,0 +1,160 @@
+"""
+Resized product photo variants.
+
+Each product photo is rendered at a few fixed widths, as WebP and as JPEG,
+next to the original under ``products/variants/``. The widths that exist
+are recorded in ``Product.image_variants`` so templates can build
+``srcset`` attributes without touching storage.
+
+Variants are built after the saving transaction commits, on a background
+thread unless ``PRODUCT_IMAGE_VARIANTS_ASYNC`` is false.
+"""
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core.page_cache import invalidate_product_pages
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (160, 320, 640, 1024)
+VARIANT_DIR = 'variants'
+# extension -> (Pillow format, save options)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def variant_name(source, width, ext):
+    """Storage name of the ``width`` pixel ``ext`` variant of ``source``."""
+    directory, filename = posixpath.split(source)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, VARIANT_DIR, f'{stem}-{width}w.{ext}')
+
+
+def variant_srcset(product, ext):
+    """``srcset`` value for the stored ``ext`` variants of ``product``, or ''."""
+    variants = product.image_variants or {}
+    storage = product.image.storage
+    return ', '.join(
+        f"{storage.url(variant_name(variants['source'], width, ext))} {width}w"
+        for width in variants.get('widths', [])
+    )
+
+
+def variant_url(product, width):
+    """URL of the smallest JPEG variant at least ``width`` wide, falling back to the original."""
+    variants = product.image_variants or {}
+    widths = variants.get('widths', [])
+    if not widths:
+        return product.image.url
+    chosen = next((w for w in widths if w >= width), widths[-1])
+    return product.image.storage.url(variant_name(variants['source'], chosen, 'jpg'))
+
+
+def _flatten(image):
+    """Drop transparency onto a white background (JPEG has no alpha)."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(source, storage):
+    """Write every variant of ``source`` and return the widths produced."""
+    with storage.open(source, 'rb') as handle:
+        original = Image.open(handle)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    original = _flatten(original)
+
+    # Never upscale; tiny photos still get a single re-encoded variant.
+    widths = [width for width in VARIANT_WIDTHS if width < original.width] or [original.width]
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        resized = original.resize((width, height), Image.LANCZOS)
+        for ext, (image_format, options) in VARIANT_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, image_format, **options)
+            name = variant_name(source, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+    return widths
+
+
+def delete_variants(source, widths, storage):
+    for width in widths:
+        for ext in VARIANT_FORMATS:
+            name = variant_name(source, width, ext)
+            if storage.exists(name):
+                storage.delete(name)
+
+
+def update_product_variants(product_id, force=False):
+    """
+    Bring the variants of one product in line with its current image.
+    Returns True when variants were (re)built or cleared.
+    """
+    product = Product.objects.filter(pk=product_id).only('image', 'image_variants').first()
+    if product is None:
+        return False
+    source = product.image.name or ''
+    stored = product.image_variants or {}
+    if not force and stored.get('source', '') == source:
+        return False
+
+    storage = product.image.storage
+    if stored.get('source') and stored['source'] != source:
+        delete_variants(stored['source'], stored.get('widths', []), storage)
+
+    variants = {}
+    if source:
+        try:
+            variants = {'source': source, 'widths': render_variants(source, storage)}
+        except OSError:
+            logger.warning('Could not build image variants for product %s (%s).', product_id, source, exc_info=True)
+    # Only record the result if the image did not change again meanwhile.
+    Product.objects.filter(pk=product_id, image=product.image.name).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    invalidate_product_pages([product_id])
+    return True
+
+
+def _run_in_background(product_id):
+    try:
+        update_product_variants(product_id)
+    except Exception:
+        logger.exception('Image variant build failed for product %s.', product_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+    return _executor
+
+
+def schedule_variants(product_id, using='default'):
+    """Build the variants of a product once the current transaction commits."""
+    if getattr(settings, 'PRODUCT_IMAGE_VARIANTS_ASYNC', True):
+        callback = lambda: _get_executor().submit(_run_in_background, product_id)  # noqa: E731
+    else:
+        callback = lambda: update_product_variants(product_id)  # noqa: E731
+    transaction.on_commit(callback, using=using)
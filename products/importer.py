@@ -0,0 +1,198 @@
+"""
+Bulk product import.
+
+Rows are streamed from CSV or JSON Lines and handled in batches: each row
+is validated with the model fields' own ``clean()``, categories are
+resolved through an in-memory name cache (created on first sight), and
+the batch is upserted on ``sku`` with one ``bulk_create(update_conflicts=
+True)`` per transaction. ``bulk_create`` sends no signals, so each batch
+is added to the search index directly, ``prices_changed`` is sent for it
+and the cached catalog pages are dropped once at the end.
+
+Rejected rows are reported with their line number and errors, never
+aborting the import. A batch the database refuses (``IntegrityError``) is
+rolled back, together with the categories it created in the name cache,
+and retried one row per savepoint so only the offending rows are rejected.
+"""
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import IntegrityError, transaction
+
+from core.page_cache import CATEGORIES_TAG, invalidate_page_tags
+from .models import Category, Product
+from .search import index_products
+from .signals import prices_changed
+from .summary import invalidate_category_summary
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FIELDS = ('sku', 'name', 'description', 'price', 'stock')
+IMAGE_UPLOAD_DIR = 'products/import'
+UPDATE_FIELDS = ['name', 'description', 'price', 'stock', 'category', 'updated_at']
+
+
+def read_rows(path, input_format=None):
+    """Yield ``(line_number, row_dict)`` from a CSV or JSON Lines file."""
+    path = Path(path)
+    input_format = input_format or ('jsonl' if path.suffix in ('.jsonl', '.ndjson') else 'csv')
+    with path.open(encoding='utf-8-sig', newline='') as handle:
+        if input_format == 'csv':
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as exc:
+                    row = {'__error__': f'JSON غير صالح: {exc}'}
+                yield line_number, row if isinstance(row, dict) else {'__error__': 'السطر ليس كائن JSON.'}
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    rejected: int = 0
+    categories_created: int = 0
+
+
+class ProductImporter:
+    """Validate and upsert product rows in batches."""
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, images_dir=None, reject_writer=None):
+        self.batch_size = batch_size
+        self.images_dir = Path(images_dir) if images_dir else None
+        self.reject_writer = reject_writer
+        self.result = ImportResult()
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS}
+        self.image_storage = Product._meta.get_field('image').storage
+        self.categories = {}
+        for pk, name in Category.objects.order_by('-pk').values_list('pk', 'name'):
+            # Lowest pk wins when names repeat.
+            self.categories[name] = pk
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        if self.result.imported or self.result.categories_created:
+            invalidate_category_summary()
+            invalidate_page_tags(CATEGORIES_TAG)
+        return self.result
+
+    def reject(self, line_number, row, errors):
+        self.result.rejected += 1
+        if self.reject_writer is not None:
+            self.reject_writer.writerow([line_number, '; '.join(errors), json.dumps(row, ensure_ascii=False)])
+
+    def clean_row(self, row):
+        """Return ``(values, errors)`` for one input row."""
+        if '__error__' in row:
+            return None, [row['__error__']]
+        values, errors = {}, []
+        for name, model_field in self.fields.items():
+            raw = row.get(name)
+            raw = raw.strip() if isinstance(raw, str) else raw
+            try:
+                values[name] = model_field.clean(raw, None)
+            except ValidationError as exc:
+                errors.append(f'{name}: {" ".join(exc.messages)}')
+        if not values.get('sku'):
+            errors.append('sku: هذا الحقل مطلوب.')
+        category = str(row.get('category') or '').strip()
+        if not category:
+            errors.append('category: هذا الحقل مطلوب.')
+        values['category'] = category
+        image = str(row.get('image') or '').strip()
+        if image and self.images_dir is not None:
+            source = (self.images_dir / image).resolve()
+            if self.images_dir.resolve() not in source.parents or not source.is_file():
+                errors.append(f'image: الملف غير موجود: {image}')
+            values['image'] = source
+        return values, errors
+
+    def category_id(self, name):
+        if name not in self.categories:
+            self.categories[name] = Category.objects.create(name=name).pk
+            self.result.categories_created += 1
+        return self.categories[name]
+
+    def store_image(self, source):
+        """Copy an image into media storage once; later imports reuse it."""
+        name = f'{IMAGE_UPLOAD_DIR}/{source.name}'
+        if not self.image_storage.exists(name):
+            with source.open('rb') as handle:
+                name = self.image_storage.save(name, File(handle, name=source.name))
+        return name
+
+    def import_batch(self, batch):
+        valid = {}
+        for line_number, row in batch:
+            values, errors = self.clean_row(row)
+            if errors:
+                self.reject(line_number, row, errors)
+                continue
+            if values['sku'] in valid:
+                # The last row for a SKU wins; one statement cannot update a row twice.
+                previous_line, previous_row, _ = valid.pop(values['sku'])
+                self.reject(previous_line, previous_row, [f'sku: تكرر في السطر {line_number}'])
+            valid[values['sku']] = (line_number, row, values)
+        if not valid:
+            return
+        try:
+            self.write_rows(valid)
+        except IntegrityError:
+            for sku, (line_number, row, values) in valid.items():
+                try:
+                    self.write_rows({sku: (line_number, row, values)})
+                except IntegrityError as exc:
+                    self.reject(line_number, row, [f'قاعدة البيانات: {exc}'])
+
+    def write_rows(self, valid):
+        """Upsert ``{sku: (line_number, row, values)}`` in one transaction (a savepoint when nested)."""
+        categories, categories_created = dict(self.categories), self.result.categories_created
+        try:
+            imported = self._write_rows(valid)
+        except IntegrityError:
+            # Categories created in the rolled back transaction no longer exist.
+            self.categories, self.result.categories_created = categories, categories_created
+            raise
+        self.result.imported += imported
+
+    def _write_rows(self, valid):
+        with_image, without_image = [], []
+        with transaction.atomic():
+            for _, _, values in valid.values():
+                values = dict(values)
+                image = values.pop('image', None)
+                product = Product(category_id=self.category_id(values.pop('category')), **values)
+                if image is not None:
+                    product.image = self.store_image(image)
+                    with_image.append(product)
+                else:
+                    without_image.append(product)
+            # Rows without a picture keep whatever image the product already has.
+            for products, update_fields in ((with_image, UPDATE_FIELDS + ['image']), (without_image, UPDATE_FIELDS)):
+                if products:
+                    Product.objects.bulk_create(
+                        products,
+                        batch_size=self.batch_size,
+                        update_conflicts=True,
+                        unique_fields=['sku'],
+                        update_fields=update_fields,
+                    )
+            imported = list(Product.objects.filter(sku__in=list(valid)).select_related('category'))
+            index_products(imported)
+            prices_changed.send(sender=Product, product_ids=[product.pk for product in imported], using='default')
+        return len(valid)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from products.images import update_product_variants
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Backfill the resized photo variants of existing products."""
+
+    help = 'Build the WebP/JPEG size variants of product photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'product_ids', nargs='*', type=int,
+            help='Only process these products (default: all products with a photo).',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild variants that are already up to date.',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+        ids = products.order_by('pk').values_list('pk', flat=True)
+        built = sum(update_product_variants(pk, force=options['force']) for pk in ids.iterator())
+        self.stdout.write(self.style.SUCCESS(f'Built image variants for {built} product(s).'))
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from products.feeds import FEED_CHUNK_SIZE, FEED_WRITERS, parse_since, stream_feed
+
+
+class Command(BaseCommand):
+    """Write the comparison-shopping feed to a file or stdout."""
+
+    help = 'Export every product (or those updated since a date) as CSV, JSON Lines or XML.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FEED_WRITERS), default='csv')
+        parser.add_argument('--output', help='File to write (default: stdout).')
+        parser.add_argument('--since', help='Only products updated at or after this ISO date/datetime.')
+        parser.add_argument(
+            '--after', type=int,
+            help='With --since, resume after the product with this id (the last row of the previous export).',
+        )
+        parser.add_argument(
+            '--base-url', default=settings.SITE_URL,
+            help='Prefix for product and image URLs (default: SITE_URL).',
+        )
+        parser.add_argument('--chunk-size', type=int, default=FEED_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = parse_since(options['since'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+        if options['after'] is not None and since is None:
+            raise CommandError('--after needs --since.')
+
+        chunks = stream_feed(
+            options['format'], options['base_url'].rstrip('/'), since=since, after_id=options['after'],
+            chunk_size=options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,51 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import IMPORT_BATCH_SIZE, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    """Bulk create or update products from a CSV or JSON Lines file."""
+
+    help = (
+        'Import products keyed on sku. Columns: sku, name, description, price, stock, '
+        'category (name; created when missing) and optional image (path under --images-dir).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file to import.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Default: guessed from the extension.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--images-dir', help='Directory the image column is relative to.')
+        parser.add_argument('--rejects', help='Write rejected rows (line, errors, data) to this CSV file.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        rows = read_rows(options['path'], options['format'])
+        started = time.monotonic()
+        try:
+            if options['rejects']:
+                with open(options['rejects'], 'w', encoding='utf-8', newline='') as rejects:
+                    writer = csv.writer(rejects)
+                    writer.writerow(['line', 'errors', 'data'])
+                    result = self._run(options, writer, rows)
+            else:
+                result = self._run(options, None, rows)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} products in {time.monotonic() - started:.1f}s '
+            f'({result.categories_created} new categories, {result.rejected} rejected rows).'
+        ))
+        if result.imported and options['images_dir']:
+            self.stdout.write('Run build_image_variants to render the resized photos.')
+
+    def _run(self, options, writer, rows):
+        importer = ProductImporter(
+            batch_size=options['batch_size'], images_dir=options['images_dir'], reject_writer=writer,
+        )
+        return importer.run(rows)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from products.models import Product
+from products.search import get_backend
+
+
+class Command(BaseCommand):
+    """Rebuild the full-text product search index from scratch."""
+
+    help = 'Clear and repopulate the product search index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products indexed per batch.',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database alias to rebuild the index on.',
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        batch_size = options['batch_size']
+        backend = get_backend(using)
+        products = Product.objects.using(using).select_related('category').order_by('pk')
+
+        total = 0
+        with transaction.atomic(using=using):
+            backend.clear()
+            batch = []
+            for product in products.iterator(chunk_size=batch_size):
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    backend.index(batch)
+                    total += len(batch)
+                    batch = []
+            backend.index(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} product(s) with {type(backend).__name__}.'
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Repair the denormalized rating aggregates stored on Product."""
+
+    help = 'Recompute review_count, rating_sum and the star histogram from the reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'product_ids', nargs='*', type=int,
+            help='Only repair these products (default: all products).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products recalculated per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+        batch_size = options['batch_size']
+        ids = list(products.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                total += Product.objects.filter(
+                    pk__in=ids[start:start + batch_size]
+                ).recalculate_rating_stats()
+        self.stdout.write(self.style.SUCCESS(f'Recalculated ratings for {total} product(s).'))
@@ -0,0 +1,106 @@
+"""
+Full-text search index for products.
+
+The DDL, the insert statements and the Arabic normalization below are a
+frozen copy of ``products.search`` as of this migration, so later changes
+to that module do not change what this migration does. Products added
+later are indexed by ``products.signals``; ``rebuild_search_index``
+rebuilds the index with the current code.
+"""
+import re
+
+from django.db import migrations
+
+SQLITE_TABLE = 'products_product_fts'
+POSTGRES_TABLE = 'products_product_search'
+
+DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+TATWEEL = '\u0640'
+LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و',
+    'ئ': 'ي',
+})
+
+INSERT_SQL = {
+    'sqlite': (
+        f'INSERT OR REPLACE INTO {SQLITE_TABLE} (rowid, name, description, category) '
+        'VALUES (%s, %s, %s, %s)'
+    ),
+    'postgresql': (
+        f'INSERT INTO {POSTGRES_TABLE} (product_id, document) VALUES (%s, '
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'C') || "
+        "setweight(to_tsvector('simple', %s), 'B')) "
+        'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document'
+    ),
+}
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = DIACRITICS.sub('', text).replace(TATWEEL, '')
+    return text.translate(LETTER_MAP).casefold()
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} USING fts5('
+            "name, description, category, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ('
+            'product_id bigint PRIMARY KEY REFERENCES products_product (id) '
+            'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin '
+            f'ON {POSTGRES_TABLE} USING gin (document)'
+        )
+    else:
+        return
+
+    # Index the products that already exist.
+    Product = apps.get_model('products', 'Product')
+    products = (
+        Product.objects.using(schema_editor.connection.alias)
+        .values_list('pk', 'name', 'description', 'category__name')
+    )
+    batch = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, *fields in products.iterator(chunk_size=1000):
+            batch.append((pk, *map(normalize, fields)))
+            if len(batch) == 1000:
+                cursor.executemany(INSERT_SQL[vendor], batch)
+                batch = []
+        if batch:
+            cursor.executemany(INSERT_SQL[vendor], batch)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {POSTGRES_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_review_unique_together_alter_review_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
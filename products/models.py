@@ -1,4 +1,21 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Sum
+
+RATING_VALUES = range(1, 6)
+
+
+def rating_count_field(rating):
+    """Name of the histogram column holding the number of ``rating``-star reviews."""
+    return f'rating_{rating}_count'
+
+
+class CategoryQuerySet(models.QuerySet):
+    def with_product_counts(self):
+        """Annotate each category with its product and in-stock product counts."""
+        return self.annotate(
+            product_count=Count('products'),
+            in_stock_count=Count('products', filter=Q(products__stock__gt=0)),
+        )
 
 
 class Category(models.Model):
@@ -6,6 +23,8 @@ class Category(models.Model):
     name = models.CharField(max_length=200, verbose_name='اسم الفئة')
     description = models.TextField(blank=True, verbose_name='الوصف')
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'فئة'
         verbose_name_plural = 'الفئات'
@@ -15,9 +34,40 @@ class Category(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    def adjust_rating_stats(self, rating, count=1):
+        """Add ``count`` reviews of ``rating`` stars (negative to remove) to the stored aggregates."""
+        field = rating_count_field(rating)
+        return self.update(
+            review_count=F('review_count') + count,
+            rating_sum=F('rating_sum') + rating * count,
+            **{field: F(field) + count},
+        )
+
+    def recalculate_rating_stats(self):
+        """Rebuild the rating aggregates of these products from the review table."""
+        stats = {
+            row.pop('product_id'): row
+            for row in Review.objects.using(self.db).filter(product__in=self).order_by().values('product_id').annotate(
+                review_count=Count('id'),
+                rating_sum=Sum('rating'),
+                **{rating_count_field(r): Count('id', filter=Q(rating=r)) for r in RATING_VALUES},
+            )
+        }
+        fields = ['review_count', 'rating_sum', *(rating_count_field(r) for r in RATING_VALUES)]
+        empty = dict.fromkeys(fields, 0)
+        products = list(self.only('pk', *fields))
+        for product in products:
+            for field, value in stats.get(product.pk, empty).items():
+                setattr(product, field, value)
+        Product.objects.using(self.db).bulk_update(products, fields, batch_size=500)
+        return len(products)
+
+
 class Product(models.Model):
     """Product model for the electronic store catalog."""
     name = models.CharField(max_length=200, verbose_name='اسم المنتج')
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name='رمز المنتج (SKU)')
     description = models.TextField(verbose_name='الوصف')
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='السعر')
     stock = models.IntegerField(default=0, verbose_name='المخزون')
@@ -28,17 +78,64 @@ class Product(models.Model):
         verbose_name='الفئة'
     )
     image = models.ImageField(upload_to='products/', blank=True, null=True, verbose_name='الصورة')
+    # {'source': image name, 'widths': [...]}, maintained by products.images.
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='أحجام الصورة')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')
 
+    # Denormalized review aggregates, maintained by Review.save() and a
+    # post_delete receiver (products.signals).
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='عدد التقييمات')
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='مجموع التقييمات')
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='تقييمات نجمة واحدة')
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='تقييمات نجمتين')
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='تقييمات ثلاث نجوم')
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='تقييمات أربع نجوم')
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='تقييمات خمس نجوم')
+
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'منتج'
         verbose_name_plural = 'المنتجات'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the catalog, with and without a category filter.
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_created_id_idx'),
+            # Incremental feed exports (updated_at > last export).
+            models.Index(fields=['updated_at', 'id'], name='product_updated_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signal handlers tell a move between categories, or a price
+        # change, from other edits.
+        instance._stored_category_id = instance.__dict__.get('category_id')
+        instance._stored_price = instance.__dict__.get('price')
+        return instance
+
+    @property
+    def average_rating(self):
+        """Average star rating rounded to one decimal, or None without reviews."""
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 1)
+
+    @property
+    def rating_histogram(self):
+        """``(stars, count, percent)`` rows from five stars down to one."""
+        rows = []
+        for rating in reversed(RATING_VALUES):
+            count = getattr(self, rating_count_field(rating))
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            rows.append((rating, count, percent))
+        return rows
+
 
 class Review(models.Model):
     """Product review model."""
@@ -65,6 +162,61 @@ class Review(models.Model):
         verbose_name = 'تقييم'
         verbose_name_plural = 'التقييمات'
         ordering = ['-created_at']
+        indexes = [
+            # Paged review feed on the product page.
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.product.name}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what is stored so save() can move the review between
+        # products or histogram buckets.
+        instance._stored_stats = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        stored_product_id, stored_rating = getattr(self, '_stored_stats', (None, None))
+        using = kwargs.get('using') or self._state.db or 'default'
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            products = Product.objects.using(self._state.db)
+            if adding:
+                products.filter(pk=self.product_id).adjust_rating_stats(self.rating)
+            elif stored_rating is not None and (stored_product_id, stored_rating) != (self.product_id, self.rating):
+                products.filter(pk=stored_product_id).adjust_rating_stats(stored_rating, -1)
+                products.filter(pk=self.product_id).adjust_rating_stats(self.rating)
+        self._stored_stats = (self.product_id, self.rating)
+
+
+class RelatedProduct(models.Model):
+    """Precomputed "customers also bought" neighbour of a product."""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name='المنتج'
+    )
+    recommended = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='المنتج المقترح'
+    )
+    rank = models.PositiveSmallIntegerField(verbose_name='الترتيب')
+    score = models.FloatField(verbose_name='درجة التشابه')
+
+    class Meta:
+        verbose_name = 'منتج مقترح'
+        verbose_name_plural = 'المنتجات المقترحة'
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} → {self.recommended_id} ({self.score:.3f})'
@@ -0,0 +1,231 @@
+"""
+Full-text product search.
+
+Documents are built from ``Product.name``, ``Product.description`` and the
+category name after Arabic normalization, and stored in a backend-specific
+index: an FTS5 virtual table on SQLite, a ``tsvector`` table with a GIN
+index on PostgreSQL. Other databases fall back to a ``LIKE`` scan.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import Product
+
+SQLITE_TABLE = 'products_product_fts'
+POSTGRES_TABLE = 'products_product_search'
+MAX_RESULTS = 500
+
+# Quranic marks, harakat, tanween, sukun, shadda and the superscript alef.
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed]')
+_TATWEEL = '\u0640'
+_LETTER_MAP = str.maketrans({
+    'أ': 'ا',
+    'إ': 'ا',
+    'آ': 'ا',
+    'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و',
+    'ئ': 'ي',
+})
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_arabic(text):
+    """Fold alef/hamza forms, taa marbuta and alef maqsura; drop diacritics and tatweel."""
+    if not text:
+        return ''
+    text = _DIACRITICS.sub('', text).replace(_TATWEEL, '')
+    return text.translate(_LETTER_MAP).casefold()
+
+
+def tokenize(text):
+    """Split normalized text into search terms."""
+    return _TOKEN.findall(normalize_arabic(text))
+
+
+def build_document(product):
+    """Return the normalized ``(name, description, category)`` fields for a product."""
+    return (
+        normalize_arabic(product.name),
+        normalize_arabic(product.description),
+        normalize_arabic(product.category.name),
+    )
+
+
+class SearchBackend:
+    """LIKE-based fallback used when the database has no full-text support."""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def index(self, products):
+        """Add or refresh the index entries for ``products``."""
+
+    def remove(self, product_ids):
+        """Drop the index entries for ``product_ids``."""
+
+    def clear(self):
+        """Empty the whole index."""
+
+    def within_sql(self, within, column):
+        """``(sql, params)`` restricting ``column`` to the products of the ``within`` queryset."""
+        if within is None:
+            return '', []
+        sql, params = within.order_by().values('pk').query.get_compiler(using=self.using).as_sql()
+        return f' AND {column} IN ({sql})', list(params)
+
+    def search(self, query, limit=MAX_RESULTS, within=None):
+        """
+        Return product ids matching ``query``, best match first; only those
+        of the ``within`` queryset when given.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            condition &= (
+                Q(name__icontains=term)
+                | Q(description__icontains=term)
+                | Q(category__name__icontains=term)
+            )
+        queryset = (within if within is not None else Product.objects.using(self.using)).filter(condition)
+        return list(queryset.values_list('pk', flat=True)[:limit])
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 index ranked with bm25, name weighted above category and description."""
+
+    def index(self, products):
+        rows = [(product.pk, *build_document(product)) for product in products]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {SQLITE_TABLE} (rowid, name, description, category) '
+                'VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s',
+                [(pk,) for pk in product_ids],
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+
+    def search(self, query, limit=MAX_RESULTS, within=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Quote each term so user input cannot inject FTS5 syntax, and
+        # match prefixes so partial words still find products.
+        match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        within_sql, within_params = self.within_sql(within, 'rowid')
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s{within_sql} '
+                f'ORDER BY bm25({SQLITE_TABLE}, 10.0, 1.0, 4.0) LIMIT %s',
+                [match, *within_params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """``tsvector`` index (GIN) ranked with ``ts_rank``."""
+
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'C') || "
+        "setweight(to_tsvector('simple', %s), 'B')"
+    )
+
+    def index(self, products):
+        rows = [(product.pk, *build_document(product)) for product in products]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (product_id, document) '
+                f'VALUES (%s, {self.DOCUMENT_SQL}) '
+                'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                rows,
+            )
+
+    def remove(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {POSTGRES_TABLE} WHERE product_id = ANY(%s)',
+                [list(product_ids)],
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {POSTGRES_TABLE}')
+
+    def search(self, query, limit=MAX_RESULTS, within=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Terms are word characters only, so they are safe to quote as lexemes.
+        tsquery = ' & '.join(f"'{term}':*" for term in terms)
+        within_sql, within_params = self.within_sql(within, 'product_id')
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT product_id FROM {POSTGRES_TABLE}, to_tsquery(%s, %s) query '
+                f'WHERE document @@ query{within_sql} '
+                'ORDER BY ts_rank(document, query) DESC, product_id DESC LIMIT %s',
+                ['simple', tsquery, *within_params, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    """Return the search backend matching the database vendor."""
+    return BACKENDS.get(connections[using].vendor, SearchBackend)(using)
+
+
+def search_products(query, queryset=None, limit=MAX_RESULTS):
+    """
+    Return ``queryset`` (all products by default) restricted to the products
+    matching ``query``, ordered by relevance. A filtered ``queryset`` is
+    applied inside the index query, so ``limit`` counts only its matches.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    within = queryset if queryset.query.where else None
+    ids = get_backend(queryset.db).search(query, limit=limit, within=within)
+    if not ids:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+def index_products(products, using='default'):
+    """Add or refresh products in the search index."""
+    get_backend(using).index(products)
+
+
+def remove_products(product_ids, using='default'):
+    """Remove products from the search index."""
+    get_backend(using).remove(product_ids)
@@ -0,0 +1,108 @@
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from core.page_cache import CATEGORIES_TAG, invalidate_page_tags, invalidate_product_pages
+from .images import schedule_variants
+from .models import Category, Product, Review
+from .search import index_products, remove_products
+from .summary import invalidate_category_summary
+
+# Sent with ``product_ids`` and ``using`` when prices may have changed
+# without a ``Product.save()`` (bulk imports).
+prices_changed = Signal()
+
+# Products whose reviews were deleted in this thread's current transaction,
+# by database alias.
+_deleted_reviews = threading.local()
+
+
+def _products_losing_reviews(using):
+    if not hasattr(_deleted_reviews, 'products'):
+        _deleted_reviews.products = defaultdict(set)
+    return _deleted_reviews.products[using]
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def category_summary_changed(sender, **kwargs):
+    """Any product or category write can change the per-category counts."""
+    invalidate_category_summary()
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, using, **kwargs):
+    """Keep the search index in step with the product."""
+    index_products([instance], using=using)
+
+
+@receiver(post_save, sender=Product)
+def refresh_image_variants(sender, instance, using, **kwargs):
+    """Resize a new or replaced photo once the save has committed."""
+    if (instance.image.name or '') != (instance.image_variants or {}).get('source', ''):
+        schedule_variants(instance.pk, using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, using, **kwargs):
+    remove_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, using, **kwargs):
+    """The category name is part of every product document in it."""
+    if not created:
+        index_products(instance.products.using(using).select_related('category'), using=using)
+
+
+@receiver(post_save, sender=Product)
+def product_pages_changed(sender, instance, created, **kwargs):
+    """
+    An edit only stales the pages showing the product; a new product or a
+    move between categories changes the category counts on every page.
+    """
+    if created or getattr(instance, '_stored_category_id', instance.category_id) != instance.category_id:
+        invalidate_page_tags(CATEGORIES_TAG)
+    else:
+        invalidate_product_pages([instance.pk])
+    instance._stored_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def catalog_pages_changed(sender, **kwargs):
+    invalidate_page_tags(CATEGORIES_TAG)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, using, **kwargs):
+    """
+    Take the review out of its product's rating aggregates. A receiver
+    rather than ``Review.delete()`` so cascades (a deleted user, the admin's
+    bulk delete) are counted too. A deletion sends one signal per review;
+    the products are collected and recalculated once, when it commits.
+    """
+    product_id, _ = getattr(instance, '_stored_stats', (instance.product_id, None))
+    _products_losing_reviews(using).add(product_id)
+    # Registered every time: after a rollback the set may still hold ids
+    # whose callback was dropped; recalculating them again is harmless.
+    transaction.on_commit(partial(recalculate_deleted_review_stats, using), using=using)
+
+
+def recalculate_deleted_review_stats(using):
+    products = _products_losing_reviews(using)
+    if products:
+        product_ids = list(products)
+        products.clear()
+        Product.objects.using(using).filter(pk__in=product_ids).recalculate_rating_stats()
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_pages_changed(sender, instance, **kwargs):
+    """Reviews and rating stats are shown on the product page and cards."""
+    stored_product_id, _ = getattr(instance, '_stored_stats', (None, None))
+    invalidate_product_pages({instance.product_id, stored_product_id} - {None})
@@ -0,0 +1,63 @@
+import uuid
+
+from django.core.cache import cache
+
+from core.routers import reading_from_primary
+
+from .models import Category
+
+CATEGORY_SUMMARY_CACHE_KEY = 'products:category-summary'
+CATEGORY_SUMMARY_CACHE_TIMEOUT = 60 * 60
+CATEGORY_SUMMARY_VERSION_KEY = 'products:category-summary-version'
+
+
+def get_category_summary():
+    """
+    All categories annotated with ``product_count`` and ``in_stock_count``.
+
+    Built with a single aggregate query and cached until a product or
+    category changes (see ``products.signals``). The query reads from the
+    primary, so a lagging replica's counts are not cached for an hour.
+    """
+    categories = cache.get(CATEGORY_SUMMARY_CACHE_KEY)
+    if categories is None:
+        with reading_from_primary():
+            categories = list(Category.objects.with_product_counts())
+        cache.set(CATEGORY_SUMMARY_CACHE_KEY, categories, CATEGORY_SUMMARY_CACHE_TIMEOUT)
+    return categories
+
+
+async def aget_category_summary():
+    """Async ``get_category_summary``."""
+    categories = await cache.aget(CATEGORY_SUMMARY_CACHE_KEY)
+    if categories is None:
+        with reading_from_primary():
+            categories = [category async for category in Category.objects.with_product_counts()]
+        await cache.aset(CATEGORY_SUMMARY_CACHE_KEY, categories, CATEGORY_SUMMARY_CACHE_TIMEOUT)
+    return categories
+
+
+def get_category_summary_version():
+    """
+    Token that changes whenever the category summary is invalidated, so
+    conditional GET validators can cover the sidebar counts.
+    """
+    version = cache.get(CATEGORY_SUMMARY_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(CATEGORY_SUMMARY_VERSION_KEY, version, None)
+    return version
+
+
+async def aget_category_summary_version():
+    """Async ``get_category_summary_version``."""
+    version = await cache.aget(CATEGORY_SUMMARY_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        await cache.aset(CATEGORY_SUMMARY_VERSION_KEY, version, None)
+    return version
+
+
+def invalidate_category_summary():
+    """Forget the cached category summary."""
+    cache.delete_many([CATEGORY_SUMMARY_CACHE_KEY, CATEGORY_SUMMARY_VERSION_KEY])
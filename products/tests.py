@@ -1,3 +1,501 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .models import Category, Product, Review
+from .images import variant_name
+from .search import SearchBackend, get_backend, normalize_arabic, search_products
+from .summary import get_category_summary
+
+
+def make_product(category, name='منتج', price='10.00', stock=10, description='وصف'):
+    return Product.objects.create(
+        name=name, description=description, price=Decimal(price), stock=stock, category=category
+    )
+
+
+class CategorySummaryTests(TestCase):
+    """Tests for the cached, annotated category summary."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_in_one_query(self):
+        phones = Category.objects.create(name='هواتف')
+        laptops = Category.objects.create(name='حواسيب')
+        make_product(phones, stock=0)
+        make_product(phones, stock=3)
+        make_product(laptops)
+
+        with self.assertNumQueries(1):
+            summary = {c.name: (c.product_count, c.in_stock_count) for c in get_category_summary()}
+        self.assertEqual(summary, {'هواتف': (2, 1), 'حواسيب': (1, 1)})
+
+        with self.assertNumQueries(0):
+            get_category_summary()
+
+    def test_product_and_category_writes_invalidate(self):
+        phones = Category.objects.create(name='هواتف')
+        get_category_summary()
+
+        product = make_product(phones)
+        self.assertEqual(get_category_summary()[0].product_count, 1)
+
+        product.delete()
+        self.assertEqual(get_category_summary()[0].product_count, 0)
+
+        phones.delete()
+        self.assertEqual(get_category_summary(), [])
+
+
+class SearchTests(TestCase):
+    """Tests for the full-text product search."""
+
+    def setUp(self):
+        self.phones = Category.objects.create(name='هواتف ذكية')
+        self.accessories = Category.objects.create(name='إكسسوارات')
+
+    def test_normalize_arabic(self):
+        self.assertEqual(normalize_arabic('أَحْمَد'), 'احمد')
+        self.assertEqual(normalize_arabic('إضاءة'), 'اضاءه')
+        self.assertEqual(normalize_arabic('آلة مستشفى'), 'اله مستشفي')
+        self.assertEqual(normalize_arabic('شـــاشة'), 'شاشه')
+        self.assertEqual(normalize_arabic('Laptop'), 'laptop')
+
+    def test_matches_hamza_and_taa_marbuta_variants(self):
+        lamp = make_product(self.accessories, name='إضاءة مكتبية')
+        self.assertEqual(list(search_products('اضاءه')), [lamp])
+        self.assertEqual(list(search_products('أضاءة')), [lamp])
+
+    def test_name_matches_rank_above_description_matches(self):
+        in_description = make_product(self.phones, name='سامسونج', description='شاحن سريع مرفق')
+        in_name = make_product(self.accessories, name='شاحن لاسلكي')
+        self.assertEqual(list(search_products('شاحن')), [in_name, in_description])
+
+    def test_category_name_and_prefix_match(self):
+        phone = make_product(self.phones, name='Galaxy S24')
+        self.assertEqual(list(search_products('هواتف')), [phone])
+        self.assertEqual(list(search_products('gala')), [phone])
+
+    def test_limit_applies_after_the_queryset_filter(self):
+        # Better matches (the term in their names) that the filter excludes.
+        for i in range(5):
+            make_product(self.accessories, name=f'شاحن {i}')
+        phone = make_product(self.phones, name='جوال', description='شاحن مرفق')
+        for backend in (get_backend(), SearchBackend()):
+            with self.subTest(backend=type(backend).__name__):
+                within = Product.objects.filter(category=self.phones)
+                self.assertEqual(backend.search('شاحن', limit=3, within=within), [phone.pk])
+        results = search_products('شاحن', Product.objects.filter(category=self.phones), limit=3)
+        self.assertEqual(list(results), [phone])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = make_product(self.phones, name='آيفون')
+        product.name = 'بكسل'
+        product.save()
+        self.assertFalse(search_products('ايفون').exists())
+        self.assertEqual(list(search_products('بكسل')), [product])
+
+        self.phones.name = 'جوالات'
+        self.phones.save()
+        self.assertEqual(list(search_products('جوالات')), [product])
+
+        product.delete()
+        self.assertFalse(search_products('بكسل').exists())
+
+    def test_rebuild_command(self):
+        product = make_product(self.phones, name='راوتر')
+        get_backend().clear()
+        self.assertFalse(search_products('راوتر').exists())
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(list(search_products('راوتر')), [product])
+
+    def test_product_list_and_suggest_views(self):
+        product = make_product(self.phones, name='سماعة بلوتوث')
+        response = self.client.get(reverse('core:product_list'), {'search': 'سماعه'})
+        self.assertEqual(list(response.context['products']), [product])
+
+        response = self.client.get(reverse('core:search_suggest'), {'q': 'بلوتو'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [product.pk])
+
+
+class RatingStatsTests(TestCase):
+    """Tests for the denormalized rating aggregates on Product."""
+
+    def setUp(self):
+        self.product = make_product(Category.objects.create(name='كاميرات'))
+        self.users = [User.objects.create_user(f'reviewer{i}', password='secret-pass-123') for i in range(3)]
+
+    def stats(self):
+        self.product.refresh_from_db()
+        return (
+            self.product.review_count,
+            self.product.rating_sum,
+            [count for _, count, _ in self.product.rating_histogram],
+        )
+
+    def test_views_update_aggregates(self):
+        for user, rating in zip(self.users, (5, 4, 4)):
+            self.client.force_login(user)
+            self.client.post(reverse('products:add_review', args=[self.product.pk]), {
+                'rating': rating, 'comment': 'ممتاز',
+            })
+        self.assertEqual(self.stats(), (3, 13, [1, 2, 0, 0, 0]))
+        self.assertEqual(self.product.average_rating, 4.3)
+
+        review = Review.objects.get(user=self.users[0])
+        self.client.force_login(self.users[0])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('products:delete_review', args=[review.pk]))
+        self.assertEqual(self.stats(), (2, 8, [0, 2, 0, 0, 0]))
+
+    def test_invalid_rating_is_rejected(self):
+        self.client.force_login(self.users[0])
+        self.client.post(reverse('products:add_review', args=[self.product.pk]), {
+            'rating': 9, 'comment': 'x',
+        })
+        self.assertEqual(self.stats(), (0, 0, [0, 0, 0, 0, 0]))
+
+    def test_rating_change_and_bulk_delete(self):
+        reviews = [
+            Review.objects.create(product=self.product, user=user, rating=3, comment='x')
+            for user in self.users
+        ]
+        review = Review.objects.get(pk=reviews[0].pk)
+        review.rating = 1
+        review.save()
+        self.assertEqual(self.stats(), (3, 7, [0, 0, 2, 0, 1]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(rating=3).delete()
+        self.assertEqual(self.stats(), (1, 1, [0, 0, 0, 0, 1]))
+
+    def test_cascade_deletes_update_aggregates(self):
+        for user, rating in zip(self.users, (5, 4, 2)):
+            Review.objects.create(product=self.product, user=user, rating=rating, comment='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[0].delete()
+        self.assertEqual(self.stats(), (2, 6, [0, 1, 0, 1, 0]))
+
+        other = make_product(self.product.category, name='أخرى')
+        Review.objects.create(product=other, user=self.users[1], rating=3, comment='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk__in=[self.users[1].pk, self.users[2].pk]).delete()
+        self.assertEqual(self.stats(), (0, 0, [0, 0, 0, 0, 0]))
+        other.refresh_from_db()
+        self.assertEqual((other.review_count, other.rating_sum), (0, 0))
+
+    def test_bulk_delete_recalculates_each_product_once(self):
+        def delete_reviews(count):
+            users = [User.objects.create_user(f'bulk{count}-{i}') for i in range(count)]
+            Review.objects.bulk_create(
+                Review(product=self.product, user=user, rating=4, comment='x') for user in users
+            )
+            with CaptureQueriesContext(connection) as queries:
+                with self.captureOnCommitCallbacks(execute=True):
+                    Review.objects.filter(product=self.product).delete()
+            return len(queries)
+
+        self.assertEqual(delete_reviews(2), delete_reviews(20))
+        self.assertEqual(self.stats(), (0, 0, [0, 0, 0, 0, 0]))
+
+    def test_recalculate_command(self):
+        Review.objects.create(product=self.product, user=self.users[0], rating=2, comment='x')
+        Product.objects.filter(pk=self.product.pk).update(review_count=40, rating_sum=0, rating_5_count=7)
+        call_command('recalculate_ratings', stdout=StringIO())
+        self.assertEqual(self.stats(), (1, 2, [0, 0, 0, 1, 0]))
+
+
+class ImageVariantTests(TestCase):
+    """Tests for the resized product photo pipeline."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = Path(media.name)
+        settings_override = override_settings(MEDIA_ROOT=media.name, PRODUCT_IMAGE_VARIANTS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='كاميرات')
+
+    def upload(self, width=700, height=350, name='photo.png'):
+        buffer = BytesIO()
+        Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def make_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product(self.category)
+            product.image = self.upload(**kwargs)
+            product.save()
+        product.refresh_from_db()
+        return product
+
+    def test_save_builds_variants_without_upscaling(self):
+        product = self.make_product(width=700)
+        self.assertEqual(product.image_variants, {'source': product.image.name, 'widths': [160, 320, 640]})
+        for width in (160, 320, 640):
+            for ext in ('webp', 'jpg'):
+                self.assertTrue((self.media_root / variant_name(product.image.name, width, ext)).exists())
+        with Image.open(self.media_root / variant_name(product.image.name, 320, 'jpg')) as image:
+            self.assertEqual(image.size, (320, 160))
+
+    def test_replacing_image_removes_old_variants(self):
+        product = self.make_product()
+        old_variant = self.media_root / variant_name(product.image.name, 160, 'webp')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = self.upload(width=100, name='other.png')
+            product.save()
+        product.refresh_from_db()
+        self.assertFalse(old_variant.exists())
+        self.assertEqual(product.image_variants['widths'], [100])
+
+    def test_template_tag_emits_srcset(self):
+        product = self.make_product()
+        html = Template(
+            '{% load core_tags %}{% product_image product sizes="50vw" %}'
+        ).render(Context({'product': product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-320w.webp 320w', html)
+        self.assertIn('sizes="50vw"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_backfill_command(self):
+        product = self.make_product()
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        out = StringIO()
+        call_command('build_image_variants', stdout=out)
+        product.refresh_from_db()
+        self.assertIn('1 product', out.getvalue())
+        self.assertEqual(product.image_variants['widths'], [160, 320, 640])
+
+
+class ProductFeedTests(TestCase):
+    """Tests for the streaming catalog feed."""
+
+    def setUp(self):
+        self.staff = User.objects.create_user('feeder', password='secret-pass-123', is_staff=True)
+        category = Category.objects.create(name='شاشات & ملحقات')
+        self.old = make_product(category, name='قديم <1>', stock=0)
+        self.new = make_product(category, name='جديد', price='99.50')
+        Product.objects.filter(pk=self.old.pk).update(updated_at=timezone.now() - timedelta(days=10))
+
+    def fetch(self, feed_format, **params):
+        response = self.client.get(reverse('products:product_feed', args=[feed_format]), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_lists_every_product_with_absolute_urls(self):
+        self.client.force_login(self.staff)
+        rows = list(csv.DictReader(self.fetch('csv').splitlines()))
+        self.assertEqual([row['name'] for row in rows], ['قديم <1>', 'جديد'])
+        self.assertEqual(rows[0]['availability'], 'out of stock')
+        self.assertEqual(rows[1]['price'], '99.50')
+        self.assertEqual(rows[1]['url'], f'http://testserver/products/{self.new.pk}/')
+
+    def test_incremental_jsonl_and_xml(self):
+        self.client.force_login(self.staff)
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        lines = self.fetch('jsonl', since=since).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.new.pk])
+
+        xml = self.fetch('xml')
+        self.assertIn('<name>قديم &lt;1&gt;</name>', xml)
+        self.assertIn('<category>شاشات &amp; ملحقات</category>', xml)
+
+    def test_incremental_feed_keeps_rows_tied_on_the_cutoff(self):
+        self.client.force_login(self.staff)
+        tied = make_product(Category.objects.get(), name='مرافق')
+        Product.objects.filter(pk=tied.pk).update(updated_at=Product.objects.get(pk=self.new.pk).updated_at)
+        first, second = sorted([self.new.pk, tied.pk])
+        # A previous run stopped at `first`; `second` shares its timestamp.
+        cutoff = Product.objects.get(pk=first).updated_at.isoformat()
+        ids = [json.loads(line)['id'] for line in self.fetch('jsonl', since=cutoff).splitlines()]
+        self.assertEqual(ids, [first, second])
+        ids = [json.loads(line)['id'] for line in self.fetch('jsonl', since=cutoff, after=first).splitlines()]
+        self.assertEqual(ids, [second])
+        self.assertEqual(self.fetch('jsonl', since=cutoff, after=second), '')
+
+    def test_access_control(self):
+        url = reverse('products:product_feed', args=['csv'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(PRODUCT_FEED_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(url, {'token': 'wrong'}).status_code, 403)
+            self.assertEqual(self.client.get(url, {'token': 's3cret'}).status_code, 200)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'after': '3'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('products:product_feed', args=['pdf'])).status_code, 404)
+
+    async def test_asgi_streams_asynchronously(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('products:product_feed', args=['jsonl']))
+        self.assertTrue(response.is_async)
+        lines = [chunk async for chunk in response.streaming_content if chunk]
+        self.assertEqual(len(lines), 2)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_feed', '--format', 'jsonl', '--base-url', 'https://shop.example/', stdout=out)
+        items = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(items), 2)
+        self.assertEqual(items[1]['url'], f'https://shop.example/products/{self.new.pk}/')
+
+
+class ImportProductsTests(TestCase):
+    """Tests for the batched import_products command."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        settings_override = override_settings(MEDIA_ROOT=str(self.tmp / 'media'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='هواتف')
+
+    def write_csv(self, rows, name='products.csv'):
+        path = self.tmp / name
+        with path.open('w', encoding='utf-8', newline='') as handle:
+            writer = csv.DictWriter(handle, ['sku', 'name', 'description', 'price', 'stock', 'category', 'image'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def run_import(self, path, *args):
+        out = StringIO()
+        call_command('import_products', str(path), *args, stdout=out)
+        return out.getvalue()
+
+    def test_upserts_on_sku_and_creates_categories(self):
+        existing = make_product(self.category, name='قديم')
+        Product.objects.filter(pk=existing.pk).update(sku='P-1')
+        path = self.write_csv([
+            {'sku': 'P-1', 'name': 'محدث', 'description': 'وصف', 'price': '120.00', 'stock': '3', 'category': 'هواتف'},
+            {'sku': 'P-2', 'name': 'جديد', 'description': 'وصف', 'price': '80', 'stock': '0', 'category': 'سماعات'},
+        ])
+        out = self.run_import(path, '--batch-size', '1')
+
+        self.assertIn('Imported 2 products', out)
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.price, existing.stock), ('محدث', Decimal('120.00'), 3))
+        new = Product.objects.get(sku='P-2')
+        self.assertEqual(new.category.name, 'سماعات')
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual([p.pk for p in search_products('محدث')], [existing.pk])
+
+    def test_invalid_rows_are_rejected_with_line_numbers(self):
+        path = self.write_csv([
+            {'sku': 'A', 'name': 'صالح', 'description': 'وصف', 'price': '10', 'stock': '1', 'category': 'هواتف'},
+            {'sku': 'B', 'name': 'سعر خاطئ', 'description': 'وصف', 'price': 'abc', 'stock': '1', 'category': 'هواتف'},
+            {'sku': '', 'name': 'بلا رمز', 'description': 'وصف', 'price': '10', 'stock': '1', 'category': ''},
+            {'sku': 'A', 'name': 'صالح مكرر', 'description': 'وصف', 'price': '11', 'stock': '1', 'category': 'هواتف'},
+        ])
+        rejects = self.tmp / 'rejects.csv'
+        out = self.run_import(path, '--rejects', str(rejects))
+
+        self.assertIn('Imported 1 products', out)
+        self.assertIn('3 rejected', out)
+        self.assertEqual(Product.objects.get(sku='A').name, 'صالح مكرر')
+        with rejects.open(encoding='utf-8') as handle:
+            rows = list(csv.DictReader(handle))
+        self.assertEqual(sorted(int(row['line']) for row in rows), [2, 3, 4])
+        by_line = {int(row['line']): row['errors'] for row in rows}
+        self.assertIn('price:', by_line[3])
+        self.assertIn('sku:', by_line[4])
+        self.assertIn('category:', by_line[4])
+
+    def test_database_errors_reject_rows_and_roll_back_new_categories(self):
+        row = {'description': 'وصف', 'price': '10', 'stock': '1', 'category': 'جديدة'}
+        path = self.write_csv([
+            {**row, 'sku': 'X-1', 'name': 'أول'},
+            {**row, 'sku': 'BAD', 'name': 'مرفوض'},
+            {**row, 'sku': 'X-2', 'name': 'ثان'},
+        ])
+
+        def index_products(products):
+            if any(product.sku == 'BAD' for product in products):
+                raise IntegrityError('constraint failed')
+
+        with mock.patch('products.importer.index_products', index_products):
+            out = self.run_import(path, '--batch-size', '2')
+
+        self.assertIn('Imported 2 products', out)
+        self.assertIn('(1 new categories, 1 rejected rows)', out)
+        category = Category.objects.get(name='جديدة')
+        self.assertEqual(
+            sorted(Product.objects.filter(category=category).values_list('sku', flat=True)), ['X-1', 'X-2'],
+        )
+
+    def test_jsonl_with_images(self):
+        images = self.tmp / 'images'
+        images.mkdir()
+        Image.new('RGB', (20, 20)).save(images / 'phone.png')
+        path = self.tmp / 'products.jsonl'
+        path.write_text(
+            json.dumps({'sku': 'J-1', 'name': 'هاتف', 'description': 'وصف', 'price': 99.5,
+                        'stock': 2, 'category': 'هواتف', 'image': 'phone.png'}, ensure_ascii=False) + '\n'
+            + '{not json\n'
+            + json.dumps({'sku': 'J-2', 'name': 'بلا صورة', 'description': 'وصف', 'price': 5,
+                          'stock': 1, 'category': 'هواتف', 'image': '../secret.png'}, ensure_ascii=False) + '\n',
+            encoding='utf-8',
+        )
+        out = self.run_import(path, '--images-dir', str(images))
+
+        self.assertIn('2 rejected', out)
+        product = Product.objects.get(sku='J-1')
+        self.assertEqual(product.price, Decimal('99.50'))
+        self.assertEqual(product.image.name, 'products/import/phone.png')
+        self.assertTrue((self.tmp / 'media' / product.image.name).exists())
+
+
+class AdminQueryCountTests(TestCase):
+    """Catalog changelists run a fixed number of queries whatever the row count."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('boss', 'b@example.com', 'secret-pass-123')
+        self.client.force_login(self.admin)
+        self.add_rows()
+
+    def add_rows(self):
+        for _ in range(3):
+            category = Category.objects.create(name=f'فئة {Category.objects.count()}')
+            product = make_product(category)
+            Review.objects.create(product=product, user=self.admin, rating=4, comment='جيد')
+
+    def count_queries(self, url):
+        self.client.get(url)  # Warm per-process caches such as content types.
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists(self):
+        for model in ('category', 'product', 'review'):
+            with self.subTest(model=model):
+                url = reverse(f'admin:products_{model}_changelist')
+                before = self.count_queries(url)
+                self.add_rows()
+                self.assertEqual(self.count_queries(url), before)
+
+    def test_category_product_count_is_annotated(self):
+        make_product(Category.objects.first())
+        response = self.client.get(reverse('admin:products_category_changelist'), {'o': '-3'})
+        self.assertEqual([c.product_count for c in response.context['cl'].result_list], [2, 1, 1])
@@ -9,4 +9,5 @@ urlpatterns = [
     path('add/', views.add_product, name='add_product'),
     path('edit/<int:pk>/', views.edit_product, name='edit_product'),
     path('delete/<int:pk>/', views.delete_product, name='delete_product'),
+    path('feed/products.<str:feed_format>', views.product_feed, name='product_feed'),
 ]
@@ -1,8 +1,14 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
-from django.views.decorators.http import require_POST
-from .models import Product, Review
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET, require_POST
+from .feeds import CONTENT_TYPES, FEED_WRITERS, astream_feed, parse_since, stream_feed
+from .models import RATING_VALUES, Product, Review
 from .forms import ProductForm
 
 
@@ -20,6 +26,9 @@ def add_review(request, product_id):
     rating = request.POST.get('rating')
     comment = request.POST.get('comment')
     
+    if rating not in {str(value) for value in RATING_VALUES}:
+        rating = None
+    
     if rating and comment:
         Review.objects.create(
             product=product,
@@ -41,7 +50,7 @@ def delete_review(request, review_id):
     
     # Allow author OR user with delete_review permission
     if request.user == review.user or request.user.has_perm('products.delete_review'):
-        product_id = review.product.id
+        product_id = review.product_id
         review.delete()
         messages.success(request, 'تم حذف التقييم بنجاح.')
         return redirect('core:product_detail', pk=product_id)
@@ -120,3 +129,43 @@ def delete_product(request, pk):
         return redirect('core:product_list')
     
     return render(request, 'products/confirm_delete.html', {'product': product})
+
+
+@require_GET
+def product_feed(request, feed_format):
+    """
+    Stream the catalog as a CSV, JSON Lines or XML feed; ``?since=`` limits
+    it to products updated at or after that date, and ``?after=<id>`` with
+    it resumes after the last row of a previous run. Open with ``?token=`` when
+    ``PRODUCT_FEED_TOKEN`` is set, otherwise to staff only.
+    """
+    if feed_format not in FEED_WRITERS:
+        raise Http404
+    token = getattr(settings, 'PRODUCT_FEED_TOKEN', '')
+    if token:
+        if not constant_time_compare(request.GET.get('token', ''), token):
+            raise PermissionDenied
+    elif not request.user.is_staff:
+        raise PermissionDenied
+
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = parse_since(since)
+        except ValueError:
+            return HttpResponseBadRequest('تاريخ since غير صالح.')
+    after_id = request.GET.get('after')
+    if after_id:
+        if not since or not after_id.isdigit():
+            return HttpResponseBadRequest('after يجب أن يكون رقم منتج ويُستخدم مع since.')
+        after_id = int(after_id)
+
+    base_url = f'{request.scheme}://{request.get_host()}'
+    # Under ASGI a sync iterator would be read into memory in one go.
+    stream = astream_feed if isinstance(request, ASGIRequest) else stream_feed
+    response = StreamingHttpResponse(
+        stream(feed_format, base_url, since=since or None, after_id=after_id or None),
+        content_type=CONTENT_TYPES[feed_format],
+    )
+    response['Content-Disposition'] = f'inline; filename="products.{feed_format}"'
+    return response
@@ -0,0 +1,14 @@
+#!/usr/bin/env bash
+# exit on error
+set -o errexit
+
+# SERVER_MODE=wsgi (default): sync gunicorn workers serving the sync views.
+# SERVER_MODE=asgi: gunicorn managing uvicorn workers, with the async catalog
+# and cart views (settings.ASYNC_VIEWS) on an event loop. Only switch after
+# `manage.py benchmark_server` shows asgi beating the wsgi baseline on the
+# production database. Both read the worker count from WEB_CONCURRENCY.
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    exec gunicorn electronic_store.asgi:application -k uvicorn_worker.UvicornWorker
+else
+    exec gunicorn electronic_store.wsgi:application
+fi
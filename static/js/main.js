@@ -17,6 +17,7 @@
         initAnimations();
         initQuantityControls();
         initSearchBar();
+        initLoadMoreReviews();
         initAlertDismiss();
     });
 
@@ -257,11 +258,21 @@
         let debounceTimer;
 
         if (searchInput) {
+            const form = searchInput.closest('form');
+            const suggestUrl = form ? form.dataset.suggestUrl : null;
+            let resultsBox = null;
+
+            if (suggestUrl) {
+                resultsBox = document.createElement('div');
+                resultsBox.className = 'list-group position-absolute w-100 shadow search-results d-none';
+                resultsBox.style.zIndex = '1050';
+                form.appendChild(resultsBox);
+            }
+
             searchInput.addEventListener('input', function () {
                 clearTimeout(debounceTimer);
                 debounceTimer = setTimeout(function () {
-                    // Could implement live search here
-                    console.log('Search:', searchInput.value);
+                    fetchSuggestions(suggestUrl, searchInput.value.trim(), resultsBox);
                 }, 300);
             });
 
@@ -270,11 +281,96 @@
                 if (e.key === 'Escape') {
                     searchInput.value = '';
                     searchInput.blur();
+                    hideSuggestions(resultsBox);
+                }
+            });
+
+            document.addEventListener('click', function (e) {
+                if (form && !form.contains(e.target)) {
+                    hideSuggestions(resultsBox);
                 }
             });
         }
     }
 
+    function fetchSuggestions(url, query, resultsBox) {
+        if (!url || !resultsBox) {
+            return;
+        }
+        if (query.length < 2) {
+            hideSuggestions(resultsBox);
+            return;
+        }
+
+        fetch(url + '?q=' + encodeURIComponent(query), {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        })
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                resultsBox.innerHTML = '';
+                if (!data.results.length) {
+                    hideSuggestions(resultsBox);
+                    return;
+                }
+                data.results.forEach(function (item) {
+                    const link = document.createElement('a');
+                    link.href = item.url;
+                    link.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+
+                    const name = document.createElement('span');
+                    name.textContent = item.name;
+                    const price = document.createElement('small');
+                    price.className = 'text-muted';
+                    price.textContent = item.price + ' ر.س';
+
+                    link.appendChild(name);
+                    link.appendChild(price);
+                    resultsBox.appendChild(link);
+                });
+                resultsBox.classList.remove('d-none');
+            })
+            .catch(function () {
+                hideSuggestions(resultsBox);
+            });
+    }
+
+    function hideSuggestions(resultsBox) {
+        if (resultsBox) {
+            resultsBox.classList.add('d-none');
+        }
+    }
+
+    function initLoadMoreReviews() {
+        document.querySelectorAll('.load-more-reviews').forEach(function (button) {
+            const target = document.querySelector(button.dataset.target);
+
+            button.addEventListener('click', function () {
+                if (!target || !button.dataset.cursor) {
+                    return;
+                }
+                button.disabled = true;
+
+                fetch(button.dataset.url + '?cursor=' + encodeURIComponent(button.dataset.cursor), {
+                    headers: { 'X-Requested-With': 'XMLHttpRequest' }
+                })
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) {
+                        target.insertAdjacentHTML('beforeend', data.html);
+                        if (data.next_cursor) {
+                            button.dataset.cursor = data.next_cursor;
+                            button.disabled = false;
+                        } else {
+                            button.remove();
+                        }
+                    })
+                    .catch(function () {
+                        button.disabled = false;
+                        showNotification('تعذر تحميل المزيد من التقييمات', 'error');
+                    });
+            });
+        });
+    }
+
     // ========================================
     // 8. ALERT DISMISS
     // ========================================
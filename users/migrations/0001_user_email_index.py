@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX "user_email_idx" ON "auth_user" ("email")',
+            reverse_sql='DROP INDEX "user_email_idx"',
+        ),
+    ]